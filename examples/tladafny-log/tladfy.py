@@ -1,179 +1,453 @@
 # Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
 # SPDX-License-Identifier: BSD-2-Clause
 
-import sys, re
-from parsy import seq, string, regex, generate
-
-whitespace = regex(r'\s*').mark().tag('whitespace')
-identifier = regex(r'[A-Za-z_]\w*').mark().tag('identifier')
-block_open = string('{').mark().tag('syntax')
-block_close = string('}').mark().tag('syntax')
-
-@generate
-def block():
-    return (yield seq(block_open, block_contents, block_close).mark().tag('block'))
-
-comment_line = regex(r'^\s*//[^\n]*', re.MULTILINE).mark().tag('comment')
-comment_multiline = regex(r'\s*/\*((?!\*/)(.|\n))*\*/\s*').mark().tag('comment')
-dafny_code = regex(r'((?!/\*)[^{}\n])+').mark().tag('dafny_code')
-params = regex(r'[^)\n]*').mark().tag('params')
-state_machine_line = seq(whitespace, string('state').mark().tag('keyword'), whitespace, string('machine').mark().tag('keyword'), whitespace, \
-        string('k').mark().tag('keyword'), whitespace, string('(').mark().tag('syntax'), params, string(')').mark().tag('syntax'), whitespace, \
-        string('s').mark().tag('keyword'), whitespace, string('(').mark().tag('syntax'), params, string(')').mark().tag('syntax'), whitespace, \
-        string('step').mark().tag('keyword'), whitespace, string('(').mark().tag('syntax'), params, string(')').mark().tag('syntax'), whitespace).mark().tag('tla.statemachine')
-init_line = seq(whitespace, string('init').mark().tag('keyword'), whitespace).mark().tag('tla.init')
-step_line = seq(whitespace, string('step').mark().tag('keyword'), whitespace, identifier, whitespace, \
-        string('(').mark().tag('syntax'), params, string(')').mark().tag('syntax'), whitespace).mark().tag('tla.step')
-block_line = comment_line | state_machine_line | init_line | step_line | dafny_code | string('\n').mark().tag('whitespace')
-block_contents = (block | block_line.at_least(1) | comment_multiline).at_least(1).mark().tag('blockcontents')
-
-before_module = regex(r'((?!module)(.|\n))*').mark().tag('beforemodule')
-module = seq(whitespace, regex('module').mark().tag('keyword'), whitespace, identifier, whitespace, block).mark().tag('module')
-
-file_ = seq(before_module, module.many(), whitespace)
-
-type_name = regex(r'[A-Za-z_](\w|\.)*').mark().tag('identifier')
-
-@generate
-def type_params():
-    return (yield seq(string('<'), type_name, seq(whitespace, string(','), whitespace, type_name, whitespace, type_params.optional(), whitespace).many(), string('>')))
-
-formal_arg = seq(identifier, whitespace, string(':').mark().tag('colon'), whitespace, type_name, whitespace, seq(type_params, whitespace).optional())
-formal_args = seq(formal_arg.optional(), whitespace, seq(string(',').mark().tag('comma') >> whitespace >> formal_arg).many())
-
-# test
-contents = sys.stdin.read()
-
-parse_tree = file_.parse(contents)
-
-def emit(text, contents):
-    for element in contents:
-        if isinstance(element, list):
-            text = emit(text, element)
-        else:
-            (name, marked) = element
-            (start, inner, end) = marked
-            if isinstance(inner, list):
-                text = emit(text, inner)
-            else:
-                text += inner
-    return text
-
-
-
-def walk(contents, machine_step_params):
-    has_state_machine = False
-    state_machine_indent = None
-    collected_steps = []
-    for element in contents:
-        if isinstance(element, list):
-            (element_has_state_machine, element_state_machine_indent, element_collected_steps, element_step_params) = walk(element, machine_step_params)
-            has_state_machine |= element_has_state_machine
-            if state_machine_indent is None:
-                state_machine_indent = element_state_machine_indent
+# Expands the state machine DSL into plain Dafny:
+#
+#   state machine k(<constants>) s(<variables>) step(<step params>)
+#   init { ... }
+#   step Name(<params>) { ... }
+#
+# become the Constants/Variables datatypes and Init/Name predicates, and
+# each module body with a state machine gains the Step datatype, NextStep
+# and Next.
+#
+#   python3 tladfy.py < src/X.dfy > dfy/X.dfy
+#   python3 tladfy.py --out-dir dfy src/*.dfy
+#
+# The front end is a single forward scan over the text (no backtracking
+# regexes), and outputs are cached by the hash of this script and the
+# input, so rerunning over an unchanged tree costs one hash per file.
+
+import os
+import re
+import sys
+import hashlib
+import argparse
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "tladfy-cache")
+
+class ParseError(Exception):
+    def __init__(self, text, pos, expected):
+        line = text.count("\n", 0, pos) + 1
+        super().__init__("line %d: expected %s" % (line, expected))
+
+WHITESPACE = re.compile(r'\s*')
+IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+TYPE_NAME = re.compile(r'[A-Za-z_](\w|\.)*')
+COMMENT_LINE = re.compile(r'[^\n]*')
+DAFNY_CODE = re.compile(r'(?:[^{}\n/]|/(?!\*))+')
+PARAMS = re.compile(r'[^)\n]*')
+
+class StateMachine:
+    def __init__(self, indent, k_space, k_params, s_space, s_params, step_params, trailing):
+        self.indent = indent
+        self.k_space = k_space
+        self.k_params = k_params
+        self.s_space = s_space
+        self.s_params = s_params
+        self.step_params = step_params
+        self.trailing = trailing
+
+    def text(self):
+        return (self.indent + 'datatype Constants = Constants' + self.k_space + '(' + self.k_params + ')'
+                + self.indent + 'datatype Variables = Variables' + self.s_space + '(' + self.s_params + ')'
+                + self.trailing)
+
+class Init:
+    def __init__(self, leading, trailing):
+        self.leading = leading
+        self.trailing = trailing
+
+    def text(self):
+        return self.leading + 'predicate Init(k: Constants, s: Variables)' + self.trailing
+
+class Step:
+    def __init__(self, leading, name_space, name, params_space, params, trailing):
+        self.leading = leading
+        self.name_space = name_space
+        self.name = name
+        self.params_space = params_space
+        self.params = params
+        self.trailing = trailing
+        self.machine_step_params = ''   # filled in by expand()
+
+    def text(self):
+        msp = self.machine_step_params
+        params = ("k: Constants, s: Variables, s': Variables"
+                + (', ' if msp.strip() != '' else '') + msp
+                + (', ' if self.params.strip() != '' else '') + self.params)
+        return (self.leading + 'predicate' + self.name_space + self.name + self.params_space
+                + '(' + params + ')' + self.trailing)
+
+class Block:
+    """{ ... }: items are nested Blocks, /* comments */, and lists of
+    consecutive lines (text, StateMachine, Init, Step)."""
+    def __init__(self, items):
+        self.items = items
+
+class Scanner:
+    """Recursive descent over the source, one forward pass. Alternatives
+    are tried in a fixed order and never re-scan more than the whitespace
+    in front of a keyword."""
+    def __init__(self, text):
+        self.text = text
+        self.ws_run = (0, WHITESPACE.match(text, 0).end())
+
+    def ws(self, pos):
+        """End of the whitespace run starting at pos. A run is measured once
+        however many of its positions are asked about."""
+        start, end = self.ws_run
+        if not (start <= pos <= end):
+            end = WHITESPACE.match(self.text, pos).end()
+            self.ws_run = (pos, end)
+        return end
+
+    def literal(self, pos, s):
+        return pos + len(s) if self.text.startswith(s, pos) else None
+
+    def regex(self, pos, rx):
+        mo = rx.match(self.text, pos)
+        return mo.end() if mo else None
+
+    def file(self):
+        text = self.text
+        pos = text.find("module")
+        if pos < 0:
+            pos = len(text)
+        items = [text[:pos]]
+        while True:
+            result = self.module(pos)
+            if result is None:
+                break
+            module_items, pos = result
+            items.extend(module_items)
+        end = self.ws(pos)
+        items.append(text[pos:end])
+        if end != len(text):
+            raise ParseError(text, end, "module or end of file")
+        return items
+
+    def module(self, pos):
+        text = self.text
+        p0 = self.ws(pos)
+        p1 = self.literal(p0, "module")
+        if p1 is None:
+            return None
+        p2 = self.ws(p1)
+        p3 = self.regex(p2, IDENTIFIER)
+        if p3 is None:
+            return None
+        p4 = self.ws(p3)
+        result = self.block(p4)
+        if result is None:
+            return None
+        block, end = result
+        return [text[pos:p4], block], end
+
+    def block(self, pos):
+        if self.literal(pos, "{") is None:
+            return None
+        items = []
+        p = pos + 1
+        while True:
+            result = self.block(p)
+            if result is not None:
+                items.append(result[0])
+                p = result[1]
+                continue
+            result = self.block_line(p)
+            if result is not None:
+                # a run of lines is a group; see expand()
+                lines = []
+                while result is not None:
+                    lines.append(result[0])
+                    p = result[1]
+                    result = self.block_line(p)
+                items.append(lines)
+                continue
+            end = self.comment_multiline(p)
+            if end is not None:
+                items.append(self.text[p:end])
+                p = end
+                continue
+            break
+        if not items:
+            return None
+        if self.literal(p, "}") is None:
+            return None
+        return Block(items), p + 1
+
+    def comment_multiline(self, pos):
+        p = self.literal(self.ws(pos), "/*")
+        if p is None:
+            return None
+        close = self.text.find("*/", p)
+        if close < 0:
+            return None
+        return self.ws(close + 2)
+
+    def block_line(self, pos):
+        text = self.text
+        for alternative in (self.comment_line, self.state_machine_line, self.init_line, self.step_line):
+            result = alternative(pos)
+            if result is not None:
+                return result
+        end = self.regex(pos, DAFNY_CODE)
+        if end is not None:
+            return text[pos:end], end
+        if self.literal(pos, "\n") is not None:
+            return "\n", pos + 1
+        return None
+
+    def comment_line(self, pos):
+        if pos > 0 and self.text[pos-1] != "\n":
+            return None
+        p = self.literal(self.ws(pos), "//")
+        if p is None:
+            return None
+        end = self.regex(p, COMMENT_LINE)
+        return self.text[pos:end], end
+
+    def parenthesized(self, pos):
+        """(params) at pos: returns (params, end) or None."""
+        p = self.literal(pos, "(")
+        if p is None:
+            return None
+        end = self.regex(p, PARAMS)
+        if self.literal(end, ")") is None:
+            return None
+        return self.text[p:end], end + 1
+
+    def state_machine_line(self, pos):
+        text = self.text
+        p = self.ws(pos)
+        indent = text[pos:p]
+        for keyword in ("state", "machine"):
+            p = self.literal(p, keyword)
+            if p is None:
+                return None
+            p = self.ws(p)
+        parts = []
+        for keyword in ("k", "s", "step"):
+            p = self.literal(p, keyword)
+            if p is None:
+                return None
+            space_end = self.ws(p)
+            result = self.parenthesized(space_end)
+            if result is None:
+                return None
+            params, after = result
+            parts.append((text[p:space_end], params))
+            p = self.ws(after)
+        trailing = text[after:p]
+        (k_space, k_params), (s_space, s_params), (_, step_params) = parts
+        return StateMachine(indent, k_space, k_params, s_space, s_params, step_params, trailing), p
+
+    def init_line(self, pos):
+        p0 = self.ws(pos)
+        p1 = self.literal(p0, "init")
+        if p1 is None:
+            return None
+        p2 = self.ws(p1)
+        return Init(self.text[pos:p0], self.text[p1:p2]), p2
+
+    def step_line(self, pos):
+        text = self.text
+        p0 = self.ws(pos)
+        p1 = self.literal(p0, "step")
+        if p1 is None:
+            return None
+        p2 = self.ws(p1)
+        p3 = self.regex(p2, IDENTIFIER)
+        if p3 is None:
+            return None
+        p4 = self.ws(p3)
+        result = self.parenthesized(p4)
+        if result is None:
+            return None
+        params, p5 = result
+        p6 = self.ws(p5)
+        return Step(text[pos:p0], text[p1:p2], text[p2:p3], text[p3:p4], params, text[p5:p6]), p6
+
+def formal_arg_names(params):
+    """Names of a Dafny formal parameter list "a: T, b: map<K, V>"."""
+    ws = lambda pos: WHITESPACE.match(params, pos).end()
+
+    def type_params(pos):
+        if not params.startswith("<", pos):
+            return None
+        mo = TYPE_NAME.match(params, pos + 1)
+        if mo is None:
+            return None
+        pos = mo.end()
+        while True:
+            p = ws(pos)
+            if not params.startswith(",", p):
+                break
+            mo = TYPE_NAME.match(params, ws(p + 1))
+            if mo is None:
+                break
+            p = ws(mo.end())
+            nested = type_params(p)
+            pos = ws(nested if nested is not None else p)
+        return pos + 1 if params.startswith(">", pos) else None
+
+    def formal_arg(pos):
+        mo = IDENTIFIER.match(params, pos)
+        if mo is None:
+            return None
+        name = mo.group()
+        p = ws(mo.end())
+        if not params.startswith(":", p):
+            return None
+        mo = TYPE_NAME.match(params, ws(p + 1))
+        if mo is None:
+            return None
+        p = ws(mo.end())
+        after = type_params(p)
+        if after is not None:
+            p = ws(after)
+        return name, p
+
+    names = []
+    pos = 0
+    result = formal_arg(pos)
+    if result is not None:
+        names.append(result[0])
+        pos = result[1]
+    pos = ws(pos)
+    while params.startswith(",", pos):
+        result = formal_arg(ws(pos + 1))
+        if result is None:
+            break
+        names.append(result[0])
+        pos = result[1]
+    if pos != len(params):
+        raise ParseError(params, pos, "formal parameter")
+    return names
+
+def generated_declarations(indent_str, steps, machine_step_params):
+    machine_step_args = ", ".join(formal_arg_names(machine_step_params))
+    machine_sep = ', ' if machine_step_params.strip() != '' else ''
+    args_sep = ', ' if machine_step_args.strip() != '' else ''
+
+    datatype_decl = "\n" + indent_str + "datatype Step =\n" + \
+        "\n".join(["{}  | {}Step({})".format(indent_str, step.name, step.params) for step in steps]) + "\n\n"
+
+    cases = []
+    for step in steps:
+        pnames = ", ".join(formal_arg_names(step.params))
+        cases.append("{}    case {}Step({}) => {}(k, s, s'{}{}{}{})".format(indent_str, step.name, pnames, step.name,
+            args_sep, machine_step_args, ', ' if pnames.strip() != "" else '', pnames))
+
+    nextstep = indent_str + "predicate NextStep(k: Constants, s: Variables, s': Variables{}{}, step: Step)\n".format(machine_sep, machine_step_params) + \
+            indent_str + "{\n" + \
+            indent_str + "  match step {\n" + \
+            "\n".join(cases) + "\n" + \
+            indent_str + "  }\n" + \
+            indent_str + "}\n"
+
+    predicate_next = indent_str + "predicate Next(k: Constants, s: Variables, s': Variables{}{})".format(machine_sep, machine_step_params) + "\n" + \
+            indent_str + "{" + "\n" + \
+            indent_str + "  exists step :: NextStep(k, s, s'{}{}, step)".format(args_sep, machine_step_args) + "\n" + \
+            indent_str + "}" + "\n"
+
+    return datatype_decl + nextstep + predicate_next + "\n"
+
+def expand(block):
+    """Fill in step parameters and append Step/NextStep/Next to each block
+    that declares a state machine. Nested blocks are separate scopes.
+
+    Within a run of lines the latest state machine's step parameters
+    apply; across runs the first run to declare any sticks. (That's how
+    the original parsy-based walk behaved; it only matters for blocks
+    with more than one state machine.)"""
+    indent = None
+    machine_step_params = ''
+    steps = []
+    for item in block.items:
+        if isinstance(item, Block):
+            expand(item)
+        elif isinstance(item, list):
+            run_indent = None
+            run_params = machine_step_params
+            for line in item:
+                if isinstance(line, StateMachine):
+                    run_indent = line.indent
+                    run_params = line.step_params
+                elif isinstance(line, Step):
+                    line.machine_step_params = run_params
+                    steps.append(line)
+            if indent is None:
+                indent = run_indent
             if machine_step_params == '':
-                machine_step_params = element_step_params
-            collected_steps.extend(element_collected_steps)
+                machine_step_params = run_params
+    if indent is not None:
+        block.items.append(generated_declarations(indent.replace('\n', ''), steps, machine_step_params))
+
+def emit(items, out):
+    for item in items:
+        if isinstance(item, str):
+            out.append(item)
+        elif isinstance(item, list):
+            emit(item, out)
+        elif isinstance(item, Block):
+            out.append("{")
+            emit(item.items, out)
+            out.append("}")
         else:
-            (name, marked) = element
-            (start, inner, end) = marked
-            if name == "tla.statemachine":
-                has_state_machine = True
-
-                indent = inner[0]
-                state_machine_indent = indent
-
-                inner.pop(1) # whitespace
-                inner.pop(1) # "state"
-                inner.pop(1) # whitespace
-                inner.pop(1) # "machine"
-
-                (_, (k_open_start, k_open_code, k_open_end)) = inner.pop(1)
-                inner.insert(1, ('tladfy', (k_open_start, 'datatype Constants = Constants', k_open_end)))
-
-                inner.pop(6) # whitespace
-                inner.insert(6, indent)
-
-                (_, (s_open_start, s_open_code, s_open_end)) = inner.pop(7)
-                inner.insert(7, ('tladfy', (s_open_start, 'datatype Variables = Variables', s_open_end)))
-
-                inner.pop(12) # step
-                inner.pop(12) # 
-                inner.pop(12) # 
-                inner.pop(12) # (
-                machine_step_params = inner.pop(12)[1][1] # step_params
-                inner.pop(12) # )
-
-            elif name == "tla.init":
-                (_, (init_open_start, init_open_code, init_open_end)) = inner.pop(1)
-                inner.insert(1, ('tladfy', (init_open_start, 'predicate Init(k: Constants, s: Variables)', init_open_end)))
-
-            elif name == "tla.step":
-                (_, (step_open_start, step_open_code, step_open_end)) = inner.pop(1)
-                inner.insert(1, ('tladfy', (step_open_start, 'predicate', step_open_end)))
-
-                (_, (step_params_start, step_params_code, step_params_end)) = inner.pop(6)
-                step_gen_code = 'k: Constants, s: Variables, s\': Variables' + \
-                        (', ' if machine_step_params.strip() != '' else '') + machine_step_params + \
-                        (', ' if step_params_code.strip() != '' else '') + step_params_code
-                inner.insert(6, ('tladfy', (step_params_start, step_gen_code, step_params_end)))
-
-                collected_steps.append((inner[3][1][1], step_params_code))
-
-            if isinstance(inner, list):
-                (inner_has_state_machine, inner_state_machine_indent, inner_collected_steps, inner_step_params) = walk(inner, '')
-                if inner_has_state_machine:
-                    assert(name == "blockcontents")
-                    # inner.append(inner_state_machine_indent)
-                    indent_str = inner_state_machine_indent[1][1].replace('\n', '')
-
-                    datatype_decl = "\n" + indent_str + "datatype Step =\n" + \
-                        "\n".join([ "{}  | {}Step({})".format(indent_str, ident, params) for ident, params in inner_collected_steps ]) + "\n\n"
-
-                    param_names = []
-                    for ident, params in inner_collected_steps:
-                        parsed = formal_args.parse(params)
-
-                        flat_parsed = [parsed[0]] if parsed[0] is not None else []
-                        flat_parsed.extend(x[0] for x in (parsed[2] if len(parsed) > 2 else []))
-
-                        param_names.append(", ".join([x[0][1][1] for x in flat_parsed]))
-
-                    nextstep_names = zip(inner_collected_steps, param_names)
-
-                    step_params_parsed = formal_args.parse(inner_step_params)
-                    flat_step_params_parsed = [step_params_parsed[0]] if step_params_parsed[0] is not None else []
-                    flat_step_params_parsed.extend(x[0] for x in (step_params_parsed[2] if len(step_params_parsed) > 2 else []))
-                    machine_step_args = ", ".join([x[0][1][1] for x in flat_step_params_parsed])
-
-                    nextstep = indent_str + "predicate NextStep(k: Constants, s: Variables, s': Variables{}{}, step: Step)\n".format(', ' if inner_step_params.strip() != '' else '', inner_step_params) + \
-                            indent_str + "{\n" + \
-                            indent_str + "  match step {\n" + \
-                            "\n".join(["{}    case {}Step({}) => {}(k, s, s'{}{}{}{})".format(indent_str, ident, pnames, ident, ', ' if machine_step_args.strip() != '' else '', machine_step_args, ', ' if pnames.strip() != "" else '', pnames) for ((ident, params), pnames) in nextstep_names]) + "\n" + \
-                            indent_str + "  }\n" + \
-                            indent_str + "}\n"
-
-                    predicate_next = indent_str + "predicate Next(k: Constants, s: Variables, s': Variables{}{})".format(', ' if inner_step_params.strip() != '' else '', inner_step_params) + "\n" + \
-                            indent_str + "{" + "\n" + \
-                            indent_str + "  exists step :: NextStep(k, s, s'{}{}, step)".format(', ' if machine_step_args.strip() != '' else '', machine_step_args) + "\n" + \
-                            indent_str + "}" + "\n"
-
-                    inner.append(('tladfy', (None, [
-                        ('tladfy', (None, datatype_decl, None)),
-                        ('tladfy', (None, nextstep, None)),
-                        ('tladfy', (None, predicate_next, None)),
-                        ('tladfy', (None, '\n', None))
-                    ], None)))
-
-                    machine_step_params = ''
-            else:
-                pass
-
-    return (has_state_machine, state_machine_indent, collected_steps, machine_step_params)
-
-walk(parse_tree, '')
-
-text = ""
-text = emit(text, parse_tree)
-print(text)
+            out.append(item.text())
+
+def translate(contents):
+    items = Scanner(contents).file()
+    for item in items:
+        if isinstance(item, Block):
+            expand(item)
+    out = []
+    emit(items, out)
+    return "".join(out) + "\n"
+
+def _tool_hash():
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+def cached_translate(contents, cache_dir=CACHE_DIR):
+    key = hashlib.sha256(_tool_hash() + contents.encode("utf-8")).hexdigest()
+    path = os.path.join(cache_dir, key + ".dfy")
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        pass
+    text = translate(contents)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = "%s.tmp%d" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return text
 
+def main():
+    parser = argparse.ArgumentParser(description="Expand the state machine DSL into Dafny.")
+    parser.add_argument("--out-dir", help="with inputs: write each translation to OUT_DIR/<basename>")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("inputs", nargs="*", help="source files (default: stdin to stdout)")
+    args = parser.parse_args()
+    run = translate if args.no_cache else cached_translate
+    if not args.inputs:
+        sys.stdout.write(run(sys.stdin.read()))
+        return
+    if args.out_dir is None:
+        parser.error("--out-dir is required with input files")
+    os.makedirs(args.out_dir, exist_ok=True)
+    for path in args.inputs:
+        with open(path) as f:
+            text = run(f.read())
+        with open(os.path.join(args.out_dir, os.path.basename(path)), "w") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
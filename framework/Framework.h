@@ -8,6 +8,7 @@
 #include "NativeArrays.h"
 #include "LinearExtern.h"
 #include "LinearBox.h"
+#include "Tunables.h"
 
 #include <map>
 #include <unordered_map>
@@ -0,0 +1,70 @@
+// Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+// SPDX-License-Identifier: BSD-2-Clause
+
+#include "Tunables.h"
+
+#include <cstdlib>
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <mutex>
+#include <sstream>
+#include <string>
+
+using namespace std;
+
+static uint64_t parse_tunable(const string& name, const string& text)
+{
+  size_t end;
+  uint64_t value = stoull(text, &end, 0);
+  if (end != text.size()) {
+    cerr << "tunable " << name << ": can't parse \"" << text << "\"" << endl;
+    abort();
+  }
+  return value;
+}
+
+static const map<string, string>& tunables_file()
+{
+  static map<string, string> values;
+  static once_flag loaded;
+  call_once(loaded, []() {
+    const char* path = getenv("VERIBETRFS_TUNABLES");
+    if (path == nullptr) {
+      return;
+    }
+    ifstream f(path);
+    if (!f) {
+      cerr << "VERIBETRFS_TUNABLES: can't open " << path << endl;
+      abort();
+    }
+    string line;
+    while (getline(f, line)) {
+      line = line.substr(0, line.find('#'));
+      for (char& c : line) {
+        if (c == '=') c = ' ';
+      }
+      istringstream fields(line);
+      string name, value;
+      if (fields >> name >> value) {
+        values[name] = value;
+      }
+    }
+  });
+  return values;
+}
+
+uint64_t tunable_uint64(const char* name, uint64_t default_value)
+{
+  string var = string("VERIBETRFS_") + name;
+  const char* env = getenv(var.c_str());
+  if (env != nullptr) {
+    return parse_tunable(name, env);
+  }
+  const map<string, string>& file = tunables_file();
+  auto it = file.find(name);
+  if (it != file.end()) {
+    return parse_tunable(name, it->second);
+  }
+  return default_value;
+}
@@ -0,0 +1,22 @@
+// Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+// SPDX-License-Identifier: BSD-2-Clause
+
+#pragma once
+
+#include <cstdint>
+
+// Startup-time overrides for tuning constants that the verified code reads
+// through function methods (Bounds.MaxCacheSizeUint64() and friends).
+// tools/run-veri-config-experiment.py rewrites those methods' bodies in
+// build/Bundle.cpp to call tunable_uint64 once, so one binary serves a whole
+// cache-size or bucket-weight sweep.
+//
+// A value comes from, in order of preference:
+//   the environment variable VERIBETRFS_<name>
+//   a "<name> <value>" (or "<name>=<value>") line in the file named by
+//     VERIBETRFS_TUNABLES
+//   default_value, the constant the verified code was compiled with.
+//
+// Overrides are trusted: like splicing constants into Bundle.cpp, they must
+// respect the bounds the proofs assume about these constants.
+uint64_t tunable_uint64(const char* name, uint64_t default_value);
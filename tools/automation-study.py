@@ -7,10 +7,13 @@
 import re
 import json
 import sys
+import functools
 from lib_deps import *
+import dafny_index
 import matplotlib
 import matplotlib.pyplot as plt
 
+@functools.lru_cache(maxsize=None)
 def relevantSources():
     dafnyRoot = "Impl/Bundle.i.dfy"
     return depsFromDfySources([dafnyRoot])
@@ -29,29 +32,37 @@ class LineReference(IncludeReference):
     def _tuple(self):
         return (self.absPath, self.line_num)
 
-def grepOne(iref, regex):
-    rec = re.compile(regex)
-    if iref in refToLines:
-        lines = refToLines[iref]
-    else:
-        lines = open(iref.normPath).readlines()
+def cleanLines(iref):
+    if iref not in refToLines:
+        lines = rawLines(iref)
         lines = [lineComment.sub('', line) for line in lines] # remove // comments
         lines = [blockComment.sub('', line) for line in lines] # remove single-line /* */ comments
         lines = [startComment.sub('/*', line) for line in lines] # simplify multi-line /*
         lines = [endComment.sub('*/', line) for line in lines] # simplify multi-line */
         refToLines[iref] = lines
-    output = set()
+    return refToLines[iref]
+
+def liveLines(iref):
+    """(line_num, line) for each line of iref outside comments."""
+    lines = cleanLines(iref)
     inComment = False
     for i in range(len(lines)):
         line = lines[i]
         if line.startswith('*/'):
             inComment = False
-        if not inComment and rec.search(line):
-            ir = LineReference(iref, i+1, iref.absPath)
-            output.add(ir)
-            refToLine[ir] = line
+        if not inComment:
+            yield (i+1, line)
         if line.strip().endswith('/*'):
             inComment = True
+
+def grepOne(iref, regex):
+    rec = re.compile(regex)
+    output = set()
+    for line_num, line in liveLines(iref):
+        if rec.search(line):
+            ir = LineReference(iref, line_num, iref.absPath)
+            output.add(ir)
+            refToLine[ir] = line
     return output
 
 def grepAll(regex):
@@ -60,29 +71,30 @@ def grepAll(regex):
         instances = instances.union(grepOne(filename, regex))
     return instances
 
+@functools.lru_cache(maxsize=None)
+def rawLines(iref):
+    return open(iref.normPath).readlines()
+
 def lineForIref(iref):
-    return open(iref.normPath).readlines()[iref.line_num-1].strip()
+    return rawLines(iref)[iref.line_num-1].strip()
 
-def symbolNameForOpaqueIref(iref):
-    line = lineForIref(iref)
-    mo = re.compile("{:opaque}( |{[^}]*})*(\w+)[\(<]").search(line)
-    if mo==None:
-        print("XXX no match at ", line)
-        return None
-    return mo.groups()[1]
+@functools.lru_cache(maxsize=None)
+def sourceIndex():
+    """Declarations and identifier uses of every relevant source, each read
+    once, so reveal and use counts are lookups rather than a grep of the
+    tree per symbol."""
+    return dafny_index.DafnyIndex(sorted(iref.normPath for iref in relevantSources()))
 
 def opaqueInstances():
-    opaqueRefs = grepAll("{:opaque}")
+    index = sourceIndex()
     records = []
-    #print("%s refs" % len(opaqueRefs))
-    for iref in opaqueRefs:
-        symbolName = symbolNameForOpaqueIref(iref)
-        #print(symbolName)
-        reveal_lines = grepAll("reveal_%s\\b" % symbolName)
+    for source, decl in index.find(attribute="opaque"):
+        symbolName = decl.name
+        reveal_lines = index.lines_using("reveal_%s" % symbolName)
         reveal_count = len(reveal_lines)
-        record = {"file": iref.normPath, "line": iref.line_num, "symbol":symbolName, "reveal_count":reveal_count}
+        record = {"file": source.path, "line": decl.line, "symbol":symbolName, "reveal_count":reveal_count}
         records.append(record)
-        print("revealed %2d times: %s in %s at %s" % (reveal_count, symbolName, iref.normPath, iref.line_num))
+        print("revealed %2d times: %s in %s at %s" % (reveal_count, symbolName, source.path, decl.line))
         #sys.stdout.flush()
     return records
 
@@ -162,10 +174,10 @@ def emit_constants(defs):
             fp.write("\\newcommand{\\%s}{%s}\n" % (k, v))
 
 def find_dead_lemmas():
-    lemmaRE = r'\blemma\b(\s|{[^}]+})+(?P<X>\w+)'
-    lemmas = [re.search(lemmaRE, refToLine[r]).group('X') for r in grepAll(lemmaRE)]
+    index = sourceIndex()
+    lemmas = [decl.name for source, decl in index.find(kinds=["lemma"])]
     for x in lemmas:
-        if len(grepAll(r"\b" + x + r"\b")) <= 1:
+        if len(index.lines_using(x)) <= 1:
             print(x)
 
 def main():
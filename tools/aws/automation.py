@@ -2,25 +2,39 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 SSH_ID_PEM="~/.ssh/veribetrfsbastion.pem"
+# Jobs to a worker share one persistent ssh connection (ControlMaster), so
+# each job pays for a channel open rather than a full handshake. Masters
+# outlive the script by SSH_CONTROL_PERSIST, so consecutive tools
+# (run-all.py, ls-jobs.py, a suite launcher...) reuse them too.
+SSH_MULTIPLEX=True
+SSH_CONTROL_PATH="~/.ssh/veribetrfs-mux-%C"
+SSH_CONTROL_PERSIST="30m"
+# Workers found to be stragglers mid-run are listed here (name, then the
+# reason) and left out of later runs and result pulls until the line is
+# deleted.
+QUARANTINE_FILE=".quarantine"
 
 import json
 import subprocess
 import time
-import select
 import sys
 import os
-import fcntl
+import asyncio
 import termcolor    # pip3 install termcolor
 import re
 import argparse
+import contextlib
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from result_status import result_status, COMPLETE
 logfile = None
 
-def set_logfile(path):
-    if os.path.exists(path):
-        sys.stderr.write("logfile %s exists; change experiment label?\n" % path)
+def set_logfile(path, resume=False):
+    """resume: continue an earlier run of the same suite, appending to its log."""
+    if os.path.exists(path) and not resume:
+        sys.stderr.write("logfile %s exists; change experiment label, or --resume?\n" % path)
         sys.exit(-1)
     global logfile
-    logfile = open(path, "w")
+    logfile = open(path, "a" if resume else "w")
 
 def log(msg):
     sys.stdout.write(msg + "\n")
@@ -33,20 +47,47 @@ automation_argparser = argparse.ArgumentParser(description='Options to the autom
 automation_argparser.add_argument('--ssd',          action='store_true')
 automation_argparser.add_argument('--dry-run',      action='store_true')
 automation_argparser.add_argument('--workers-file', default='.awsworkers')
+automation_argparser.add_argument('--pack',         action='store_true',
+    help="run several variants per worker, as many as its slots= capacity")
+automation_argparser.add_argument('--resume',       action='store_true',
+    help="rerun only variants without a complete output, locally or on a worker")
 
-def load_worker_regex_list(filename):
-    regexes = []
+# Worker capacity, for --pack. A workers-file line may follow its name regex
+# with key=value settings, e.g.
+#   veri-worker-b.*  slots=3 cpus_per_slot=2
+# runs three experiments at once on each matching worker, pinned to cpus
+# 2-3, 4-5 and 6-7.
+DEFAULT_CAPACITY = {
+    "slots": 1,
+    "cpus_per_slot": 1,
+    "first_cpu": 2,     # the cpu experiments have always been pinned to
+}
+
+def load_worker_specs(filename):
+    """[(regex, capacity)] from a workers file."""
+    specs = []
     with open(filename) as f:
         for line in f:
-            line = line.partition('#')[0]
-            line = line.strip()
-            if not line.startswith("^"):
-                line = "^" + line
-            if not line.endswith("$"):
-                line = line + "$"
-            regexes = regexes + [line]
-    return regexes
-        
+            fields = line.partition('#')[0].split()
+            if not fields:
+                continue
+            regex = fields[0]
+            if not regex.startswith("^"):
+                regex = "^" + regex
+            if not regex.endswith("$"):
+                regex = regex + "$"
+            capacity = dict(DEFAULT_CAPACITY)
+            for field in fields[1:]:
+                key, _, value = field.partition("=")
+                if key not in capacity:
+                    raise Exception("%s: unknown worker setting %s" % (filename, field))
+                capacity[key] = int(value)
+            specs.append((regex, capacity))
+    return specs
+
+def load_worker_regex_list(filename):
+    return [regex for regex, capacity in load_worker_specs(filename)]
+
 def filter_workers(workers, regexes):
     filtered_workers = []
     for w in workers:
@@ -55,20 +96,108 @@ def filter_workers(workers, regexes):
                 filtered_workers = filtered_workers + [w]
     return filtered_workers
 
-def retrieve_running_workers(workers_file=".awsworkers", ssd=False):
-    filter_regexes = load_worker_regex_list(workers_file)
+def apply_capacities(workers, specs):
+    """Attach each worker's capacity from the first spec naming it."""
+    for w in workers:
+        for regex, capacity in specs:
+            if re.search(regex, w["Name"]) is not None:
+                w["Capacity"] = capacity
+                break
+
+def retrieve_running_workers(workers_file=".awsworkers", ssd=False, skip_quarantined=False):
+    """Running workers matching workers_file. skip_quarantined drops the
+    ones in .quarantine; only launchers handing out new work want that,
+    since a quarantined host may still have jobs to list or kill and
+    results to pull."""
+    specs = load_worker_specs(workers_file)
+    filter_regexes = [regex for regex, capacity in specs]
     workers_pipe = subprocess.Popen("ssh bastion veribetrfs/tools/aws/describe-instances.py --running --json".split() + (["--ssd"] if ssd else []), stdout=subprocess.PIPE)
     workers_json,_ = workers_pipe.communicate()
     workers = json.loads(workers_json)
     workers = filter_workers(workers, filter_regexes)
+    apply_capacities(workers, specs)
+    if not skip_quarantined:
+        return workers
+    quarantined = load_quarantine()
+    for w in workers:
+        if w["Name"] in quarantined:
+            log("QUARANTINED %s skipped: %s" % (w["Name"], quarantined[w["Name"]]))
+    workers = [w for w in workers if w["Name"] not in quarantined]
     return workers
 
+def load_quarantine(path=QUARANTINE_FILE):
+    """worker name -> reason it was quarantined"""
+    quarantined = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                name, _, reason = line.partition('#')[0].strip().partition(" ")
+                if name:
+                    quarantined[name] = reason
+    return quarantined
+
+def add_quarantine(worker, reason, path=QUARANTINE_FILE):
+    # a packed slot quarantines its whole instance
+    with open(path, "a") as f:
+        f.write("%s %s\n" % (worker.get("Instance", worker["Name"]), reason))
+
+def expand_slots(workers):
+    """One schedulable worker per experiment slot. Slots of an instance share
+    its address, but get their own Name (<instance>/s<slot>), checkout, cpus,
+    cgroup and data directory; see slot_checkout and slot_runner_params."""
+    slots = []
+    for w in workers:
+        capacity = w.get("Capacity", DEFAULT_CAPACITY)
+        for slot in range(capacity["slots"]):
+            sw = dict(w)
+            sw.pop("index", None)
+            sw["Instance"] = w["Name"]
+            sw["Slot"] = slot
+            if capacity["slots"] > 1:
+                sw["Name"] = "%s/s%d" % (w["Name"], slot)
+            slots.append(sw)
+    return slots
+
+def slot_checkout(worker):
+    """The worker-side checkout a slot builds and runs in. Slots can't
+    share one: the runner wipes and rebuilds build/."""
+    slot = worker.get("Slot", 0)
+    return "veribetrfs" if slot == 0 else "veribetrfs-s%d" % slot
+
+def slot_setup_cmd(worker):
+    """Shell words that create the slot's checkout (a copy of the primary
+    one, toolchain and vendored builds included) on first use."""
+    checkout = slot_checkout(worker)
+    if checkout == "veribetrfs":
+        return []
+    return ["[", "-d", checkout, "]", "||", "cp", "-a", "veribetrfs", checkout, ";"]
+
+def slot_runner_params(worker):
+    """run-veri-config-experiment.py arguments placing a packed experiment
+    on its own cpus, cgroup and data directory."""
+    if "Slot" not in worker:
+        return []
+    capacity = worker.get("Capacity", DEFAULT_CAPACITY)
+    first = capacity["first_cpu"] + worker["Slot"] * capacity["cpus_per_slot"]
+    cpus = ",".join(str(c) for c in range(first, first + capacity["cpus_per_slot"]))
+    params = ["slot=%d" % worker["Slot"], "cpus=%s" % cpus]
+    if capacity["slots"] > 1:
+        params.append("packed")
+    return params
+
+def ssh_mux_options():
+    if not SSH_MULTIPLEX:
+        return []
+    return ["-o", "ControlMaster=auto",
+            "-o", "ControlPath=%s" % SSH_CONTROL_PATH,
+            "-o", "ControlPersist=%s" % SSH_CONTROL_PERSIST]
+
 def ssh_preamble(want_pty=None):
     kill_pty = [] if want_pty else ["-T"]
     # kill_pty doesn't actually do anything, because no-pty is the default
     # when launching ssh from a script. I think Popen(stdin=DEVNULL)
     # is what I really wanted to solve the remote-hanging problem.
-    return ["ssh"]+kill_pty+("-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no -i").split() + [SSH_ID_PEM]
+    return ["ssh"]+kill_pty+("-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no -i").split() + [SSH_ID_PEM] + ssh_mux_options()
 
 def ssh_target_for_worker(worker):
     return"ubuntu@%s" % worker["PublicIpAddress"]
@@ -76,6 +205,59 @@ def ssh_target_for_worker(worker):
 def ssh_cmd_for_worker(worker, want_pty=None):
     return ssh_preamble(want_pty) + [ssh_target_for_worker(worker)]
 
+def start_ssh_masters(workers, timeout=60):
+    """Open (or confirm) the shared connection to every worker, all in
+    parallel. Otherwise the first burst of jobs would race to become master
+    and most of them would pay for their own handshake anyway."""
+    if not SSH_MULTIPLEX:
+        return
+    checks = [(w, subprocess.Popen(ssh_preamble() + ["-O", "check", ssh_target_for_worker(w)],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            for w in workers]
+    starts = []
+    for worker, proc in checks:
+        if proc.wait() != 0:
+            # -N -f: authenticate, then background with no remote command
+            starts.append((worker, subprocess.Popen(
+                ssh_preamble() + ["-o", "ControlMaster=yes", "-N", "-f", ssh_target_for_worker(worker)],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)))
+    for worker, proc in starts:
+        # Don't wait on output pipes: the backgrounded master inherits them.
+        try:
+            if proc.wait(timeout=timeout) != 0:
+                log("SSH_MASTER_FAILED %s" % worker["Name"])
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            log("SSH_MASTER_TIMEOUT %s" % worker["Name"])
+
+def stop_ssh_masters(workers):
+    """Close the shared connections, e.g. after instances are stopped."""
+    if not SSH_MULTIPLEX:
+        return
+    procs = [subprocess.Popen(ssh_preamble() + ["-O", "exit", ssh_target_for_worker(w)],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for w in workers]
+    for proc in procs:
+        proc.wait()
+
+def distinct_hosts(workers):
+    """One worker per ssh target; packed slots share their host's connection."""
+    hosts = {}
+    for w in workers:
+        hosts.setdefault(ssh_target_for_worker(w), w)
+    return list(hosts.values())
+
+@contextlib.contextmanager
+def ssh_masters(workers):
+    """Shared connections to workers for the length of a launch, closed
+    when it finishes or fails."""
+    hosts = distinct_hosts(workers)
+    start_ssh_masters(hosts)
+    try:
+        yield
+    finally:
+        stop_ssh_masters(hosts)
+
 next_index = 0
 def get_index():
     global next_index
@@ -85,21 +267,21 @@ def get_index():
 
 spectrum = ["red", "yellow", "green", "cyan", "blue", "magenta"]
 
+# asyncio's default StreamReader limit (64KiB) is too short for some of the
+# lines experiments print (e.g. malloc histograms).
+STREAM_LIMIT = 1<<24
+
 class WorkerMonitor:
     def __init__(self, worker, cmd):
         self.worker = worker
         self.cmd = cmd
         self.running = True
+        self.returncode = None
+        self.proc = None
         if "index" not in worker:
             worker["index"] = get_index()
         self.index = worker["index"]
 
-    def set_pipe(self, pipe):
-        self.pipe = pipe
-        fd = self.pipe.stdout.fileno()
-        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
-        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
-
     def __repr__(self):
         return self.worker["Name"]
 
@@ -109,57 +291,70 @@ class WorkerMonitor:
     def set_dead(self):
         self.running = False
 
-    def launch(self):
+    def kill(self):
+        """Stop the local end of the job. The remote command may keep going
+        until its ssh channel notices; kill-jobs.py cleans up after that."""
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+
+    def on_line(self, line):
+        """Called for each line the job prints. Override or replace to
+        capture structured output."""
+        log("%s %s" % (self.linetag(), line))
+
+    def on_exit(self, returncode):
+        log("%s WORKER_ENDS" % self.linetag())
+
+    async def run(self):
+        """Launch the command and stream its output until it exits."""
         log("%s LAUNCH_CMD %s" % (self.linetag(), self.cmd.text_cmd_line()))
-        self.set_pipe(subprocess.Popen(self.cmd.cmd_ary, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        proc = await asyncio.create_subprocess_exec(*self.cmd.cmd_ary,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            limit=STREAM_LIMIT)
+        self.proc = proc
+        async for raw in proc.stdout:
+            self.on_line(raw.decode("utf-8", errors="replace").rstrip())
+        self.returncode = await proc.wait()
+        self.set_dead()
+        self.on_exit(self.returncode)
 
 def running(monitors):
     return [m for m in monitors if m.running]
 
-def poll_monitors(monitors):
-    """returns the set of still-active monitors."""
-    polling = select.poll()
-    fdmap = {}
-    for monitor in running(monitors):
-        monitor.fd = monitor.pipe.stdout.fileno()
-        polling.register(monitor.pipe.stdout)
-        fdmap[monitor.fd] = monitor
-
-    #print ("num_running", len(running(monitors)))
-    # scan for stdout
-    snooze = 1
-    for fd,event in polling.poll(1):
-        monitor = fdmap[fd]
-        if not monitor.running:
-            continue
-        snooze = 0
-        #log("%s event %s %s" % (monitor.linetag(), event, [select.POLLIN, select.POLLHUP]))
-        if event & select.POLLIN:
-            while True:
-                line = monitor.pipe.stdout.readline()
-                if len(line) == 0: break
-                line = line.decode("utf-8").strip()
-                log("%s %s" % (monitor.linetag(), line))
+class ProgressReporter:
+    """Logs a PROGRESS line whenever the count of running monitors changes."""
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.last = None
+
+    def __call__(self, *args):
+        msg = self.fmt % args
+        if msg != self.last:
+            log(msg)
+            self.last = msg
+
+async def run_monitors(monitors, max_concurrent=None):
+    """Run every monitor on one event loop, at most max_concurrent at a time."""
+    limit = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+    progress = ProgressReporter("PROGRESS %d workers remaining")
+
+    async def run_one(monitor):
+        if limit:
+            async with limit:
+                await monitor.run()
         else:
-            # Don't process POLLHUP until there's no POLLIN left to read.
-            if event & select.POLLHUP:
-                if monitor.running:
-                    log("%s WORKER_ENDS" % monitor.linetag())
-                monitor.set_dead()
-    # If nothing happened, kill a little time before returning to outer loop.
-    time.sleep(snooze)
-    return running(monitors)
-
-def monitor_worker_pipes(monitors):
-    lastSize = None
-    while len(running(monitors)) > 0:
-        sys.stdout.flush()
-        monitors = poll_monitors(monitors)
-        sys.stdout.flush()
-        size = len(running(monitors))
-        if size != lastSize:
-            log("PROGRESS %d workers remaining" % size)
-            lastSize = size
+            await monitor.run()
+        progress(len(running(monitors)))
+
+    progress(len(running(monitors)))
+    await asyncio.gather(*[run_one(m) for m in monitors])
+
+def monitor_worker_pipes(monitors, max_concurrent=None):
+    # Under dry_run launch_worker_pipes returns no monitors, so no
+    # connections are opened.
+    if len(running(monitors)) > 0:
+        with ssh_masters([m.worker for m in monitors]):
+            asyncio.run(run_monitors(monitors, max_concurrent))
     log("All jobs complete.")
 
 class Command:
@@ -173,7 +368,37 @@ class Command:
     def text_cmd_line(self):
         return " ".join(self.cmd_ary)
 
+def remote_complete_outputs(workers, paths, kind):
+    """Paths (relative to ~/veribetrfs on the worker) for which some worker
+    holds a complete output. Asks every worker at once."""
+    procs = [subprocess.Popen(ssh_cmd_for_worker(w) + [
+                "cd", "veribetrfs", ";", "python3", "tools/result_status.py", "--kind", kind] + paths,
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            for w in workers]
+    complete = set()
+    for worker, proc in zip(workers, procs):
+        out, _ = proc.communicate()
+        for line in out.decode("utf-8", errors="replace").splitlines():
+            status, _, path = line.partition(" ")
+            if status == COMPLETE:
+                complete.add(path)
+    return complete
+
+def incomplete_variants(variants, workers, kind="ycsb"):
+    """Indices of the variants still to run: those with no complete output,
+    either already pulled into expresults/ here or left on some worker.
+    Partial outputs count as missing."""
+    todo = [idx for idx, v in enumerate(variants) if result_status(v.outfile(), kind) != COMPLETE]
+    local_done = len(variants) - len(todo)
+    remote = remote_complete_outputs(workers, ["../" + variants[idx].outfile() for idx in todo], kind) if todo else set()
+    todo = [idx for idx in todo if "../" + variants[idx].outfile() not in remote]
+    log("RESUME %d variants complete here, %d on workers; %d to run" % (
+        local_done, len(variants) - local_done - len(todo), len(todo)))
+    return todo
+
 def launch_worker_pipes(workers, ntasks, lam, dry_run=False):
+    """Assign task idx to workers[idx]. The returned monitors start running
+    when passed to monitor_worker_pipes."""
     if ntasks > len(workers):
         raise Exception("Requested %d tasks for %d workers" % (ntasks, len(workers)))
     monitors = []
@@ -185,45 +410,260 @@ def launch_worker_pipes(workers, ntasks, lam, dry_run=False):
         log("%s ASSIGN_CMD %s" % (monitor.linetag(), cmd))
         if not dry_run:
             monitors.append(monitor)
-
-    for monitor in monitors:
-        monitor.launch()
     return monitors
 
-def sequenced_launcher(workers, ntasks, lam, dry_run=False):
-    idle_resources = workers
-    next_task_idx = 0
+def median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+def load_task_durations(log_paths):
+    """label -> median wall seconds, from the TASK_DONE lines that
+    run_sequenced writes to suite logs."""
+    samples = {}
+    for path in log_paths:
+        with open(path, errors="replace") as fp:
+            for line in fp:
+                mo = re.search("TASK_DONE ([0-9.]+) (\\S+)", line)
+                if mo is not None:
+                    samples.setdefault(mo.group(2), []).append(float(mo.group(1)))
+    return dict((label, median(ts)) for label, ts in samples.items())
+
+class DurationModel:
+    """Expected task durations, plus a speed factor per worker learned as
+    tasks finish (actual/expected: 1.0 is nominal, 2.0 twice as slow)."""
+    def __init__(self, expected=None, alpha=0.3):
+        # expected: idx -> seconds; tasks without an estimate get the median
+        self.expected = dict((idx, t) for idx, t in (expected or {}).items() if t)
+        self.default = median(self.expected.values()) if self.expected else 1.0
+        self.alpha = alpha
+        self.speeds = {}
+
+    def task(self, idx):
+        return self.expected.get(idx, self.default)
+
+    def speed(self, worker):
+        return self.speeds.get(worker["Name"], 1.0)
+
+    def predict(self, idx, worker):
+        return self.task(idx) * self.speed(worker)
+
+    def observe(self, idx, worker, seconds):
+        if idx not in self.expected:
+            return
+        ratio = seconds / self.expected[idx]
+        name = worker["Name"]
+        if name in self.speeds:
+            self.speeds[name] = (1 - self.alpha) * self.speeds[name] + self.alpha * ratio
+        else:
+            self.speeds[name] = ratio
+
+class WorkStealingScheduler:
+    """Longest-processing-time-first list scheduling onto per-worker queues,
+    with stealing: a worker that drains its own queue takes the longest
+    queued task from whichever worker has the most predicted work left.
+    Bad estimates and slow workers are thus corrected at runtime instead of
+    stretching the makespan."""
+    def __init__(self, workers, ntasks, model):
+        self.model = model
+        self.queues = dict((w["Name"], []) for w in workers)
+        self.workers = dict((w["Name"], w) for w in workers)
+        load = dict((name, 0.0) for name in self.queues)
+        for idx in sorted(range(ntasks), key=model.task, reverse=True):
+            name = min(load, key=lambda n: load[n] + model.predict(idx, self.workers[n]))
+            self.queues[name].append(idx)
+            load[name] += model.predict(idx, self.workers[name])
+
+    def queued_work(self, name):
+        return sum(self.model.predict(idx, self.workers[name]) for idx in self.queues[name])
+
+    def remaining(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def next_for(self, worker):
+        """Pop the next task for an idle worker, stealing if its own queue is
+        empty. Returns None when no work is left anywhere."""
+        queue = self.queues[worker["Name"]]
+        if queue:
+            return queue.pop(0)
+        victims = [name for name, q in self.queues.items() if q]
+        if not victims:
+            return None
+        victim = max(victims, key=self.queued_work)
+        idx = self.queues[victim].pop(0)
+        log("STEAL %s takes task %d from %s" % (worker["Name"], idx, victim))
+        return idx
+
+    def quarantine(self, worker):
+        """Stop scheduling onto worker; returns the tasks it had queued."""
+        orphans = self.queues.pop(worker["Name"])
+        del self.workers[worker["Name"]]
+        return orphans
+
+    def requeue(self, idx):
+        """Give idx to the worker with the least predicted work, keeping its
+        queue longest-first."""
+        name = min(self.queues, key=lambda n: self.queued_work(n) + self.model.predict(idx, self.workers[n]))
+        queue = self.queues[name]
+        queue.append(idx)
+        queue.sort(key=self.model.task, reverse=True)
+
+# Straggler detection. A worker is quarantined once it runs tasks
+# STRAGGLER_FACTOR times slower (relative to their expected durations) than
+# the median of the other workers, judged on at least STRAGGLER_MIN_COHORT
+# completed tasks from those others. Only tasks with a real duration
+# estimate are judged; without any (no prior log) detection is off, since
+# raw seconds across tasks of different lengths say nothing about workers.
+STRAGGLER_FACTOR = 1.6
+STRAGGLER_MIN_COHORT = 4
+# How often running tasks are checked for overrunning the cohort.
+STRAGGLER_CHECK_SEC = 30
+# Never quarantine more than this fraction of the workers in one run.
+STRAGGLER_MAX_FRACTION = 0.25
+
+class StragglerDetector:
+    """Compares each worker's slowdown (actual / expected duration) against
+    the rest of the cohort while a run is in progress."""
+    def __init__(self, model, nworkers, factor=STRAGGLER_FACTOR, min_cohort=STRAGGLER_MIN_COHORT):
+        self.model = model
+        self.factor = factor
+        self.min_cohort = min_cohort
+        self.max_quarantined = int(nworkers * STRAGGLER_MAX_FRACTION)
+        self.ratios = {}    # worker name -> [actual/expected]
+        self.quarantined = set()
+
+    def enabled(self):
+        return bool(self.model.expected)
+
+    def judged(self, idx):
+        return idx in self.model.expected
+
+    def record(self, idx, worker, seconds):
+        if not self.judged(idx):
+            return
+        self.ratios.setdefault(worker["Name"], []).append(seconds / self.model.expected[idx])
+
+    def cohort_ratio(self, worker):
+        """Median slowdown of everyone but worker, or None if too few
+        tasks have finished to say."""
+        others = [r for name, rs in self.ratios.items()
+                if name != worker["Name"] and name not in self.quarantined for r in rs]
+        if len(others) < self.min_cohort:
+            return None
+        return median(others)
+
+    def can_quarantine(self):
+        return len(self.quarantined) < self.max_quarantined
+
+    def slow_finisher(self, worker):
+        """Reason string if worker's completed tasks mark it a straggler."""
+        cohort = self.cohort_ratio(worker)
+        own = self.ratios.get(worker["Name"])
+        if cohort is None or not own:
+            return None
+        if median(own) > self.factor * cohort:
+            return "median slowdown %.2f vs cohort %.2f" % (median(own), cohort)
+        return None
+
+    def overrunning(self, idx, worker, elapsed):
+        """Reason string if a still-running task has already taken far
+        longer than the cohort would."""
+        if not self.judged(idx):
+            return None
+        cohort = self.cohort_ratio(worker)
+        if cohort is None:
+            return None
+        limit = self.factor * cohort * self.model.expected[idx]
+        if elapsed > limit:
+            return "task %d running %.1fs, cohort would take %.1fs" % (idx, elapsed, limit / self.factor)
+        return None
+
+async def run_sequenced(workers, ntasks, lam, dry_run=False, model=None):
+    model = model or DurationModel()
+    scheduler = WorkStealingScheduler(workers, ntasks, model)
+    detector = StragglerDetector(model, len(workers))
+    if not detector.enabled():
+        log("STRAGGLER detection off: no task duration estimates")
     monitors = []
+    progress = ProgressReporter("PROGRESS %d tasks ready; %d tasks running")
+    done_on = dict((w["Name"], []) for w in workers)   # tasks each worker completed
+    running_tasks = {}  # asyncio task -> (monitor, idx, start)
 
-    def dispatch_one(idx):
-        worker = idle_resources.pop()
-        cmd = lam(idx, worker)
-        monitor = WorkerMonitor(worker, cmd)
-        log("%s ASSIGN_CMD %s" % (monitor.linetag(), cmd))
-        if dry_run:
+    async def run_task(monitor):
+        try:
+            if not dry_run:
+                await monitor.run()
+        finally:
             monitor.set_dead()
-        else:
-            monitor.launch()
-        return monitor
-
-    while len(monitors)>0 or next_task_idx<ntasks:
-        # assign until we have no more idle resources or work to do
-        while len(idle_resources)>0 and next_task_idx<ntasks:
-            monitor = dispatch_one(next_task_idx)
-            next_task_idx += 1
+
+    def quarantine(worker, reason):
+        name = worker["Name"]
+        detector.quarantined.add(name)
+        add_quarantine(worker, reason)
+        log("QUARANTINE %s: %s" % (name, reason))
+        # Its measurements are suspect too: run those variants again elsewhere.
+        for idx in scheduler.quarantine(worker) + done_on[name]:
+            log("REDISPATCH task %d from %s" % (idx, name))
+            scheduler.requeue(idx)
+        done_on[name] = []
+        for monitor, idx, start in running_tasks.values():
+            if monitor.worker is worker:
+                log("REDISPATCH task %d from %s" % (idx, name))
+                scheduler.requeue(idx)
+                monitor.kill()
+
+    def finished(task):
+        monitor, idx, start = running_tasks.pop(task)
+        worker = monitor.worker
+        if worker["Name"] in detector.quarantined:
+            return  # already redispatched; worker stays out of the pool
+        if not dry_run and monitor.returncode == 0:
+            elapsed = time.monotonic() - start
+            model.observe(idx, worker, elapsed)
+            detector.record(idx, worker, elapsed)
+            done_on[worker["Name"]].append(idx)
+            log("%s TASK_DONE %.1f %s" % (monitor.linetag(), elapsed, monitor.cmd))
+            reason = detector.slow_finisher(worker)
+            if reason and detector.can_quarantine():
+                quarantine(worker, reason)
+                return
+        idle.append(worker)
+
+    idle = list(workers)
+    while True:
+        for worker in list(idle):
+            idx = scheduler.next_for(worker)
+            if idx is None:
+                continue
+            idle.remove(worker)
+            cmd = lam(idx, worker)
+            monitor = WorkerMonitor(worker, cmd)
+            log("%s ASSIGN_CMD %s" % (monitor.linetag(), cmd))
             monitors.append(monitor)
-        
-        # wait for something to finish
-        prevSize = len(running(monitors))
-        if not dry_run:
-            surviving_monitors = poll_monitors(monitors)
-        else:
-            surviving_monitors = []
-        for monitor in monitors:
-            if monitor not in surviving_monitors:
-                idle_resources.insert(0, monitor.worker)
-        monitors = surviving_monitors
-        curSize = len(running(monitors))
-        if curSize!=prevSize:
-            log("PROGRESS %d tasks ready; %d tasks running" % (ntasks - next_task_idx, len(running(monitors))))
+            running_tasks[asyncio.create_task(run_task(monitor))] = (monitor, idx, time.monotonic())
+        if not running_tasks:
+            break
+        done, _ = await asyncio.wait(list(running_tasks), timeout=STRAGGLER_CHECK_SEC,
+                return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            finished(task)
+        now = time.monotonic()
+        for monitor, idx, start in list(running_tasks.values()):
+            if dry_run or monitor.worker["Name"] in detector.quarantined:
+                continue
+            reason = detector.overrunning(idx, monitor.worker, now - start)
+            if reason and detector.can_quarantine():
+                quarantine(monitor.worker, reason)
+        progress(scheduler.remaining(), len(running_tasks))
+    return monitors
+
+def sequenced_launcher(workers, ntasks, lam, dry_run=False, expected_durations=None):
+    """Run ntasks tasks across workers until all complete, longest expected
+    first. expected_durations maps task idx to seconds (e.g. from
+    load_task_durations); without it tasks run in index order."""
+    model = DurationModel(expected_durations)
+    if dry_run:
+        asyncio.run(run_sequenced(workers, ntasks, lam, dry_run, model))
+    else:
+        with ssh_masters(workers):
+            asyncio.run(run_sequenced(workers, ntasks, lam, dry_run, model))
     log("All jobs complete.")
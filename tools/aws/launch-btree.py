@@ -47,9 +47,12 @@ def cmd_for_idx(idx, worker):
 def main():
     set_logfile(suite.logpath())
     log("PLOT tools/aws/pull-results.py")
-    log("VARIANTS %s" % suite.variants)
+    log("VARIANTS %s" % suite.describe_variants())
 
-    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=False)
+    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=False, skip_quarantined=True)
+    # Known-slow instances. Keep excluding them until the straggler
+    # detector has been seen to quarantine them on its own; other slow
+    # instances get quarantined (and their variants rerun) as the run goes.
     blacklist = [
         "veri-worker-b00",
         "veri-worker-b01",
@@ -59,7 +62,6 @@ def main():
         "veri-worker-b05",
     ]
     workers = [w for w in workers if w["Name"] not in blacklist]
-    worker_pipes = launch_worker_pipes(workers, len(suite.variants), cmd_for_idx, dry_run=args.dry_run)
-    monitor_worker_pipes(worker_pipes)
+    sequenced_launcher(workers, len(suite.variants), cmd_for_idx, dry_run=args.dry_run)
 
 main()
@@ -67,22 +67,26 @@ RUN_VERI_PATH="tools/run-veri-config-experiment.py"
 
 def cmd_for_idx(idx, worker):
     variant = suite.variants[idx]
-    cmd = (ssh_cmd_for_worker(worker) + [
-        "cd", "veribetrfs", ";",
+    cmd = (ssh_cmd_for_worker(worker) + slot_setup_cmd(worker) + [
+        "cd", slot_checkout(worker), ";",
         "sh", "tools/clean-for-build.sh", variant.git_branch(), ";",
         ]
-        + [RUN_VERI_PATH] + variant.run_veri_params() + ["output=../"+variant.outfile()]
+        + [RUN_VERI_PATH] + variant.run_veri_params() + slot_runner_params(worker) + ["output=../"+variant.outfile()]
+        + (["resume"] if args.resume else [])
         )
     print(cmd)
     return Command(str(variant), cmd)
 
 def main():
-    set_logfile(suite.logpath())
+    set_logfile(suite.logpath(), resume=args.resume)
     #log("PLOT tools/aws/pull-results.py && %s && eog %s" % (suite.plot_command(), suite.png_filename()))
-    log("VARIANTS %s" % suite.variants)
+    log("VARIANTS %s" % suite.describe_variants())
 
-    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=True)
-    worker_pipes = launch_worker_pipes(workers, len(suite.variants), cmd_for_idx, dry_run=args.dry_run)
+    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=True, skip_quarantined=True)
+    todo = incomplete_variants(suite.variants, workers) if args.resume else list(range(len(suite.variants)))
+    if args.pack:
+        workers = expand_slots(workers)
+    worker_pipes = launch_worker_pipes(workers, len(todo), lambda idx, worker: cmd_for_idx(todo[idx], worker), dry_run=args.dry_run)
     monitor_worker_pipes(worker_pipes)
 
 main()
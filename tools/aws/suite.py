@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import os
+import hashlib
+import itertools
 
 class Value:
     def __init__(self, label, param_value):
@@ -16,8 +18,9 @@ class Variable:
         self.label = label
         self.type = type
         self.values = values
-        for value in self.values:
+        for index, value in enumerate(self.values):
             value.variable = self
+            value.index = index
 
     def __repr__(self):
         return "$(%s)" % self.label
@@ -54,6 +57,9 @@ class Variant:
         assert len(match)==1
         return match[0]
 
+    def has_value(self, var_label, value_label):
+        return any(val.variable.label == var_label and val.label == value_label for val in self.values)
+
     def git_branch(self):
         return self.valmap[self.vars_of_type("git_branch")[0]].param_value
 
@@ -63,60 +69,123 @@ class Variant:
     def run_veri_params(self):
         return [self.valmap[var].param_value for var in self.vars_of_type("run_veri")]
 
+# Variant filters. A suite keeps only the variants every one of its filters
+# accepts; each filter is just a predicate on a Variant.
+
+def exclude(**value_labels):
+    """Drop variants having all the given variable=value labels, e.g.
+    exclude(git_branch="linear", replica="r4")."""
+    return lambda variant: not all(variant.has_value(var, val) for var, val in value_labels.items())
+
+def require(**value_labels):
+    """Keep only variants having all the given variable=value labels."""
+    return lambda variant: all(variant.has_value(var, val) for var, val in value_labels.items())
+
+def sample_fraction(fraction, salt=""):
+    """Keep a pseudo-random fraction of variants. The choice hashes the
+    label, so it is the same on every run (and so survives --resume)."""
+    def accept(variant):
+        digest = hashlib.md5((salt + variant.get_label()).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") < fraction * (1 << 64)
+    return accept
+
+def fractional_factorial(*var_labels):
+    """Keep the variants whose value indices over var_labels sum to 0 modulo
+    the smallest level count among them. For two-level factors that's the
+    half fraction with defining relation I = ABC..., which still estimates
+    every main effect."""
+    def accept(variant):
+        values = [variant.value_by_name(label) for label in var_labels]
+        levels = min(len(val.variable.values) for val in values)
+        return sum(val.index for val in values) % levels == 0
+    return accept
+
 class BaseSuite:
-    def __init__(self, label):
+    def __init__(self, label, filters=()):
         self.label = label
+        self.filters = list(filters)
+        self.variants_ = None
+
+    def accepts(self, variant):
+        return all(f(variant) for f in self.filters)
+
+    def iter_variants(self):
+        """Generate the variants one at a time, filters applied."""
+        for variant in self.candidate_variants():
+            if self.accepts(variant):
+                yield variant
+
+    @property
+    def variants(self):
+        # Launchers index variants by task number, so materialize once.
+        if self.variants_ is None:
+            self.variants_ = list(self.iter_variants())
+        return self.variants_
+
+    def describe_variants(self, sample=5):
+        """Variant count and the first few labels, in one pass; for logs,
+        where the whole list of a large suite is noise."""
+        count = 0
+        labels = []
+        for variant in self.iter_variants():
+            if count < sample:
+                labels.append(variant.get_label())
+            count += 1
+        return "%d variants: %s%s" % (count, " ".join(labels), " ..." if count > sample else "")
 
     def png_filename(self):
         return "%s.png" % self.label
 
+    def variant_args(self):
+        return [variant.get_label()+"="+variant.outfile() for variant in self.iter_variants()]
+
     def plot_command(self):
         return " ".join([
             "tools/plot/perf-compare.py",
-            "output=%s" % self.png_filename()] + [variant.get_label()+"="+variant.outfile() for variant in self.variants])
+            "output=%s" % self.png_filename()] + self.variant_args())
+
+    def memory_report_filename(self):
+        return "%s-memory.tsv" % self.label
+
+    def memory_report_command(self):
+        return " ".join([
+            "tools/plot/memory-report.py",
+            "output=%s" % self.memory_report_filename()] + self.variant_args())
 
     def logpath(self):
         return os.path.join("logs", self.label+".log")
 
 class Suite(BaseSuite):
-    def __init__(self, label, *variables):
-        super().__init__(label)
+    def __init__(self, label, *variables, filters=()):
+        super().__init__(label, filters)
         self.variables = variables
         self.variables_by_label = dict([(v.label,v) for v in self.variables])
-        self.variants = self.make_variants(self.variables)
+        self.label_sets = dict((v.label, set(val.label for val in v.values)) for v in self.variables)
 
     def vars_of_type(self, type):
         return [var for var in self.variables if var.type==type]
 
     def value_label_set_for_variable_label(self, var_label):
-        try:
-            var = self.variables_by_label[var_label]
-            return set([val.label for val in var.values])
-        except KeyError:
-            return set()
-
-    def make_variants(self, variables):
-        if len(variables) == 1:
-            result = [Variant(self, [value]) for value in variables[0].values]
-        else:
-            variants = []
-            for value in variables[0].values:
-                for sub_variant in self.make_variants(variables[1:]):
-                    variants.append(Variant(self, [value] + sub_variant.values))
-            result = variants
-        return result
+        return self.label_sets.get(var_label, set())
+
+    def candidate_variants(self):
+        # Cartesian product, first variable varying slowest.
+        for values in itertools.product(*[var.values for var in self.variables]):
+            yield Variant(self, list(values))
 
 class ConcatSuite(BaseSuite):
-    def __init__(self, label, *suites):
-        super().__init__(label)
+    def __init__(self, label, *suites, filters=()):
+        super().__init__(label, filters)
         self.suites = suites
-        self.variants = []
-        for suite in self.suites:
-            for variant in suite.variants:
-                self.variants.append(Variant(self, variant.values))
+        self.label_sets = {}
+        for sub_suite in self.suites:
+            for var_label, val_labels in sub_suite.label_sets.items():
+                self.label_sets.setdefault(var_label, set()).update(val_labels)
 
     def value_label_set_for_variable_label(self, var_label):
-        val_label_set = set()
-        for sub_suite in self.suites:
-            val_label_set = val_label_set.union(sub_suite.value_label_set_for_variable_label(var_label))
-        return val_label_set
+        return self.label_sets.get(var_label, set())
+
+    def candidate_variants(self):
+        for suite in self.suites:
+            for variant in suite.iter_variants():
+                yield Variant(self, variant.values)
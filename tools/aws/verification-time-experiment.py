@@ -8,6 +8,7 @@ import os
 sys.path.append(os.path.dirname(__file__)+"/..")
 
 import re
+import glob
 from automation import *
 from suite import *
 from lib_deps import *
@@ -22,6 +23,10 @@ ROOT="Impl/Bundle.i.dfy"
 #ROOT="lib/DataStructures/MutableBtree.i.dfy"   # a small test case
 SUITE_NAME="veri_time_september_02"   # one big parallel build
 N_REPLICAS=5
+# Earlier sweeps, used to estimate how long each variant takes so the
+# longest ones start first.
+PRIOR_LOGS="logs/veri_time_*.log"
+PRIOR_RESULTS="expresults/veri_time_*.data"
 
 def listSources():
     paths = set()
@@ -36,7 +41,7 @@ def listSources():
     return values
 
 def constructSuite(nReplicas):
-    sourceVariable = Variable("source", "source", listSources()[::-1])
+    sourceVariable = Variable("source", "source", listSources())
     replicaVariable = Variable("replica", "silent", [Value("r%d"%i, "r%d"%i) for i in range(nReplicas)])
     branchVariable = Variable("git_branch", "git_branch", [
         Value("dynamic-frames", "osdi20-artifact-dynamic-frames-vertime"),
@@ -45,6 +50,52 @@ def constructSuite(nReplicas):
     suite = Suite(SUITE_NAME, sourceVariable, replicaVariable, branchVariable)
     return suite
 
+def estimate_key(variant):
+    # replicas of a variant take the same time
+    return "-".join(val.label for val in variant.values if val.variable.label != "replica")
+
+def verified_seconds(path):
+    """Sum of per-symbol verification times in a result file. That's CPU
+    time rather than wall time, but ranks sources the same way."""
+    total = 0.0
+    with open(path, errors="replace") as fp:
+        for line in fp:
+            mo = re.search(r"\[([0-9.]+) s,.*\]  verified", line)
+            if mo is not None:
+                total += float(mo.group(1))
+    return total
+
+def expected_durations(suite):
+    """idx -> expected seconds. Prefers wall times from earlier suite logs;
+    variants seen only in verification-time data get their summed symbol
+    times, rescaled to wall time by the median ratio where both exist."""
+    key_for_label = dict((variant.get_label(), estimate_key(variant)) for variant in suite.iter_variants())
+
+    def by_key(label_durations):
+        samples = {}
+        for label, seconds in label_durations.items():
+            if label in key_for_label:
+                samples.setdefault(key_for_label[label], []).append(seconds)
+        return dict((key, median(ts)) for key, ts in samples.items())
+
+    wall = by_key(load_task_durations(glob.glob(PRIOR_LOGS)))
+    # expresults/<suite>-<label>.data; suite labels contain no '-'
+    cpu = by_key(dict(
+        (os.path.basename(path)[:-len(".data")].partition("-")[2], verified_seconds(path))
+        for path in glob.glob(PRIOR_RESULTS)))
+    ratios = [wall[key] / cpu[key] for key in wall if cpu.get(key)]
+    ratio = median(ratios) if ratios else 1.0
+
+    durations = {}
+    for idx, variant in enumerate(suite.variants):
+        key = estimate_key(variant)
+        if key in wall:
+            durations[idx] = wall[key]
+        elif cpu.get(key):
+            durations[idx] = cpu[key] * ratio
+    log("DURATION_ESTIMATES %d of %d variants" % (len(durations), len(suite.variants)))
+    return durations
+
 RUN_VERI_PATH="tools/run-veri-config-experiment.py"
 
 def main():
@@ -64,15 +115,19 @@ def main():
         return Command(str(variant), cmd)
 
     suite = constructSuite(N_REPLICAS)
-    set_logfile(suite.logpath())
+    set_logfile(suite.logpath(), resume=args.resume)
     #log("VARIANTS %s" % suite.variants)
 
-    for variant in suite.variants:
+    for variant in suite.iter_variants():
         log("VARIANT %s" % variant)
     log("NUM_SOURCES %s" % len(listSources()))
     log("NUM_VARIANTS %s" % len(suite.variants))
 
-    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=args.ssd)
-    sequenced_launcher(workers, len(suite.variants), cmd_for_idx, dry_run=args.dry_run)
+    workers = retrieve_running_workers(workers_file=args.workers_file, ssd=args.ssd, skip_quarantined=True)
+    todo = incomplete_variants(suite.variants, workers, kind="dafny") if args.resume else list(range(len(suite.variants)))
+    durations = expected_durations(suite)
+    sequenced_launcher(workers, len(todo), lambda idx, worker: cmd_for_idx(todo[idx], worker),
+        dry_run=args.dry_run,
+        expected_durations=dict((i, durations[idx]) for i, idx in enumerate(todo) if idx in durations))
 
 main()
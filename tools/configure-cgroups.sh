@@ -10,5 +10,8 @@ set -e
 
 MEM=`python -c "print 2 * 1024 * 1024 * 1024"`
 
-echo $MEM > /sys/fs/cgroup/memory/VeribetrfsExp/memory.limit_in_bytes
-echo 0    > /sys/fs/cgroup/memory/VeribetrfsExp/memory.swappiness
+# optional argument: cgroup name (packed experiments use one per slot)
+CGROUP=${1:-VeribetrfsExp}
+
+echo $MEM > /sys/fs/cgroup/memory/$CGROUP/memory.limit_in_bytes
+echo 0    > /sys/fs/cgroup/memory/$CGROUP/memory.swappiness
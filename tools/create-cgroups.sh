@@ -10,4 +10,7 @@ set -x
 USER=`id -u -n`
 GROUP=`id -g -n`
 
-sudo cgcreate -a $USER:$GROUP -t $USER:$GROUP -g memory:VeribetrfsExp
+# optional argument: cgroup name (packed experiments use one per slot)
+CGROUP=${1:-VeribetrfsExp}
+
+sudo cgcreate -a $USER:$GROUP -t $USER:$GROUP -g memory:$CGROUP
@@ -2,63 +2,27 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import sys
-import re
+import dafny_index
 
 try:
-    file = open(sys.argv[1])
+    index = dafny_index.load(sys.argv[1])
 except:
     sys.exit(0)
 
-re_datatype = re.compile("^(linear )?datatype ([A-Za-z0-9_]+)")
-re_type = re.compile("^type ([A-Za-z0-9_]+)")
-re_function = re.compile("^function( method)?( \{.+\})? ([A-Za-z0-9_]+)")
-re_predicate = re.compile("^predicate( method)?( \{.+\})? ([A-Za-z0-9_]+)")
-re_lemma = re.compile("^lemma ([A-Za-z0-9_]+)")
-re_protected = re.compile("^protected (function|predicate) ([A-Za-z0-9_]+)")
+# Unmodified (but possibly linear) datatypes, types, and non-opaque
+# functions and predicates; lemmas and protected definitions stay hidden.
+EXPORTED_KINDS = ["datatype", "type"] + list(dafny_index.FUNCTION_KINDS)
 
-exports = set()
+exports = []
 
-for line in file:
-    line = line.strip()
-
-    if ":opaque" in line:
-        continue
-
-    match = re.match(re_datatype, line)
-
-    if match:
-        exports.add(match.group(2))
-        # print(match.group(1))
+for decl in index.find(kinds=EXPORTED_KINDS):
+    if decl.has_attribute("opaque"):
         continue
-    
-    match = re.match(re_type, line)
-    if match:
-        exports.add(match.group(1))
-        # print(match.group(1))
+    allowed_modifiers = ["linear"] if decl.kind == "datatype" else []
+    if any(m not in allowed_modifiers for m in decl.modifiers):
         continue
-
-    match = re.match(re_function, line)
-
-    if match:
-        exports.add(match.group(3))
-        # print(match.group(3))
-        continue
-
-    match = re.match(re_predicate, line)
-    if match:
-        exports.add(match.group(3))
-        continue
-
-    # match = re.match(re_lemma, line)
-    # if match:
-    #     exports.add(match.group(1))
-    #     # print(match.group(1))
-    #     continue
-
-    # match = re.match(re_protected, line)
-    # if match:
-    #     print(match.group(2))
-    #     continue
+    if decl.name not in exports:
+        exports.append(decl.name)
 
 exports = """
 // begin generated export
@@ -69,4 +33,4 @@ exports = """
 // end generated export
     """ % (", ".join(exports))
 
-print(exports)
\ No newline at end of file
+print(exports)
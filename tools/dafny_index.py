@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Symbol index over Dafny sources, shared by the tools that used to scan
+# .dfy files with their own regexes (automation-study.py,
+# plot/plot-verification-time.py, dafny-export-set.py, lib_aggregate.py).
+#
+# Each file is tokenized once, comment-aware (Dafny's /* */ nest) and
+# string-aware, into:
+#   declarations  kind, name, line, {:attributes}, modifiers (ghost,
+#                 linear, ...) and the modifies/reads clauses of callables
+#   uses          identifier -> lines on which it appears
+# Indexes are cached on disk by file content under build/dafny-index, so
+# a file is only re-tokenized when it changes.
+#
+#   tools/dafny_index.py <file.dfy>...          list declarations
+#   tools/dafny_index.py --uses NAME <file>...  lines mentioning NAME
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "build", "dafny-index")
+
+# Declaration keywords. "function method" and "predicate method" are kinds
+# of their own, as Dafny spells them.
+DECL_KINDS = set([
+    "module", "class", "trait", "datatype", "codatatype", "type", "newtype",
+    "function", "predicate", "method", "lemma", "constructor", "iterator",
+    "const", "copredicate", "colemma",
+])
+CALLABLE_KINDS = set([
+    "function", "function method", "predicate", "predicate method", "method",
+    "lemma", "constructor", "iterator", "copredicate", "colemma",
+])
+FUNCTION_KINDS = set(["function", "function method", "predicate", "predicate method"])
+MODIFIERS = set([
+    "ghost", "static", "protected", "linear", "shared", "abstract", "inductive",
+    "least", "greatest", "twostate",
+])
+CLAUSES = set(["modifies", "reads"])
+
+IDENT = "ident"
+NUMBER = "number"
+STRING = "string"
+CHAR = "char"
+PUNCT = "punct"
+
+_token_re = re.compile(r"""
+    (?P<space>[ \t\r\f\v]+)
+  | (?P<newline>\n)
+  | (?P<line_comment>//[^\n]*)
+  | (?P<block_comment>/\*)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_'?]*)
+  | (?P<number>0x[0-9A-Fa-f_]+|[0-9][0-9_]*(\.[0-9][0-9_]*)?)
+  | (?P<string>@"([^"]|"")*"|"([^"\\\n]|\\.)*")
+  | (?P<char>'([^'\\\n]|\\u[0-9A-Fa-f]{4}|\\.)')
+  | (?P<attribute>\{:)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+def tokenize(text):
+    """[(kind, text, line)] for text, dropping whitespace and comments. One
+    left-to-right pass; nested block comments are skipped by depth."""
+    tokens = []
+    line = 1
+    pos = 0
+    n = len(text)
+    while pos < n:
+        mo = _token_re.match(text, pos)
+        kind = mo.lastgroup
+        value = mo.group(kind)
+        pos = mo.end()
+        if kind == "space" or kind == "line_comment":
+            continue
+        if kind == "newline":
+            line += 1
+            continue
+        if kind == "block_comment":
+            depth = 1
+            while depth > 0 and pos < n:
+                if text.startswith("/*", pos):
+                    depth += 1
+                    pos += 2
+                elif text.startswith("*/", pos):
+                    depth -= 1
+                    pos += 2
+                else:
+                    if text[pos] == "\n":
+                        line += 1
+                    pos += 1
+            continue
+        if kind == "attribute":
+            kind = PUNCT
+        tokens.append((kind, value, line))
+        if kind == STRING:
+            line += value.count("\n")
+    return tokens
+
+class Declaration:
+    def __init__(self, kind, name, line, attributes=None, modifiers=None, clauses=None):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.attributes = attributes or []     # e.g. ["opaque"]
+        self.modifiers = modifiers or []       # e.g. ["ghost", "static"]
+        self.clauses = clauses or []           # subset of CLAUSES, in order seen
+
+    def has_attribute(self, attribute):
+        return attribute in self.attributes
+
+    def is_callable(self):
+        return self.kind in CALLABLE_KINDS
+
+    def to_json(self):
+        return {"kind": self.kind, "name": self.name, "line": self.line,
+                "attributes": self.attributes, "modifiers": self.modifiers, "clauses": self.clauses}
+
+    @staticmethod
+    def from_json(obj):
+        return Declaration(obj["kind"], obj["name"], obj["line"], obj["attributes"], obj["modifiers"], obj["clauses"])
+
+    def __repr__(self):
+        return "%d %s %s%s%s" % (self.line, self.kind, self.name,
+                "".join(" {:%s}" % a for a in self.attributes),
+                "".join(" " + c for c in self.clauses))
+
+def skip_attribute(tokens, i):
+    """tokens[i] is "{:"; returns (attribute name, index past its closing brace)."""
+    name = tokens[i+1][1] if i+1 < len(tokens) and tokens[i+1][0] == IDENT else ""
+    depth = 0
+    while i < len(tokens):
+        kind, value, line = tokens[i]
+        if kind == PUNCT and value in ("{:", "{"):
+            depth += 1
+        elif kind == PUNCT and value == "}":
+            depth -= 1
+            if depth == 0:
+                return name, i+1
+        i += 1
+    return name, i
+
+def parse_declarations(tokens):
+    decls = []
+    current_callable = None
+    i = 0
+    while i < len(tokens):
+        kind, value, line = tokens[i]
+        if kind != IDENT:
+            i += 1
+            continue
+        if value in CLAUSES:
+            if current_callable is not None and value not in current_callable.clauses:
+                current_callable.clauses.append(value)
+            i += 1
+            continue
+        if value not in DECL_KINDS:
+            i += 1
+            continue
+
+        modifiers = []
+        j = i - 1
+        while j >= 0 and tokens[j][0] == IDENT and tokens[j][1] in MODIFIERS:
+            modifiers.insert(0, tokens[j][1])
+            j -= 1
+        decl_kind = value
+        i += 1
+        if decl_kind in ("function", "predicate") and i < len(tokens) and tokens[i][1] == "method":
+            decl_kind += " method"
+            i += 1
+        attributes = []
+        while i < len(tokens) and tokens[i][1] == "{:":
+            attribute, i = skip_attribute(tokens, i)
+            attributes.append(attribute)
+        name = ""   # anonymous constructors
+        if i < len(tokens) and tokens[i][0] == IDENT:
+            name = tokens[i][1]
+            i += 1
+        decl = Declaration(decl_kind, name, line, attributes, modifiers)
+        decls.append(decl)
+        if decl.is_callable():
+            current_callable = decl
+    return decls
+
+def collect_uses(tokens):
+    uses = {}
+    for kind, value, line in tokens:
+        if kind == IDENT:
+            lines = uses.setdefault(value, [])
+            if not lines or lines[-1] != line:
+                lines.append(line)
+    return uses
+
+class FileIndex:
+    def __init__(self, path, declarations, uses):
+        self.path = path
+        self.declarations = declarations
+        self.uses = uses     # identifier -> sorted lines
+
+    @staticmethod
+    def from_text(path, text):
+        tokens = tokenize(text)
+        return FileIndex(path, parse_declarations(tokens), collect_uses(tokens))
+
+    def to_json(self):
+        return {"declarations": [d.to_json() for d in self.declarations], "uses": self.uses}
+
+    @staticmethod
+    def from_json(path, obj):
+        return FileIndex(path, [Declaration.from_json(d) for d in obj["declarations"]], obj["uses"])
+
+    def find(self, kinds=None, name=None, attribute=None):
+        return [d for d in self.declarations
+                if (kinds is None or d.kind in kinds)
+                and (name is None or d.name == name)
+                and (attribute is None or d.has_attribute(attribute))]
+
+    def declaration(self, name):
+        """The last declaration of name in this file (modules may repeat
+        names; the last one wins, as it would in a flat symbol table)."""
+        found = self.find(name=name)
+        return found[-1] if found else None
+
+    def lines_using(self, name):
+        return self.uses.get(name, [])
+
+    def has_clause(self, clauses=CLAUSES):
+        return any(c in clauses for d in self.declarations for c in d.clauses)
+
+def _index_version():
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+# Hashed once per process: indexes are only as current as this tokenizer.
+_INDEX_VERSION = _index_version()
+
+_memo = {}
+
+def load(path, cache_dir=CACHE_DIR):
+    """FileIndex for path, from the on-disk cache when its content is unchanged."""
+    with open(path, "rb") as f:
+        content = f.read()
+    key = hashlib.sha256(_INDEX_VERSION.encode("utf-8") + content).hexdigest()
+    if key in _memo:
+        return FileIndex(path, _memo[key].declarations, _memo[key].uses)
+    cache_path = os.path.join(cache_dir, key[:2], key + ".json")
+    index = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as fp:
+                index = FileIndex.from_json(path, json.load(fp))
+        except (OSError, ValueError, KeyError):
+            index = None
+    if index is None:
+        index = FileIndex.from_text(path, content.decode("utf-8", errors="replace"))
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp = "%s.tmp%d" % (cache_path, os.getpid())
+            with open(tmp, "w") as fp:
+                json.dump(index.to_json(), fp)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass    # read-only tree: index without caching
+    _memo[key] = index
+    return index
+
+class DafnyIndex:
+    """Query over many files: paths in, FileIndexes loaded on demand."""
+    def __init__(self, paths, cache_dir=CACHE_DIR):
+        self.files = [load(path, cache_dir) for path in paths]
+
+    def find(self, kinds=None, name=None, attribute=None):
+        """[(FileIndex, Declaration)]"""
+        return [(f, d) for f in self.files for d in f.find(kinds, name, attribute)]
+
+    def lines_using(self, name):
+        """[(path, line)] for each line, in any file, that mentions name."""
+        return [(f.path, line) for f in self.files for line in f.lines_using(name)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Index Dafny declarations and identifier uses.")
+    parser.add_argument("--uses", help="list the lines that mention this identifier")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    index = DafnyIndex(args.paths)
+    if args.uses:
+        for path, line in index.lines_using(args.uses):
+            print("%s:%d" % (path, line))
+    else:
+        for f, decl in index.find():
+            print("%s:%s" % (f.path, decl))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Library of post-load database images, so YCSB runs can skip the load phase
+# (YcsbMain --preloaded) and start from a known-good loaded state.
+#
+# A snapshot is identified by a fingerprint of everything that determines
+# the loaded database: the system, the code commit, the build/tuning
+# configuration and the load workload spec's contents. Images are copied
+# with reflinks where the filesystem supports them and sparsely otherwise,
+# so storing and restoring a mostly-empty 16GiB veri image is cheap.
+#
+# run-veri-config-experiment.py snapshot=auto creates and restores these.
+# By hand:
+#   tools/db_snapshots.py list
+#   tools/db_snapshots.py remove <id>
+#   tools/db_snapshots.py gc --keep 8
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+SNAPSHOT_DIR = os.environ.get("VERIBETRFS_SNAPSHOTS", "/mnt/xvde/archives/snapshots")
+
+def fingerprint(system, git_commit, config, load_workload_path):
+    """(id, ident): ident is the dict of inputs, id a short hash of it."""
+    with open(load_workload_path, "rb") as f:
+        workload_hash = hashlib.sha256(f.read()).hexdigest()
+    ident = {
+        "system": system,
+        "git_commit": git_commit,
+        "config": config,
+        "load_workload": os.path.basename(load_workload_path),
+        "load_workload_sha256": workload_hash,
+    }
+    blob = json.dumps(ident, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:20], ident
+
+def copy_db(src, dst):
+    """Copy a database file or directory, sharing extents if possible."""
+    if os.path.isdir(src):
+        os.makedirs(dst, exist_ok=True)
+        src = os.path.join(src, ".")
+    ret = subprocess.call(["cp", "-a", "--reflink=auto", "--sparse=always", src, dst])
+    assert ret == 0, "copy %s -> %s failed" % (src, dst)
+
+class SnapshotStore:
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+
+    def entry(self, snap_id):
+        return os.path.join(self.root, snap_id)
+
+    def exists(self, snap_id):
+        return os.path.exists(os.path.join(self.entry(snap_id), "meta.json"))
+
+    def meta(self, snap_id):
+        with open(os.path.join(self.entry(snap_id), "meta.json")) as f:
+            return json.load(f)
+
+    def save(self, snap_id, ident, db_path):
+        """Store db_path (file or directory) as snapshot snap_id. Written to
+        a temporary name first, so a crash never leaves a half snapshot."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.entry(snap_id) + ".tmp%d" % os.getpid()
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        copy_db(db_path, os.path.join(tmp, "db"))
+        meta = dict(ident)
+        meta["id"] = snap_id
+        meta["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        shutil.rmtree(self.entry(snap_id), ignore_errors=True)
+        os.rename(tmp, self.entry(snap_id))
+
+    def restore(self, snap_id, db_path):
+        copy_db(os.path.join(self.entry(snap_id), "db"), db_path)
+        os.utime(self.entry(snap_id))  # mark recently used, for gc
+
+    def ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [e for e in os.listdir(self.root) if self.exists(e)]
+
+    def remove(self, snap_id):
+        shutil.rmtree(self.entry(snap_id))
+
+    def gc(self, keep):
+        """Drop all but the keep most recently used snapshots."""
+        ids = sorted(self.ids(), key=lambda e: os.path.getmtime(self.entry(e)), reverse=True)
+        for snap_id in ids[keep:]:
+            self.remove(snap_id)
+        return ids[keep:]
+
+def disk_usage(path):
+    out = subprocess.run(["du", "-sh", path], stdout=subprocess.PIPE).stdout.decode("utf-8")
+    return out.split()[0] if out else "?"
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage preloaded YCSB database snapshots.")
+    parser.add_argument("--root", default=SNAPSHOT_DIR)
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("list")
+    remove = sub.add_parser("remove")
+    remove.add_argument("ids", nargs="+")
+    gc = sub.add_parser("gc")
+    gc.add_argument("--keep", type=int, default=8)
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.root)
+    if args.cmd == "remove":
+        for snap_id in args.ids:
+            store.remove(snap_id)
+    elif args.cmd == "gc":
+        for snap_id in store.gc(args.keep):
+            print("removed %s" % snap_id)
+    else:
+        for snap_id in store.ids():
+            meta = store.meta(snap_id)
+            print("%s  %s  %-8s %s %s  %s  %s" % (
+                snap_id, meta["created"], meta["system"], meta["git_commit"][:10],
+                meta["load_workload"], disk_usage(os.path.join(store.entry(snap_id), "db")),
+                json.dumps(meta["config"], sort_keys=True)))
+
+if __name__ == "__main__":
+    main()
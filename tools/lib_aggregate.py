@@ -3,6 +3,7 @@
 
 import sys
 import re
+import dafny_index
 
 # report file types
 SYNCHK = "synchk"
@@ -88,13 +89,7 @@ def hasDisallowedAssumptions(verchk):
     return False
 
 def hasDynamicFrames(verchk):
-    dfy = dafnyFromVerchk(verchk)
-    for line in open(dfy).readlines():
-        if re.compile("^\s*modifies").search(line):
-            return True
-        if re.compile("^\s*reads").search(line):
-            return True
-    return False
+    return dafny_index.load(dafnyFromVerchk(verchk)).has_clause()
 
 def extractCondition(reportType, report, content):
     # Extract Dafny verification result
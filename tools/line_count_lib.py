@@ -9,9 +9,12 @@
 
 import os
 import re
-import shutil
+import sys
+import json
+import hashlib
 import subprocess
-import random
+import concurrent.futures
+import lib_deps
 
 class DafnyFile:
   def __init__(self, filename, verify_time):
@@ -27,14 +30,56 @@ class DafnyFile:
   def is_spec(self):
     return self.filename.endswith(".s.dfy")
 
+def count_sloc(program):
+  """Physical source lines of code, as sloccount's C counter (c_count)
+  reckons them: a line counts if anything other than whitespace remains
+  once // and /* */ comments are removed. Comment markers inside string
+  and character literals are not comments."""
+  sloc = 0
+  in_comment = False
+  for line in program.split("\n"):
+    has_code = False
+    i = 0
+    n = len(line)
+    while i < n:
+      if in_comment:
+        end = line.find("*/", i)
+        if end < 0:
+          break
+        in_comment = False
+        i = end + 2
+        continue
+      c = line[i]
+      if c == "/" and line.startswith("//", i):
+        break
+      if c == "/" and line.startswith("/*", i):
+        in_comment = True
+        i += 2
+        continue
+      if not c.isspace():
+        has_code = True
+      if c == '"' or c == "'":
+        # skip the literal; an unterminated one ends with the line
+        i += 1
+        while i < n and line[i] != c:
+          i += 2 if line[i] == "\\" else 1
+      i += 1
+    if has_code:
+      sloc += 1
+  return sloc
+
 # We'll leave copies of counted files here so we can inspect the counting filters for sanity.
 INSPECT_DIR = "./tmp/inspect"
 
 class Counter:
-    def __init__(self, iron_base):
+    def __init__(self, iron_base, jobs=None):
         self.iron_base = iron_base
+        # Dafny prints run in parallel; each is a separate process that
+        # re-parses and resolves the file's whole include tree, so they
+        # dominate the cost of counting.
+        self.jobs = jobs or os.cpu_count() or 1
 
-    def run_dafny(self, show_ghost, dafny_filename, tmp_filename):
+    def dafny_command(self, show_ghost, dafny_filename):
       executable = self.iron_base + "/.dafny/dafny/Binaries/dafny"
       args  = [] 
       args += ["/rprint:-"]
@@ -48,55 +93,35 @@ class Counter:
       else:
         args += ["/printMode:NoGhost"]
       args += [dafny_filename]
+      return [executable] + args
 
-      tmp_file = open(tmp_filename, "w")
-      #print [executable] + args
-      subprocess.call([executable] + args, shell=False, stdout=tmp_file)
-      tmp_file.close()
-
-    def run_sloccount(self, tmp_dir):
-      data_dir = tmp_dir + "_data"
-      os.makedirs(data_dir)
-      executable = "sloccount"
-      args  = [] 
-      args += ["--datadir"]
-      args += [data_dir]
-      args += ["--details"]
-      args += [tmp_dir]
-
-      sloc = -1
+    def run_dafny(self, show_ghost, dafny_filename):
+      """The program as Dafny prints it. Raises if Dafny fails (missing
+      binary, parse or resolution error, crash) rather than letting an
+      empty or partial print count as the program."""
       #print [executable] + args
-      cmd = [executable] + args
-      #print(" ".join(cmd))
-      output = subprocess.check_output(cmd) #, shell=True)
-      output = output.decode("utf-8")
-      for line in output.split('\n'):
-        result = re.search("(\d+)\s+cs", line)  # TODO(jonh): hack dfy->cs
-        if result:
-          sloc = result.group(1)
-      if sloc == -1:
-        print("pid %d sloc cmd: >> %s <<" % (os.getpid(), " ".join(cmd)))
-        print("pid %d sloc output: >>%s<<" % (os.getpid(), output))
-        raise Exception("Failed to find sloccount result! in %s" % tmp_dir)
-      shutil.rmtree(data_dir)
-      return sloc
+      command = self.dafny_command(show_ghost, dafny_filename)
+      result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+      if result.returncode != 0:
+        raise Exception("Dafny print failed (exit %d) for %s: %s\n%s" % (
+          result.returncode, dafny_filename, " ".join(command),
+          (result.stderr + result.stdout).decode("utf-8", errors="replace").strip()))
+      return result.stdout.decode("utf-8")
 
     # Remove detritus from running Dafny
-    def clean_dafny_output(self, filename, inspect_path):
-      program = open(filename).read()#.decode("utf-8")
-
+    def clean_dafny_output(self, program, inspect_path):
       program = self.remove_warnings(program)
       program = self.remove_paired_comments(program)
       program = self.remove_cruft(program)
       program = self.remove_whitespace(program)
 
-      open(filename, "w").write(program)
       try:
         os.makedirs(os.path.dirname(inspect_path))
       except FileExistsError:
         pass
       print("inspect at %s" % inspect_path)
       open(inspect_path, "w").write(program)
+      return program
 
     def remove_warnings(self, program):
       """strip out stdout gunk from running Dafny."""
@@ -114,7 +139,7 @@ class Counter:
       return "\n".join(clean)
 
     def remove_paired_comments(self, program):
-      """Dafny emits annotations as /*blah /*blah*/ blah*/, and sloccount counts it wrong."""
+      """Dafny emits annotations as /*blah /*blah*/ blah*/, and count_sloc counts it wrong."""
       regions = re.compile("(/\*|\*/)").split(program)
       depth = 0
       output = []
@@ -161,39 +186,142 @@ class Counter:
           clean.append(line)
       return "\n".join(clean)
 
-    def compute_sloc(self, show_ghost, dafny_file):
-      tmp_dir = self.make_tmp_dir()
-      dafny_dir = os.path.dirname(dafny_file)
-      dafny_base = os.path.basename(dafny_file)
-      # jonh: name the dafny output .cs to get sloccount to count it.
-      tmp_filename = "%s-%s.cs" % (dafny_base, ("ghost" if show_ghost else "real"))
-      tmp_file = os.path.join(tmp_dir, tmp_filename)
+    def print_name(self, show_ghost, dafny_file):
+      return "%s-%s.dfy" % (os.path.basename(dafny_file), ("ghost" if show_ghost else "real"))
 
-      self.run_dafny(show_ghost, dafny_file, tmp_file)
-      inspect_path = os.path.join(os.path.join(INSPECT_DIR, dafny_dir), tmp_filename)
-      self.clean_dafny_output(tmp_file, inspect_path)
-      sloc = self.run_sloccount(tmp_dir)
+    def compute_slocs(self, passes):
+      """passes: [(show_ghost, dafny_filename)]. Runs the Dafny prints
+      self.jobs at a time and counts each cleaned print in memory.
+      Returns the slocs in the same order."""
+      with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+        programs = list(pool.map(lambda p: self.run_dafny(*p), passes))
 
-      os.remove(tmp_file)
-      os.rmdir(tmp_dir)
-
-      return int(sloc)
-
-    def make_tmp_dir(self):
-      tmp_dir = self.iron_base + "/tmp/linecounts_%x" % random.randint(0, 1<<31)
-      if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
-      #print("tmp dir: %s" % tmp_dir)
-      return tmp_dir
+      slocs = []
+      for (show_ghost, dafny_file), program in zip(passes, programs):
+        inspect_path = os.path.join(INSPECT_DIR, os.path.dirname(dafny_file), self.print_name(show_ghost, dafny_file))
+        slocs.append(count_sloc(self.clean_dafny_output(program, inspect_path)))
+      return slocs
 
     def collect_line_counts(self, dafny_files):
+      passes = []
       for f in dafny_files:
-        ghost_sloc = self.compute_sloc(True, f.filename)
+        passes.append((True, f.filename))
+        if not f.is_spec():
+          passes.append((False, f.filename))
+      slocs = dict(zip(passes, self.compute_slocs(passes)))
+
+      for f in dafny_files:
+        ghost_sloc = slocs[(True, f.filename)]
 
         if f.is_spec():
           f.spec = ghost_sloc
           f.verify_time = 0
         else:
-          impl_sloc = self.compute_sloc(False, f.filename)
+          impl_sloc = slocs[(False, f.filename)]
           f.impl = impl_sloc
           f.proof = ghost_sloc - impl_sloc
+
+def count_one(filename):
+  """(spec, impl, proof) for one file; module-level so a process pool can run it."""
+  dafny_file = DafnyFile(filename, 0.0)
+  Counter(".", jobs=1).collect_line_counts([dafny_file])
+  return (dafny_file.spec, dafny_file.impl, dafny_file.proof)
+
+def _rules_hash():
+  # Counts are only as current as the rules that produced them.
+  with open(os.path.abspath(__file__), "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+class CountCache:
+  """Line counts keyed by the counting rules and the content of the .dfy
+  file and of every file it transitively includes, so they stay valid
+  across checkouts and touches that would make the per-file .lc targets
+  look stale to make. Dafny parses and resolves the whole include tree
+  before it prints even a NoIncludes view, so an edit anywhere in that
+  closure (including fixing a broken include) gets the file counted again.
+  Only successful counts are stored."""
+  def __init__(self, path="build/lc-cache.json"):
+    self.path = path
+    self.rules = _rules_hash()
+    self.entries = {}
+    self.digests = {}     # path -> content sha256, per run
+    self.includes = {}    # path -> included paths, per run
+    if os.path.exists(path):
+      with open(path) as fp:
+        self.entries = json.load(fp)
+
+  def read(self, filename):
+    if filename not in self.digests:
+      try:
+        with open(filename, "rb") as f:
+          content = f.read()
+      except OSError:
+        # Dafny will fail on it, so nothing keyed on this gets stored
+        content = None
+      self.digests[filename] = hashlib.sha256(content).hexdigest() if content is not None else "missing"
+      includes = []
+      if content is not None:
+        for line in content.decode("utf-8", errors="replace").split("\n"):
+          included = lib_deps.fileFromIncludeLine(line)
+          if included is not None:
+            includes.append(os.path.normpath(os.path.join(os.path.dirname(filename), included)))
+      self.includes[filename] = includes
+    return self.digests[filename]
+
+  def closure(self, filename):
+    """filename and every file it transitively includes, sorted."""
+    seen = set()
+    pending = [os.path.normpath(filename)]
+    while pending:
+      path = pending.pop()
+      if path in seen:
+        continue
+      seen.add(path)
+      self.read(path)
+      pending.extend(self.includes[path])
+    return sorted(seen)
+
+  def key(self, filename):
+    h = hashlib.sha256((self.rules + "\0" + filename + "\0").encode("utf-8"))
+    for path in self.closure(filename):
+      h.update(("%s\0%s\0" % (path, self.read(path))).encode("utf-8"))
+    return h.hexdigest()
+
+  def get(self, key):
+    return self.entries.get(key)
+
+  def put(self, key, counts):
+    self.entries[key] = counts
+
+  def save(self):
+    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+    tmp = self.path + ".tmp"
+    with open(tmp, "w") as fp:
+      json.dump(self.entries, fp, sort_keys=True)
+    os.replace(tmp, self.path)
+
+def count_files(filenames, cache, jobs=None):
+  """{filename: {"spec", "impl", "proof"}}, counting only the files the
+  cache doesn't already know, jobs processes at a time. Raises, after
+  saving the counts that did succeed, if any file fails to count."""
+  keys = dict((f, cache.key(f)) for f in filenames)
+  missing = [f for f in filenames if cache.get(keys[f]) is None]
+  if missing:
+    print("counting %d of %d files" % (len(missing), len(filenames)))
+  failed = []
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+    futures = dict((pool.submit(count_one, f), f) for f in missing)
+    for future in concurrent.futures.as_completed(futures):
+      f = futures[future]
+      try:
+        spec, impl, proof = future.result()
+      except Exception as e:
+        # not cached, so the next run retries it
+        sys.stderr.write("counting %s failed: %s\n" % (f, e))
+        failed.append(f)
+        continue
+      cache.put(keys[f], {"spec": spec, "impl": impl, "proof": proof})
+  cache.save()
+  if failed:
+    raise Exception("failed to count %d files: %s" % (len(failed), " ".join(sorted(failed))))
+  return dict((f, cache.get(keys[f])) for f in filenames)
@@ -15,6 +15,11 @@ Processing individual files is slow, so we'll use make to preserve results.
 all others -> proof
 
 Then an aggregator extracts numbers from those line-count files.
+
+--mode tree skips make: it counts the input and everything it includes in
+a process pool, reusing counts cached by the content of each file and its
+includes (build/lc-cache.json), and writes all the reports from the one set
+of counts. A file Dafny fails to print is left uncached and fails the run.
 """
 
 import sys
@@ -25,9 +30,11 @@ import argparse
 import json
 
 parser = argparse.ArgumentParser(description="Count lines of Iron* code and categorize.")
-parser.add_argument("--mode", dest="mode", help="count: count one file. report: gather a report for this file and its dependencies", required=True, choices=["count", "report"])
-parser.add_argument("--input", dest="input", help=".dfy file to process", required=True)
-parser.add_argument("--output", dest="output", help="build file to write result", required=True)
+parser.add_argument("--mode", dest="mode", help="count: count one file. report: gather a report for this file and its dependencies", required=True, choices=["count", "report", "tree"])
+parser.add_argument("--input", dest="input", nargs="+", help=".dfy file(s) to process; count mode takes many at once", required=True)
+parser.add_argument("--output", dest="output", nargs="+", help="build file(s) to write results, one per input", required=True)
+parser.add_argument("--jobs", dest="jobs", type=int, help="Dafny processes to run at once (default: one per cpu)")
+parser.add_argument("--json", dest="json", help="report/tree: also write per-file and per-group counts as JSON here")
 
 def loadFile(synchk):
     return line_count_lib.DafnyFile(
@@ -44,22 +51,33 @@ def loadFile(synchk):
 # that's both abstract and implementation. But we sure shouldn't be
 # billing Model code to impl; it's proof! Will look at the output.
 
-def count(input, output):
-    counter = line_count_lib.Counter(".")
-    dafnyFile = line_count_lib.DafnyFile(input, 0.0)
-    counter.collect_line_counts([dafnyFile])
-    obj = {"spec":dafnyFile.spec, "impl":dafnyFile.impl, "proof":dafnyFile.proof}
-    fp = open(output, "w")
-    json.dump(obj, fp)
-    fp.write("\n")
-    fp.close()
+def count(inputs, outputs, jobs=None):
+    if len(inputs) != len(outputs):
+        raise Exception("%d inputs but %d outputs" % (len(inputs), len(outputs)))
+    counter = line_count_lib.Counter(".", jobs)
+    dafnyFiles = [line_count_lib.DafnyFile(input, 0.0) for input in inputs]
+    counter.collect_line_counts(dafnyFiles)
+    for dafnyFile, output in zip(dafnyFiles, outputs):
+        obj = {"spec":dafnyFile.spec, "impl":dafnyFile.impl, "proof":dafnyFile.proof}
+        fp = open(output, "w")
+        json.dump(obj, fp)
+        fp.write("\n")
+        fp.close()
+
+def tree(input, output, json_output=None, jobs=None):
+    sources = [target.normPath for target in line_counter_report_lib.gatherTargets(input)]
+    counts = line_count_lib.count_files(sources, line_count_lib.CountCache(), jobs)
+    reports = [dict(counts[source], source=source) for source in sources]
+    line_counter_report_lib.write_reports(reports, output, json_output)
 
 def main():
     args = parser.parse_args()
     if args.mode == "count":
-        count(args.input, args.output)
+        count(args.input, args.output, args.jobs)
     elif args.mode == "report":
-        line_counter_report_lib.report(args.input, args.output)
+        line_counter_report_lib.report(args.input[0], args.output[0], args.json)
+    elif args.mode == "tree":
+        tree(args.input[0], args.output[0], args.json, args.jobs)
     else:
         raise Exception("argparse allowed bogus mode")
 
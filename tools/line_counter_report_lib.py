@@ -2,14 +2,17 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import collections
+import functools
 import lib_deps
 import json
 import os
 
-# make build/Impl/Bundle.i.lcreport -j4
-# (incremental report redraw:)
-# tools/line_counter.py --mode report --input Impl/Bundle.i.dfy --output build/Impl/Bundle.i.lcreport
+# make build/Impl/Bundle.i.lcreport
+# (the same, without make; counts cached in build/lc-cache.json:)
+# tools/line_counter.py --mode tree --input Impl/Bundle.i.dfy --output build/Impl/Bundle.i.lcreport
 # cp build/Impl/Bundle.i.lcreport ../veripapers/osdi2020/data/line-counts.tex
+# (report from per-file build/%.lc counts made some other way:)
+# tools/line_counter.py --mode report --input Impl/Bundle.i.dfy --output build/Impl/Bundle.i.lcreport
 
 def loadReport(iref):
     fp = open(lib_deps.targetName(iref, ".lc"))
@@ -17,11 +20,12 @@ def loadReport(iref):
     values["source"] = iref.normPath
     return values
 
-def gatherReports(input):
+def gatherTargets(input):
     TOP=lib_deps.IncludeReference(None, 0, input)
-    targets = [TOP] + lib_deps.depsFromDfySource(TOP)
-    reports = [loadReport(target) for target in targets]
-    return reports
+    return [TOP] + lib_deps.depsFromDfySource(TOP)
+
+def gatherReports(input):
+    return [loadReport(target) for target in gatherTargets(input)]
 
 # I should probably just dump stuff into an in-memory sqlite, huh?
 def accumulate(reports, mapper):
@@ -116,15 +120,20 @@ class DirMapper(Mapper):
         else:
             return dirpart
 
+@functools.lru_cache(maxsize=None)
+def loadClassifications(path="docs/file-classifications.txt"):
+    mapping = {}
+    for line in open(path).readlines():
+        categ,path = line.split()
+        if path.startswith("./"):
+            path = path[2:]
+        mapping[path] = categ
+    return mapping
+
 class ManualMapper(Mapper):
     def __init__(self):
         super().__init__()
-        self.mapping = {}
-        for line in open("docs/file-classifications.txt").readlines():
-            categ,path = line.split()
-            if path.startswith("./"):
-                path = path[2:]
-            self.mapping[path] = categ
+        self.mapping = loadClassifications()
 
     def map(self, report):
         source = report["source"]
@@ -132,16 +141,26 @@ class ManualMapper(Mapper):
             print("unmapped: ", source)
         return self.mapping.get(report["source"], "unmapped")
 
-def report(input, output):
-    reports = gatherReports(input)
-
+def summarize(reports):
     counters = accumulate(reports, AllMapper())
     counters.update(accumulate(reports, DirMapper()))
     counters.update(accumulate(reports, ManualMapper()))
+    return counters
+
+def write_json(fp, reports, counters):
+    json.dump({"files": reports, "groups": counters}, fp, sort_keys=True, indent=2)
+    fp.write("\n")
+
+def write_reports(reports, output, json_output=None):
+    counters = summarize(reports)
     fp = open(output, "w")
-#    json.dumps(counters, fp, sort_keys=True, indent=2)
-#    fp.write("\n")
     write_tex_table(fp, counters)
     write_table(fp, counters)
     fp.close()
+    if json_output is not None:
+        with open(json_output, "w") as fp:
+            write_json(fp, reports, counters)
+
+def report(input, output, json_output=None):
+    write_reports(gatherReports(input), output, json_output)
 
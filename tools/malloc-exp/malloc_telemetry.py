@@ -0,0 +1,272 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Malloc telemetry from a MallocAccounting-instrumented run, as NumPy arrays.
+# Shared by the plot-*.py scripts in this directory.
+#
+# One pass over the log collects:
+#   samples      one row per "os-map-total" line: OS mapping, heap mapping
+#                and malloc accounting total. The row number is the sample
+#                time t every other series is stamped with.
+#   scopes       "ma-scope" rows by label, as (n x 4) ARow matrices
+#   microscopes  "ma-microscope" rows by suffix word ("total", "esLarge", ...)
+#   histograms   "ma-fine-histogram {size:count,...}" lines, folded into
+#                power-of-two size buckets as they're read: a (time x
+#                bucket) matrix of counts and one of bytes. Only the last
+#                histogram is kept at exact sizes.
+#   ops, underlying, jemalloc
+#                "veribetrkv [op] sync", "allocationreport stop" and jemalloc
+#                "Allocated: .., active: .., mapped: .." lines
+#
+# Logs may be compressed (see plot/logreader.py). Older logs spell the
+# sample line "proc-heap <heap> <_> <malloc>" and print histograms as bare
+# "{...}" lines; both are accepted.
+
+import os
+import re
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plot"))
+from logreader import open_log
+
+field_width = 14+1
+arow_width = field_width*4 - 1
+
+AROW_FIELDS = ("total_count", "open_count", "total_byte", "open_byte")
+
+def parse_arow(s):
+    assert(len(s) == arow_width)
+    return [int(s[field_width*i:field_width*(i+1)]) for i in range(4)]
+
+def match_arow_line(token, line):
+    if not line.startswith(token + " "):
+        return None
+    arow = parse_arow(line[len(token)+1:len(token)+1+arow_width])
+    label = line[len(token)+1+arow_width+1:]
+    return (arow, label)
+
+def parse_histogram(text):
+    """(sizes, counts) arrays from "{size:count,size:count,}"; zero counts dropped."""
+    text = text.strip()
+    assert text[0] == "{" and text[-1] == "}", text
+    body = text[1:-1].replace(":", ",").strip(",")
+    if not body:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.array(body.split(","), dtype=np.int64).reshape(-1, 2)
+    keep = pairs[:, 1] > 0
+    return pairs[keep, 0], pairs[keep, 1]
+
+def step_align(ts, values, at):
+    """values (stamped ts, ascending) sampled at times at: the latest value
+    at or before each, NaN before the first. Never extrapolates past the
+    last stamp, either."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(at), np.nan)
+    if len(ts) == 0:
+        return out
+    idx = np.searchsorted(ts, at, side="right") - 1
+    ok = (idx >= 0) & (np.asarray(at) <= ts[-1])
+    out[ok] = values[idx[ok]]
+    return out
+
+class ARowTimeline:
+    """One accounting row over time: ts[i] is the sample time of rows[i]."""
+    def __init__(self, label, ts, rows):
+        self.label = label
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def field(self, name):
+        return self.rows[:, AROW_FIELDS.index(name)]
+
+    @property
+    def open_byte(self):
+        return self.field("open_byte")
+
+    @property
+    def open_count(self):
+        return self.field("open_count")
+
+    def at(self, at, field="open_byte"):
+        return step_align(self.ts, self.field(field), at)
+
+# Bucket k holds the sizes whose bit length is k, [2**(k-1), 2**k); bucket 0
+# holds size 0. The last bucket also takes anything larger.
+SIZE_BUCKETS = 49
+SIZE_EDGES = np.array([0] + [1 << k for k in range(SIZE_BUCKETS)], dtype=np.int64)
+
+def size_bucket(sizes):
+    # frexp's exponent is the bit length, exactly, for sizes below 2**53
+    _, exponent = np.frexp(np.asarray(sizes, dtype=np.float64))
+    return np.minimum(exponent, SIZE_BUCKETS - 1)
+
+class HistogramMatrix:
+    """Allocation size histograms over time, bucketed as they're appended:
+    counts[i, k] live allocations, and bytes[i, k] their requested bytes,
+    with sizes in [edges[k], edges[k+1]) at sample time ts[i]. Memory is
+    (samples x SIZE_BUCKETS) however many distinct sizes the run allocates.
+    last_sizes/last_counts keep the most recent histogram exactly."""
+    edges = SIZE_EDGES
+
+    def __init__(self):
+        self.rows = 0
+        self._ts = np.zeros(64, dtype=np.int64)
+        self._counts = np.zeros((64, SIZE_BUCKETS), dtype=np.int64)
+        self._bytes = np.zeros((64, SIZE_BUCKETS), dtype=np.int64)
+        self.last_sizes = np.zeros(0, dtype=np.int64)
+        self.last_counts = np.zeros(0, dtype=np.int64)
+
+    def append(self, t, sizes, counts):
+        if self.rows == len(self._ts):
+            # double, so appends stay amortized O(buckets)
+            self._ts = np.concatenate([self._ts, np.zeros_like(self._ts)])
+            self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+            self._bytes = np.concatenate([self._bytes, np.zeros_like(self._bytes)])
+        bucket = size_bucket(sizes)
+        self._ts[self.rows] = t
+        self._counts[self.rows] = np.bincount(bucket, weights=counts, minlength=SIZE_BUCKETS)
+        self._bytes[self.rows] = np.bincount(bucket, weights=counts * sizes, minlength=SIZE_BUCKETS)
+        self.rows += 1
+        order = np.argsort(sizes, kind="stable")
+        self.last_sizes = sizes[order]
+        self.last_counts = counts[order]
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def ts(self):
+        return self._ts[:self.rows]
+
+    @property
+    def counts(self):
+        return self._counts[:self.rows]
+
+    @property
+    def bytes(self):
+        return self._bytes[:self.rows]
+
+    def live_bytes(self):
+        """Requested bytes live at each sample."""
+        return self.bytes.sum(axis=1)
+
+    def live_count(self):
+        return self.counts.sum(axis=1)
+
+    def used_buckets(self):
+        """Indices of the buckets any sample has allocations in."""
+        return np.flatnonzero(self.counts.any(axis=0))
+
+    def cdf(self, by_size=False):
+        """(sizes, cumulative fraction) for the last histogram, by
+        allocation count or by bytes."""
+        sizes = self.last_sizes
+        weights = self.last_counts * sizes if by_size else self.last_counts
+        accum = np.cumsum(weights, dtype=np.float64)
+        return sizes, accum / accum[-1]
+
+_jemalloc_re = re.compile(r"Allocated: (\d+), active: (\d+), mapped: (\d+)")
+
+class MallocTelemetry:
+    def __init__(self, filename):
+        self.filename = filename
+        samples = []
+        scopes = {}
+        microscopes = {}
+        histograms = HistogramMatrix()
+        ops = []
+        underlying = []
+        jemalloc = []
+        t = 0
+        with open_log(filename) as fp:
+            for line in fp:
+                line = line.rstrip("\r\n")
+                if line.startswith("os-map-total"):
+                    fields = line.split()
+                    samples.append((int(fields[1]), int(fields[3]), int(fields[5])))
+                    t += 1
+                elif line.startswith("proc-heap"):
+                    fields = line.split()
+                    samples.append((np.nan, int(fields[1]), int(fields[3])))
+                    t += 1
+                elif line.startswith("ma-scope "):
+                    arow, label = match_arow_line("ma-scope", line)
+                    ts, rows = scopes.setdefault(label, ([], []))
+                    ts.append(t)
+                    rows.append(arow)
+                elif line.startswith("ma-microscope "):
+                    arow, label = match_arow_line("ma-microscope", line)
+                    label = label.split()[-1]   # suffix word. Sorry.
+                    ts, rows = microscopes.setdefault(label, ([], []))
+                    ts.append(t)
+                    rows.append(arow)
+                elif line.startswith("ma-fine-histogram {") or line.startswith("{"):
+                    histograms.append(t, *parse_histogram(line[line.index("{"):]))
+                elif line.startswith("veribetrkv [op] sync"):
+                    ops.append((t, int(line.split()[4])))
+                elif line.startswith("allocationreport stop underyling_count"):
+                    fields = line.split()
+                    underlying.append((t, int(fields[3]), int(fields[5])))
+                else:
+                    mo = _jemalloc_re.search(line)
+                    if mo:
+                        jemalloc.append((t,) + tuple(map(int, mo.groups())))
+
+        samples = np.array(samples, dtype=np.float64).reshape(-1, 3)
+        self.t = np.arange(len(samples))
+        self.os_map_total = samples[:, 0]
+        self.os_map_heap = samples[:, 1]
+        self.malloc_total = samples[:, 2]
+
+        self.scopes = dict((label, ARowTimeline(label, ts, rows)) for label, (ts, rows) in scopes.items())
+        self.microscopes = dict((label, ARowTimeline(label, ts, rows)) for label, (ts, rows) in microscopes.items())
+        self.histograms = histograms
+
+        ops = np.array(ops, dtype=np.int64).reshape(-1, 2)
+        self.ops_t, self.ops_completed = ops[:, 0], ops[:, 1]
+        underlying = np.array(underlying, dtype=np.int64).reshape(-1, 3)
+        self.underlying_t, self.underlying_count, self.underlying_bytes = underlying.T
+        jemalloc = np.array(jemalloc, dtype=np.int64).reshape(-1, 4)
+        self.jem_t, self.jem_allocated, self.jem_active, self.jem_mapped = jemalloc.T
+
+    def end_t(self):
+        return len(self.t) - 1
+
+    def fragmentation(self):
+        """Per-sample overhead ratios, each an array aligned with self.t
+        (NaN where an input is missing or zero):
+          os/malloc         address space mapped per byte malloc'd
+          heap/malloc       heap mapping per byte malloc'd
+          jem_mapped/malloc jemalloc's mapping per byte malloc'd
+          os/jem_mapped     mappings outside jemalloc's arenas
+          jem_active/alloc  jemalloc page-level fragmentation
+          requested/malloc  histogram bytes per accounted byte"""
+        malloc = self.malloc_total
+        jem_allocated = step_align(self.jem_t, self.jem_allocated, self.t)
+        jem_active = step_align(self.jem_t, self.jem_active, self.t)
+        jem_mapped = step_align(self.jem_t, self.jem_mapped, self.t)
+        requested = step_align(self.histograms.ts, self.histograms.live_bytes(), self.t)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            def ratio(a, b):
+                return np.where(b > 0, a / b, np.nan)
+            return {
+                "os/malloc": ratio(self.os_map_total, malloc),
+                "heap/malloc": ratio(self.os_map_heap, malloc),
+                "jem_mapped/malloc": ratio(jem_mapped, malloc),
+                "os/jem_mapped": ratio(self.os_map_total, jem_mapped),
+                "jem_active/alloc": ratio(jem_active, jem_allocated),
+                "requested/malloc": ratio(requested, malloc),
+            }
+
+    def throughput(self, window):
+        """(ts, ops/sec) over a trailing window of samples (one sample a
+        second), from the op counter stamped at each sample."""
+        completed = step_align(self.ops_t, self.ops_completed, self.t)
+        ts = self.t[window:]
+        rate = (completed[window:] - completed[:-window]) / float(window)
+        keep = ~np.isnan(rate)
+        return ts[keep], rate[keep]
@@ -6,66 +6,65 @@
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-import re
 import sys
+from malloc_telemetry import MallocTelemetry
 
 def parse(filename):
-    t = 0
-    os_map_total = {}
-    os_map_heap = {}
-    malloc_total = {}
-    for line in open(filename, "r").readlines():
-        fields = line.split()
-        if line.startswith("os-map-total"):
-            os_map_total[t] = int(fields[1])
-            os_map_heap[t] = int(fields[3])
-            malloc_total[t] = int(fields[5])
-            t += 1
-        if line.startswith("ma-coarse-histogram"):
-            size = fields[1]
-            allocations[size][t] = int(fields[5))
-        if line.startswith("ma-total"):
-            allocations[size]["total"] = int(fields[4))
-        if line.startswith("veribetrkv [op] sync"):
-            completed[t] = int(fields[4])
+    tel = MallocTelemetry(filename)
+    xs = tel.t
+    fig, axes = plt.subplots(4, 1, figsize=(5,10))
+    plt.subplots_adjust(left=0.12, right=0.95, hspace=0.4, top=0.95, bottom=0.05);
 
-    xs = range(t)
-    fig, axes = plt.subplots(4, 1)
+    scaleGB = 1e-9;
+    ax = axes[0]
+    line, = ax.plot(xs, tel.os_map_total*scaleGB, color="orange")
+    line.set_label("os-map-total")
+    line, = ax.plot(xs, tel.os_map_heap*scaleGB, "r")
+    line.set_label("os-map-heap")
+    line, = ax.plot(xs, tel.malloc_total*scaleGB, "b")
+    line.set_label("malloc")
+    ax.set_ylabel("GB")
+    ax.legend()
 
-    rate = [float(completed[t])/t for t in completed]
-    line, = axes[1].plot(xs, rate);
+    Kilo = 1000
+    ax = axes[1]
+    for window in (10, 100):
+        if len(xs) > window:
+            ts, rate = tel.throughput(window)
+            ax.plot(ts, rate/Kilo)
+    ax.set_ylim(bottom = 0)
+    ax.set_ylabel("Kops/sec")
 
-#    ax2 = ax1.twinx()
-#
-#    map_ratios = [float(os_map_total[t])/malloc_total[t] for t in xs]
-#    line, = ax2.plot(xs, map_ratios, color="orange", linestyle="--")
-#    line.set_label("map-malloc ratio")
-#    heap_ratios = [float(os_map_heap[t])/malloc_total[t] for t in xs]
-#    line, = ax2.plot(xs, heap_ratios, "r", linestyle="--")
-#    line.set_label("heap-malloc ratio")
-#
-#    ax2.set_ylim(bottom = 0, top=3)
-#    ax2.set_ylabel("x/malloc ratio")
-#    ax2.legend(loc = "lower right")
-#
-#    trunc = 500 if len(map_ratios)>500 else 0 # initial reports are thrown off by weight of the executable
-#    max_ratio = max(map_ratios[trunc:])   
-#    max_t = map_ratios.index(max_ratio)
-#    max_msg = "map-malloc ratio\nmax: %.2f @ %ds" % (max_ratio, max_t)
-#    print(max_msg)
-#    plt.text(max_t, max_ratio, max_msg)
-#
-#    scaleGB = 1e-9;
-#    line, = ax1.plot(xs, [os_map_total[t]*scaleGB for t in xs], color="orange")
-#    line.set_label("os-map-total")
-#    line, = ax1.plot(xs, [os_map_heap[t]*scaleGB for t in xs], "r")
-#    line.set_label("os-map-heap")
-#    line, = ax1.plot(xs, [malloc_total[t]*scaleGB for t in xs], "b")
-#    line.set_label("malloc")
-#    ax1.set_ylabel("GB")
-#    ax1.legend()
-    
-    figname = "%s-timeseries.png" % filename
+    frag = tel.fragmentation()
+    ax = axes[2]
+    map_ratios = frag["os/malloc"]
+    line, = ax.plot(xs, map_ratios, color="orange", linestyle="--")
+    line.set_label("map-malloc ratio")
+    line, = ax.plot(xs, frag["heap/malloc"], "r", linestyle="--")
+    line.set_label("heap-malloc ratio")
+    ax.set_ylim(bottom = 0, top=3)
+    ax.set_ylabel("x/malloc ratio")
+    ax.legend(loc = "lower right")
+
+    trunc = 500 if len(map_ratios)>500 else 0 # initial reports are thrown off by weight of the executable
+    if not np.all(np.isnan(map_ratios[trunc:])):
+        max_t = trunc + int(np.nanargmax(map_ratios[trunc:]))
+        max_ratio = map_ratios[max_t]
+        max_msg = "map-malloc ratio\nmax: %.2f @ %ds" % (max_ratio, max_t)
+        print(max_msg)
+        ax.text(max_t, max_ratio, max_msg)
+
+    # live allocation bytes by power-of-two size class, over time
+    ax = axes[3]
+    histos = tel.histograms
+    if len(histos) > 0:
+        used = histos.used_buckets()
+        ax.stackplot(histos.ts, (histos.bytes[:, used]*scaleGB).T,
+            labels=["<%d" % histos.edges[k+1] for k in used])
+        ax.set_ylabel("GB by size class")
+        ax.legend(fontsize="xx-small", ncol=2, loc="upper left")
+
+    figname = "%s-heap-vs-malloc.png" % filename
     plt.savefig(figname)
     #plt.show()
     
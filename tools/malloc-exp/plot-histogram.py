@@ -6,68 +6,26 @@
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-import re
-#import json
+import sys
+from malloc_telemetry import MallocTelemetry
 
-def parse_one_histogram(line):
-    #return json.loads(line)
-    assert line[0] == "{"
-    assert line[-2:] == "}\n"
-    line = line[1:-2]
-    pairs = line.split(",")[:-1]
-    histo = {}
-    for pair in pairs:
-        size,count = map(int, pair.split(":"))
-        if count>0:
-            histo[size] = count
-    return histo
-
-def cdf(histo, by_size):
-    sizes = list(histo.keys())
-    sizes.sort()
-    xs = []
-    ys = []
-    accum = 0
-    for size in sizes:
-        count = histo[size]
-        accum += count * size if by_size else count
-        xs.append(size)
-        ys.append(accum)
-    #print(xs)
-    # normalize ys to 0..1
-    ys = [y/float(accum) for y in ys]
-    #print(ys)
-    return xs, ys
-
-def parse():
-    t = 0
-    proc_heap = {}
-    malloc_total = {}
-    histos = {}
-    for line in open("malloc-exp/histograms", "r").readlines():
-        if line.startswith("proc-heap"):
-            fields = line.split()
-            proc_heap[t] = int(fields[1])
-            malloc_total[t] = int(fields[3])
-            t += 1
-        
-        if line.startswith("{"):
-            histos[t] = parse_one_histogram(line)
-
-    max_histo_t = max(histos.keys())
+def parse(filename, figname):
+    histos = MallocTelemetry(filename).histograms
+    max_histo_t = histos.ts[-1]
     print(max_histo_t)
-    max_histo = histos[max_histo_t]
-    print(max_histo)
+    print(dict(zip(histos.last_sizes.tolist(), histos.last_counts.tolist())))
 
     # accumulate the CDF
-    line, = plt.plot(*cdf(max_histo, True))
+    line, = plt.plot(*histos.cdf(by_size=True))
     line.set_label("by size")
-    line, = plt.plot(*cdf(max_histo, False))
+    line, = plt.plot(*histos.cdf(by_size=False))
     line.set_label("by allocation count")
     plt.xscale("log")
     plt.legend()
     
-    plt.savefig("malloc-exp/size-cdf.png")
+    plt.savefig(figname)
     #plt.show()
     
-parse()
+filename = sys.argv[1] if len(sys.argv) > 1 else "malloc-exp/histograms"
+figname = sys.argv[2] if len(sys.argv) > 2 else "malloc-exp/size-cdf.png"
+parse(filename, figname)
@@ -302,31 +302,74 @@ def plotProcIoBytes(ax, experiments):
     plotMany(ax, experiments, plotOneExp)
     ax.grid(which="major", color="#dddddd")
 
-def plotIoLatencyCdf(ax, experiments):
+def plotIoLatencyCdf(ax, experiments, opn=8000000):
     ax.set_title("io latency")
     ax.set_yscale("log")
 
-    # retrieve from metadata?
-    assumeProcCyclesPerSec = 2.2*G()
     def plotOneExpAt(exp, plotkwargs, opn):
+        cyclesPerMs = exp.tsc_hz()/K()
         for cdf_src,label,linestyle in (
                 (exp.iolatency_read, "read", "-"),
                 (exp.iolatency_write, "write", "dotted")):
             cdf = cdf_src[opn]
             if cdf==None: continue
-            line, = ax.plot([cycles/assumeProcCyclesPerSec*K() for cycles in cdf.xs], cdf.ys, linestyle=linestyle, **plotkwargs)
+            line, = ax.plot([cycles/cyclesPerMs for cycles in cdf.xs], cdf.ys, linestyle=linestyle, **plotkwargs)
             line.set_label("%s %s @%dKop" % (exp.nickname, label, opn/K()))
 
     def plotOneExp(exp, plotkwargs):
-        try: pass #print(exp.nickname, exp.iolatency_read.sortedKeys())
-        except: pass
-#        plotOneExpAt(exp, plotkwargs,  500000)
-        #print(plotkwargs)
-        plotOneExpAt(exp, plotkwargs, 8000000)
-#        plotOneExpAt(exp, plotkwargs, 2700000)
+        plotOneExpAt(exp, plotkwargs, opn)
+    plotManyForeach(ax, experiments, plotOneExp)
+    ax.set_xlabel("ms")
+    ax.legend()
+
+tail_percentiles = [50, 99, 99.9]
+tail_linestyles = ["solid", "dashed", "dotted"]
+
+def plotPercentileTimeline(ax, exp, timeline, label, scale, plotkwargs):
+    """Plot p50/p99/p99.9 of a HistogramTimeline vs op num; scale converts
+    the timeline's units to the axis units."""
+    if timeline.empty():
+        return
+    ops, values = timeline.percentile_series(tail_percentiles, scale=scale)
+    ax.set_xlabel("op num (K)")
+    xs = [op/K() for op in ops]
+    for col, (pct, linestyle) in enumerate(zip(tail_percentiles, tail_linestyles)):
+        line, = ax.plot(xs, values[:, col], linestyle=linestyle, **plotkwargs)
+        line.set_label("%s %s p%g" % (exp.nickname, label, pct))
+
+def plotIoLatencyTails(ax, experiments):
+    ax.set_title("io latency percentiles")
+    ax.set_yscale("log")
+    ax.set_ylabel("ms")
+
+    def plotOneExp(exp, plotkwargs):
+        msPerCycle = K()/exp.tsc_hz()
+        for io, hist in exp.iolatency_hist.items():
+            plotPercentileTimeline(ax, exp, hist, io, msPerCycle, plotkwargs)
     plotManyForeach(ax, experiments, plotOneExp)
-    ax.set_xlabel("ms assuming clock %.1f%sHz" % (assumeProcCyclesPerSec/G(), G))
+    set_xlim(ax, experiments)
     ax.legend()
+    ax.grid(which="major", color="#dddddd")
+
+def opLatencyTypes(experiments):
+    """Op types with interval latency data in any experiment, in a stable order."""
+    types = set()
+    for exp in experiments:
+        types |= set(op for op, tl in exp.op_latency.items() if not tl.empty())
+    return sorted(types)
+
+def plotOpLatencyTails(ax, experiments, op_type):
+    ax.set_title("%s latency percentiles" % op_type)
+    ax.set_yscale("log")
+    ax.set_ylabel("ms")
+
+    def plotOneExp(exp, plotkwargs):
+        if op_type in exp.op_latency:
+            plotPercentileTimeline(ax, exp, exp.op_latency[op_type], op_type, 1/(K()*K()), plotkwargs)
+    plotManyForeach(ax, experiments, plotOneExp)
+    set_xlim(ax, experiments)
+    ax.legend()
+    ax.grid(which="major", color="#dddddd")
 
 def plotSlowIos(ax, experiments):
     threshTraces = set()
@@ -364,3 +407,70 @@ def plotCacheStats(ax, experiments):
     ax.grid(which="major", color="#dddddd")
     set_xlim(ax, experiments)
     
+
+def plotBlkIo(ax, experiments):
+    """Disk access pattern from blktrace; experiments need exp.blkio
+    (see blktrace.load_blkio)."""
+    ax.set_title("block io pattern")
+    a2 = ax.twinx()
+    a2.set_ylabel("frac")
+    a2.set_ylim(bottom=0, top=1)
+
+    def plotOneExp(exp, plotkwargs):
+        blkio = getattr(exp, "blkio", None)
+        if blkio is None or blkio.iops.empty():
+            return
+        line, = ax.plot(*plotVsKop(ax, exp, singleTrace(ax, blkio.read_bw, scale=Mi)), **plotkwargs)
+        line.set_label(exp.nickname + " read")
+        line, = ax.plot(*plotVsKop(ax, exp, singleTrace(ax, blkio.write_bw, scale=Mi)), linestyle="dashed", **plotkwargs)
+        line.set_label(exp.nickname + " write")
+        line, = a2.plot(*plotVsKop(ax, exp, singleTrace(a2, blkio.sequential_frac)), linestyle="dotted", **plotkwargs)
+        line.set_label(exp.nickname + " seq")
+        line, = a2.plot(*plotVsKop(ax, exp, singleTrace(a2, blkio.rw_switch_frac)), linestyle="-.", **plotkwargs)
+        line.set_label(exp.nickname + " r/w switch")
+
+        s = blkio.blktrace.summary()
+        print("%s blktrace: %d reqs, seq %.2f, r/w switch %.2f, mean seek %.0f sectors, size p50 %s p99 %s" % (
+            exp.nickname, s["requests"], s["sequential_frac"], s["rw_switch_frac"],
+            s["mean_seek_sectors"], s["size_p50"], s["size_p99"]))
+
+    plotManyForeach(ax, experiments, plotOneExp)
+    ax.set_ylim(bottom=0)
+    set_xlim(ax, experiments)
+    ax.legend(loc="upper left")
+    a2.legend(loc="upper right")
+
+def plotStalls(ax, experiments):
+    """Stall timeline; experiments need exp.stalls (a stalls.StallAnalysis)."""
+    ax.set_title("stalls")
+    ax.set_ylabel("stall duration (s)")
+    ax.set_yscale("log")
+    a2 = ax.twinx()
+    a2.set_ylabel("cumulative Kops lost")
+    markers = {"sync": "o", "writeback": "x"}
+
+    def plotOneExp(exp, plotkwargs):
+        analysis = exp.stalls
+        for kind, marker in markers.items():
+            stalls = analysis.of_kind(kind)
+            if len(stalls) == 0:
+                continue
+            xs = [s.op_start/K() for s in stalls]
+            ys = [max(s.duration(), 1e-3) for s in stalls]
+            line, = ax.plot(xs, ys, marker=marker, linestyle="none", **plotkwargs)
+            line.set_label("%s %s" % (exp.nickname, kind))
+        lost = 0
+        xs, ys = [], []
+        for s in analysis.stalls:
+            lost += s.ops_lost
+            xs.append(s.op_start/K())
+            ys.append(lost/K())
+        if len(xs) > 0:
+            a2.step(xs, ys, where="post", linestyle="dotted", **plotkwargs)
+
+    plotManyForeach(ax, experiments, plotOneExp)
+    ax.set_xlabel("op num (K)")
+    set_xlim(ax, experiments)
+    a2.set_ylim(bottom=0)
+    ax.legend(loc="upper left")
+    ax.grid(which="major", color="#dddddd")
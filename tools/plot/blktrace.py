@@ -0,0 +1,180 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Analyzer for the block traces that tools/run-veri-config-experiment.py
+# records next to each experiment as <output>.trace..bz2.
+#
+# The runner emits one issued request per line:
+#   "<sec>.<nsec> <rwbs> <sector> <nblocks>"   (blkparse -f"%T.%09t %d %S %n\n")
+# Traces recorded before that format change carry only "<sector> <nblocks>";
+# those still yield the whole-run summary, but can't be windowed in time.
+
+import os
+import numpy as np
+from logreader import open_log
+from parser import Trace
+
+SECTOR_BYTES = 512
+# log2 buckets for request sizes and seek distances (in sectors)
+NUM_BUCKETS = 64
+
+def log2_bucket(n):
+    return min(int(n).bit_length(), NUM_BUCKETS - 1)
+
+def trace_path_for(exp_filename):
+    return exp_filename + ".trace..bz2"
+
+class Window:
+    """Counters accumulated over one time window."""
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.sequential = 0
+        self.rw_switches = 0
+        self.seek_sectors = 0
+
+    def requests(self):
+        return self.reads + self.writes
+
+class BlkTrace:
+    def __init__(self, filename, window_sec=1.0):
+        self.filename = filename
+        self.window_sec = window_sec
+        self.windows = {}   # window index -> Window
+        self.timed = False
+        self.size_histo = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.seek_histo = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.total = Window()
+        self.parse()
+
+    def parse(self):
+        print("Parsing %s" % self.filename)
+        prev_end = None
+        prev_is_write = None
+        for line in open_log(self.filename):
+            fields = line.split()
+            if len(fields) == 4:
+                t = float(fields[0])
+                is_write = "W" in fields[1]
+                sector = int(fields[2])
+                nblocks = int(fields[3])
+                self.timed = True
+            elif len(fields) == 2:
+                t = None
+                is_write = None
+                sector = int(fields[0])
+                nblocks = int(fields[1])
+            else:
+                continue    # blkparse summary noise
+            if nblocks == 0:
+                continue    # flushes and barriers carry no data
+
+            windows = [self.total]
+            if t is not None:
+                idx = int(t / self.window_sec)
+                if idx not in self.windows:
+                    self.windows[idx] = Window()
+                windows.append(self.windows[idx])
+
+            nbytes = nblocks * SECTOR_BYTES
+            self.size_histo[log2_bucket(nblocks)] += 1
+            seek = None if prev_end is None else abs(sector - prev_end)
+            if seek is not None:
+                self.seek_histo[log2_bucket(seek)] += 1
+            for w in windows:
+                if is_write:
+                    w.writes += 1
+                    w.write_bytes += nbytes
+                else:
+                    # untimed traces don't record direction; count as reads
+                    w.reads += 1
+                    w.read_bytes += nbytes
+                if seek is not None:
+                    w.seek_sectors += seek
+                    if seek == 0:
+                        w.sequential += 1
+                if prev_is_write is not None and is_write != prev_is_write:
+                    w.rw_switches += 1
+            prev_end = sector + nblocks
+            prev_is_write = is_write
+
+    def window_times(self):
+        """(start_sec, Window) pairs in time order, for every window from 0
+        through the last busy one: idle windows come back empty, so rates
+        drop to 0 across a gap instead of interpolating over it."""
+        last = max(self.windows) if self.windows else -1
+        return [(idx*self.window_sec, self.windows.get(idx) or Window()) for idx in range(last + 1)]
+
+    def size_percentile(self, pct):
+        """Request size in bytes at percentile pct (by request count), to
+        log2-bucket resolution."""
+        cumulative = np.cumsum(self.size_histo)
+        if cumulative[-1] == 0:
+            return 0
+        bucket = int(np.searchsorted(cumulative, cumulative[-1]*pct/100.0))
+        return (1 << max(bucket - 1, 0)) * SECTOR_BYTES
+
+    def summary(self):
+        tot = self.total
+        n = tot.requests()
+        return {
+            "requests": n,
+            "read_bytes": tot.read_bytes,
+            "write_bytes": tot.write_bytes,
+            "sequential_frac": tot.sequential / max(n - 1, 1),
+            "rw_switch_frac": tot.rw_switches / max(n - 1, 1),
+            "mean_seek_sectors": tot.seek_sectors / max(n - 1, 1),
+            "size_p50": self.size_percentile(50),
+            "size_p99": self.size_percentile(99),
+        }
+
+class BlkIoTimeline:
+    """Per-window blktrace metrics aligned to an Experiment's op timeline, as
+    Traces so they plot with the rest of PlotHelper."""
+    def __init__(self, exp, blktrace, t_offset=0.0):
+        # t_offset: seconds between blktrace start and experiment start. The
+        # runner starts blktrace immediately before the benchmark, so 0 is
+        # close enough at window granularity.
+        self.blktrace = blktrace
+        self.read_bw = Trace("blk_read_bw", "B/s")
+        self.write_bw = Trace("blk_write_bw", "B/s")
+        self.iops = Trace("blk_iops", "iop/s")
+        self.sequential_frac = Trace("blk_sequential", "frac")
+        self.rw_switch_frac = Trace("blk_rw_switch", "frac")
+        self.mean_seek = Trace("blk_mean_seek", "sectors")
+        self.mean_size = Trace("blk_mean_size", "B")
+
+        ops = exp.sortedOpns
+        times = [exp.elapsed[op] for op in ops]
+        pairs = [(t, op) for t, op in zip(times, ops) if t is not None]
+        if len(pairs) < 2 or not blktrace.timed:
+            return
+        ts, opns = (np.array(v, dtype=np.float64) for v in zip(*pairs))
+
+        dt = blktrace.window_sec
+        for start, w in blktrace.window_times():
+            t_end = start + dt - t_offset
+            if t_end < ts[0] or t_end > ts[-1]:
+                continue    # never extrapolate
+            opn = int(np.interp(t_end, ts, opns))
+            n = w.requests()
+            self.read_bw[opn] = w.read_bytes / dt
+            self.write_bw[opn] = w.write_bytes / dt
+            self.iops[opn] = n / dt
+            if n > 0:
+                self.sequential_frac[opn] = w.sequential / n
+                self.rw_switch_frac[opn] = w.rw_switches / n
+                self.mean_seek[opn] = w.seek_sectors / n
+                self.mean_size[opn] = (w.read_bytes + w.write_bytes) / n
+
+def load_blkio(exp, window_sec=1.0):
+    """Attach exp.blkio (a BlkIoTimeline) if exp has a block trace; returns it
+    or None."""
+    path = trace_path_for(exp.filename)
+    if not os.path.exists(path):
+        exp.blkio = None
+        return None
+    exp.blkio = BlkIoTimeline(exp, BlkTrace(path, window_sec))
+    return exp.blkio
@@ -0,0 +1,211 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Log-bucketed (HDR-style) latency histograms.
+#
+# Values land in buckets that double in width every SUB_BUCKETS buckets, so
+# any value is recorded to within 1/SUB_BUCKETS relative error no matter
+# whether it's 100ns or 10s. Every histogram shares the same bucket layout,
+# so merging windows or replicas is plain array addition.
+
+import numpy as np
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+NUM_BUCKETS = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+def bucket_index(values):
+    """Vectorized map from non-negative integer values to bucket indices."""
+    v = np.maximum(np.asarray(values, dtype=np.float64), 0).astype(np.uint64)
+    exp = np.zeros(v.shape, dtype=np.int64)
+    big = v >= SUB_BUCKETS
+    # floor(log2 v) for the values past the linear region
+    exp[big] = np.floor(np.log2(v[big].astype(np.float64))).astype(np.int64)
+    shift = np.maximum(exp - SUB_BUCKET_BITS, 0).astype(np.uint64)
+    sub = (v >> shift).astype(np.int64)
+    # values below SUB_BUCKETS occupy the first (linear) buckets; above that
+    # each octave gets SUB_BUCKETS buckets indexed by its top bits.
+    return np.where(big, (exp - SUB_BUCKET_BITS + 1) * SUB_BUCKETS + (sub - SUB_BUCKETS), v.astype(np.int64))
+
+def bucket_lower_bounds():
+    idx = np.arange(NUM_BUCKETS)
+    octave = idx // SUB_BUCKETS
+    sub = idx % SUB_BUCKETS
+    shift = np.maximum(octave - 1, 0)
+    return np.where(octave == 0, sub, (SUB_BUCKETS + sub) * (2.0 ** shift))
+
+LOWER_BOUNDS = bucket_lower_bounds()
+UPPER_BOUNDS = np.append(LOWER_BOUNDS[1:], np.inf)
+# Representative value reported for a bucket
+MIDPOINTS = np.where(np.isinf(UPPER_BOUNDS), LOWER_BOUNDS, (LOWER_BOUNDS + UPPER_BOUNDS) / 2)
+
+def percentiles_of(counts, pcts):
+    """Vectorized percentile extraction.
+    counts: (..., NUM_BUCKETS) array; pcts: sequence of percentiles (0..100).
+    Returns (..., len(pcts)) bucket midpoints; NaN where counts are empty."""
+    counts = np.asarray(counts, dtype=np.float64)
+    cum = np.cumsum(counts, axis=-1)
+    total = cum[..., -1:]
+    targets = total * (np.asarray(pcts, dtype=np.float64) / 100.0)
+    # index of first bucket whose cumulative count reaches each target
+    idx = (cum[..., np.newaxis, :] < targets[..., :, np.newaxis]).sum(axis=-1)
+    idx = np.minimum(idx, NUM_BUCKETS - 1)
+    result = MIDPOINTS[idx]
+    return np.where(total > 0, result, np.nan)
+
+class LatencyHistogram:
+    """Counts of latency samples in log buckets. units names what the recorded
+    values measure ("ns", "cycles")."""
+    def __init__(self, units, counts=None):
+        self.units = units
+        if counts is None:
+            counts = np.zeros(NUM_BUCKETS, dtype=np.float64)
+        self.counts = counts
+
+    def add(self, values, weights=1):
+        np.add.at(self.counts, bucket_index(values), weights)
+
+    def merge(self, other):
+        assert self.units == other.units
+        return LatencyHistogram(self.units, self.counts + other.counts)
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    def __sub__(self, other):
+        assert self.units == other.units
+        return LatencyHistogram(self.units, np.maximum(self.counts - other.counts, 0))
+
+    def samples(self):
+        return self.counts.sum()
+
+    def percentiles(self, pcts):
+        return percentiles_of(self.counts, pcts)
+
+    def percentile(self, pct):
+        return self.percentiles([pct])[0]
+
+    def scaled(self, factor, units):
+        """Same samples re-expressed in other units (e.g. cycles -> ns)."""
+        result = LatencyHistogram(units)
+        nz = np.nonzero(self.counts)[0]
+        result.add(MIDPOINTS[nz] * factor, self.counts[nz])
+        return result
+
+    @staticmethod
+    def from_cdf(cdf, units, total=1.0):
+        """Rebuild from a CDF (xs: values, ys: cumulative fraction). The
+        CDF carries no sample count; total weights it for merging."""
+        hist = LatencyHistogram(units)
+        ys = np.asarray(cdf.ys, dtype=np.float64)
+        mass = np.diff(np.concatenate(([0.0], ys)))
+        hist.add(cdf.xs, np.maximum(mass, 0) * total)
+        return hist
+
+def from_sparse(fields, units):
+    """Parse "<bucket>:<count>" fields, as printed by YcsbMain's
+    IntervalHist, which shares this file's bucket layout."""
+    hist = LatencyHistogram(units)
+    for field in fields:
+        idx, count = field.split(":")
+        hist.counts[int(idx)] += int(count)
+    return hist
+
+def from_ccdf(rows, units):
+    """Rebuild from HDRHist ccdf rows of (value, fraction, count), where count
+    is the number of samples in the bucket starting at value."""
+    hist = LatencyHistogram(units)
+    if len(rows) > 0:
+        values, fractions, counts = (np.array(col, dtype=np.float64) for col in zip(*rows))
+        hist.add(values, counts)
+    return hist
+
+class HistogramTimeline:
+    """LatencyHistograms addressed by opn, stored as a dense (time x bucket)
+    matrix. cumulative says whether each row counts everything since the
+    start of the run (like a running HDRHist) or one interval only."""
+    def __init__(self, label, units, cumulative=False):
+        self.label = label
+        self.units = units
+        self.cumulative = cumulative
+        self.rows = {}
+        self._matrix = None
+
+    def __setitem__(self, op, hist):
+        assert hist.units == self.units
+        self.rows[op] = hist.counts
+        self._matrix = None
+
+    def __getitem__(self, op):
+        return LatencyHistogram(self.units, self.rows[op])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def empty(self):
+        return len(self.rows) == 0
+
+    def ops(self):
+        return sorted(self.rows.keys())
+
+    def matrix(self):
+        if self._matrix is None:
+            if self.empty():
+                self._matrix = np.zeros((0, NUM_BUCKETS))
+            else:
+                self._matrix = np.vstack([self.rows[op] for op in self.ops()])
+        return self._matrix
+
+    def intervals(self):
+        """Per-interval timeline (differences of successive rows)."""
+        if not self.cumulative:
+            return self
+        result = HistogramTimeline(self.label, self.units, cumulative=False)
+        m = self.matrix()
+        if len(m) == 0:
+            return result
+        diffs = np.maximum(np.diff(np.vstack([np.zeros(NUM_BUCKETS), m]), axis=0), 0)
+        for op, row in zip(self.ops(), diffs):
+            result.rows[op] = row
+        return result
+
+    def rebin(self, window_ops):
+        """Sum interval rows into fixed op windows (keyed by window end) so
+        timelines from different runs line up for merging."""
+        src = self.intervals()
+        result = HistogramTimeline(self.label, self.units, cumulative=False)
+        for op in src.ops():
+            key = (op // window_ops + 1) * window_ops
+            if key in result.rows:
+                result.rows[key] = result.rows[key] + src.rows[op]
+            else:
+                result.rows[key] = src.rows[op].copy()
+        return result
+
+    def merge(self, other):
+        assert self.units == other.units and self.cumulative == other.cumulative
+        result = HistogramTimeline(self.label, self.units, self.cumulative)
+        for op in set(self.rows) | set(other.rows):
+            result.rows[op] = self.rows.get(op, 0) + other.rows.get(op, 0)
+        return result
+
+    def total(self):
+        m = self.matrix()
+        if self.cumulative:
+            counts = m[-1] if len(m) else np.zeros(NUM_BUCKETS)
+        else:
+            counts = m.sum(axis=0)
+        return LatencyHistogram(self.units, counts)
+
+    def percentile_series(self, pcts, scale=1.0):
+        """(ops, values) where values is (len(ops), len(pcts)), computed over
+        interval rows in one vectorized pass; scale converts units."""
+        src = self.intervals()
+        return src.ops(), percentiles_of(src.matrix(), pcts) * scale
+
+def merge_all(items):
+    """Merge a list of LatencyHistograms or HistogramTimelines."""
+    result = items[0]
+    for item in items[1:]:
+        result = result.merge(item)
+    return result
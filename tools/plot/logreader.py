@@ -0,0 +1,93 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Shared reader for experiment logs (.data files, blktrace dumps, verification
+# time logs). Logs may be stored plain or compressed with gzip, bzip2, xz or
+# zstd; open_log hides the difference and streams lines without ever
+# decompressing the whole file into memory.
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+
+try:
+    import zstandard    # pip3 install zstandard (optional)
+except ModuleNotFoundError:
+    zstandard = None
+
+# Suffixes tried, in order, when the plain filename doesn't exist. This lets
+# tools keep naming "expresults/foo.data" even when the runner wrote
+# "expresults/foo.data.gz".
+LOG_SUFFIXES = [".gz", ".bz2", ".xz", ".zst"]
+
+MAGIC = [
+    (b"\x1f\x8b", "gz"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zst"),
+]
+
+def resolve_log_path(filename):
+    """Return the path actually holding filename's contents, possibly with a
+    compression suffix appended. Raises FileNotFoundError if none exists."""
+    if os.path.exists(filename):
+        return filename
+    for suffix in LOG_SUFFIXES:
+        if os.path.exists(filename + suffix):
+            return filename + suffix
+    raise FileNotFoundError(filename)
+
+def sniff_compression(path):
+    with open(path, "rb") as fp:
+        head = fp.read(6)
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+class ZstdCliReader(io.RawIOBase):
+    """Byte stream fed by a `zstd -dc` child, for hosts without the
+    zstandard module."""
+    def __init__(self, path):
+        self.proc = subprocess.Popen(["zstd", "-dc", path], stdout=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        data = self.proc.stdout.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.proc.stdout.close()
+            self.proc.wait()
+        super().close()
+
+def open_zstd(path, errors):
+    if zstandard is not None:
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    elif shutil.which("zstd"):
+        raw = io.BufferedReader(ZstdCliReader(path))
+    else:
+        raise ValueError("%s is zstd-compressed; pip3 install zstandard" % path)
+    return io.TextIOWrapper(raw, encoding="utf-8", errors=errors)
+
+def open_log(filename, errors="replace"):
+    """Open a (possibly compressed) log for streaming text reads."""
+    path = resolve_log_path(filename)
+    kind = sniff_compression(path)
+    if kind == "gz":
+        return gzip.open(path, "rt", encoding="utf-8", errors=errors)
+    if kind == "bz2":
+        return bz2.open(path, "rt", encoding="utf-8", errors=errors)
+    if kind == "xz":
+        return lzma.open(path, "rt", encoding="utf-8", errors=errors)
+    if kind == "zst":
+        return open_zstd(path, errors)
+    return open(path, "r", encoding="utf-8", errors=errors)
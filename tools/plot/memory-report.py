@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Usage: memory-report.py nick=path.data [nick=path.data...] [limit=16gb] [output=memory.tsv]
+# Prints peak and steady-state memory per experiment and phase, the overhead
+# ratios between layers (cache internals, malloc, OS mapping, cgroup limit),
+# and the per-node OS overhead fitted across experiments of different cache
+# sizes. limit= supplies the cgroup limit for logs that predate its metadata
+# line; output= also writes the table as tab-separated values.
+
+import sys
+from parser import Experiment
+from memory import MemoryAnalysis, format_memory_table, memory_rows, parse_bytes
+
+output_filename = None
+limit = None
+experiments = []
+for arg in sys.argv[1:]:
+    nick,fn = arg.split("=")
+    if nick=="output":
+        output_filename = fn
+    elif nick=="limit":
+        limit = parse_bytes(fn)
+    else:
+        try:
+            experiments.append(Experiment(fn, nick))
+        except (ValueError,FileNotFoundError):
+            print("Can't parse %s; skipping" % nick)
+
+analyses = [MemoryAnalysis(exp, limit=limit) for exp in experiments]
+print(format_memory_table(analyses))
+
+if output_filename:
+    with open(output_filename, "w") as fp:
+        for row in memory_rows(analyses):
+            fp.write("\t".join(row) + "\n")
@@ -0,0 +1,210 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Memory efficiency: how much of the memory a run holds is cache, and how
+# much is allocator and mapping overhead? The numbers behind
+# PlotHelper.plotGrandUnifiedMemory, per experiment and per phase.
+#
+# Each layer is a parsed Experiment trace:
+#   internal    the cache's own accounting (bucket message/key and pivot
+#               key bytes, "cache: N ...-bytes")
+#   underlying  bytes below Dafny, above malloc
+#   malloc      the malloc accounting "total" microscope
+#   jem_mapped  jemalloc's mapped bytes
+#   os          os-map-total
+#   cgroup      cgroups memory.usage_in_bytes
+# and the cgroup limit and MaxCacheSizeUint64/MaxTotalBucketWeightUint64
+# come from the run's metadata lines.
+#
+# For each phase a series has a peak (max) and a steady value: the median
+# over the last STEADY_FRACTION of the phase's samples, once the cache has
+# filled. Ratios are taken sample by sample and summarized the same way.
+
+import numpy as np
+
+STEADY_FRACTION = 0.5
+
+INTERNAL_TRACES = ["bucket-message-bytes", "bucket-key-bytes", "pivot-key-bytes"]
+
+# (name, numerator, denominator)
+RATIOS = [
+    ("internal/malloc", "internal", "malloc"),
+    ("underlying/malloc", "underlying", "malloc"),
+    ("malloc/os", "malloc", "os"),
+    ("jem_mapped/os", "jem_mapped", "os"),
+    ("os/limit", "os", "limit"),
+    ("cgroup/limit", "cgroup", "limit"),
+]
+
+def parse_bytes(text):
+    """"16gb" or a plain byte count, as run-veri-config-experiment's ram= takes."""
+    if text.endswith("gb"):
+        return int(float(text[:-2]) * (1<<30))
+    return int(text)
+
+def trace_arrays(trace):
+    ops = trace.sortedKeys() if not trace.empty() else []
+    return (np.array(ops, dtype=np.float64),
+        np.array([trace.data[op] for op in ops], dtype=np.float64))
+
+def resample(series, ops):
+    """series (ops, values) at ops, linearly interpolated; NaN outside the
+    range it was sampled over."""
+    s_ops, s_vals = series
+    out = np.full(len(ops), np.nan)
+    if len(s_ops) == 0:
+        return out
+    inside = (ops >= s_ops[0]) & (ops <= s_ops[-1])
+    out[inside] = np.interp(ops[inside], s_ops, s_vals)
+    return out
+
+class Summary:
+    def __init__(self, values):
+        values = values[~np.isnan(values)]
+        self.samples = len(values)
+        self.peak = values.max() if len(values) else None
+        steady = values[int(len(values) * (1 - STEADY_FRACTION)):]
+        self.steady = float(np.median(steady)) if len(steady) else None
+
+class PhaseMemory:
+    def __init__(self, phase, op_start, op_end):
+        self.phase = phase
+        self.op_start = op_start
+        self.op_end = op_end
+        self.series = {}    # layer -> Summary of bytes
+        self.ratios = {}    # ratio name -> Summary
+
+class MemoryAnalysis:
+    def __init__(self, exp, limit=None, cache_nodes=None):
+        self.exp = exp
+        self.limit = limit if limit is not None else self.metadata_int("cgroups-memory.limit_in_bytes")
+        self.cache_nodes = cache_nodes if cache_nodes is not None else self.metadata_int("MaxCacheSizeUint64")
+        self.bucket_weight = self.metadata_int("MaxTotalBucketWeightUint64")
+        self.layers = self.gather_layers()
+        self.phases = [self.analyze(phase, start, end) for phase, start, end in self.phase_ranges()]
+
+    def metadata_int(self, key):
+        try:
+            return int(self.exp.metadata[key].split()[0])
+        except (KeyError, ValueError, IndexError):
+            return None
+
+    def cache_bytes(self):
+        """The cache size the run was configured for, in bytes."""
+        if self.cache_nodes is None or self.bucket_weight is None:
+            return None
+        return self.cache_nodes * self.bucket_weight
+
+    def gather_layers(self):
+        exp = self.exp
+        layers = {
+            "underlying": trace_arrays(exp.kvl_underlying),
+            "jem_mapped": trace_arrays(exp.jem_mapped),
+            "os": trace_arrays(exp.os_map_total),
+            "cgroup": trace_arrays(exp.cgroups_memory_usage_bytes),
+        }
+        if "total" in exp.microscopes:
+            layers["malloc"] = trace_arrays(exp.microscopes["total"].getTrace("open_byte"))
+        if all(name in exp.accum for name in INTERNAL_TRACES):
+            ops, total = trace_arrays(exp.accum[INTERNAL_TRACES[0]])
+            for name in INTERNAL_TRACES[1:]:
+                total = total + resample(trace_arrays(exp.accum[name]), ops)
+            layers["internal"] = (ops, total)
+        return dict((name, series) for name, series in layers.items() if len(series[0]) > 0)
+
+    def phase_ranges(self):
+        """[(phase, op_start, op_end)] half-open, then the whole run as "all"."""
+        starts = sorted(self.exp.phase_starts.items(), key=lambda item: item[1])
+        end = self.exp.op_max + 1
+        ranges = [(phase, start, next_start) for (phase, start), (_, next_start)
+            in zip(starts, starts[1:] + [(None, end)])]
+        return [r for r in ranges if r[2] > r[1]] + [("all", 0, end)]
+
+    def analyze(self, phase, op_start, op_end):
+        result = PhaseMemory(phase, op_start, op_end)
+        windows = {}
+        for name, (ops, values) in self.layers.items():
+            keep = (ops >= op_start) & (ops < op_end)
+            windows[name] = ops[keep]
+            result.series[name] = Summary(values[keep])
+        for ratio, num, den in RATIOS:
+            if num not in windows:
+                continue
+            ops = windows[num]
+            numerator = resample(self.layers[num], ops)
+            if den == "limit":
+                if self.limit is None:
+                    continue
+                denominator = np.full(len(ops), float(self.limit))
+            elif den in self.layers:
+                denominator = resample(self.layers[den], ops)
+            else:
+                continue
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.where(denominator > 0, numerator / denominator, np.nan)
+            result.ratios[ratio] = Summary(values)
+        return result
+
+def fit_overhead(analyses, phase="all", layer="os"):
+    """Least-squares fit of a layer's peak against the configured cache
+    size across experiments: peak = fixed + per_node * nodes. Returns
+    (fixed, per_node, n) or None with fewer than two distinct cache sizes."""
+    points = []
+    for analysis in analyses:
+        for pm in analysis.phases:
+            if pm.phase == phase and analysis.cache_nodes is not None \
+                    and layer in pm.series and pm.series[layer].peak is not None:
+                points.append((analysis.cache_nodes, pm.series[layer].peak))
+    if len(set(nodes for nodes, peak in points)) < 2:
+        return None
+    per_node, fixed = np.polyfit([p[0] for p in points], [p[1] for p in points], 1)
+    return fixed, per_node, len(points)
+
+def memory_rows(analyses):
+    """Header and one row of strings per experiment and phase."""
+    GiB = float(1<<30)
+    header = ["exp", "phase", "cache_nodes", "cache_GiB", "limit_GiB",
+        "os_peak", "os_steady", "cg_peak", "malloc_steady", "internal_steady",
+        "internal/malloc", "underlying/malloc", "malloc/os", "jem_mapped/os",
+        "os/limit_peak", "cgroup/limit_peak", "os/cache"]
+    rows = [header]
+    for analysis in analyses:
+        cache_bytes = analysis.cache_bytes()
+        for pm in analysis.phases:
+            def gib(layer, which):
+                s = pm.series.get(layer)
+                value = getattr(s, which) if s else None
+                return "%.2f" % (value/GiB) if value is not None else "-"
+            def ratio(name, which="steady"):
+                s = pm.ratios.get(name)
+                value = getattr(s, which) if s else None
+                return "%.3f" % value if value is not None else "-"
+            os_steady = pm.series["os"].steady if "os" in pm.series else None
+            rows.append([analysis.exp.nickname, pm.phase,
+                "%d" % analysis.cache_nodes if analysis.cache_nodes is not None else "-",
+                "%.2f" % (cache_bytes/GiB) if cache_bytes else "-",
+                "%.2f" % (analysis.limit/GiB) if analysis.limit else "-",
+                gib("os", "peak"), gib("os", "steady"), gib("cgroup", "peak"),
+                gib("malloc", "steady"), gib("internal", "steady"),
+                ratio("internal/malloc"), ratio("underlying/malloc"), ratio("malloc/os"),
+                ratio("jem_mapped/os"), ratio("os/limit", "peak"), ratio("cgroup/limit", "peak"),
+                "%.3f" % (os_steady/cache_bytes) if cache_bytes and os_steady is not None else "-"])
+    return rows
+
+def format_memory_table(analyses):
+    """Text table of memory_rows, then the fitted per-node overhead."""
+    rows = memory_rows(analyses)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.rjust(w) for cell, w in zip(row, widths)) for row in rows]
+
+    fit = fit_overhead(analyses)
+    if fit:
+        fixed, per_node, n = fit
+        MiB = float(1<<20)
+        lines.append("")
+        lines.append("peak OS mapping ~ %.1f MiB + %.3f MiB/node (fit over %d runs)" % (fixed/MiB, per_node/MiB, n))
+        for limit in sorted(set(a.limit for a in analyses if a.limit)):
+            if per_node > 0:
+                lines.append("  MaxCacheSizeUint64 filling a %.2f GiB limit: %d" % (
+                    limit/float(1<<30), int((limit - fixed) / per_node)))
+    return "\n".join(lines)
@@ -10,6 +10,8 @@ import re
 import sys
 import operator
 import bisect
+from logreader import open_log
+from latency import LatencyHistogram, HistogramTimeline, from_sparse, from_ccdf
 
 field_width = 14+1
 arow_width = field_width*4 - 1
@@ -118,11 +120,26 @@ def match_arow_line(token, line):
     label = line[len(token)+1+arow_width+1:]
     return (arow, label)
 
+class SyncInterval:
+    def __init__(self, phase, start_t, op, start_sample):
+        self.phase = phase
+        self.start_t = start_t
+        self.end_t = None
+        self.op = op
+        self.start_sample = start_sample    # index into Experiment.counter_log
+        self.end_sample = None
+
+    def duration(self):
+        return self.end_t - self.start_t
+
 class CDF:
     def __init__(self, fields):
         self.xs = [float(f.split(":")[0]) for f in fields]
         self.ys = [float(f.split(":")[1]) for f in fields]
 
+# Clock used to interpret cycle counts when the log predates "metadata tsc_hz".
+DEFAULT_TSC_HZ = 2.2e9
+
 class Experiment:
     def __init__(self, filename, nickname=None):
         self.filename = filename
@@ -177,6 +194,28 @@ class Experiment:
 
         self.iolatency_read = DiscreteTrace("read-latency", "cycles")
         self.iolatency_write = DiscreteTrace("write-latency", "cycles")
+        # The same io-latency snapshots as mergeable histograms. The CDFs
+        # carry fractions rather than counts, so each snapshot has unit weight.
+        self.iolatency_hist = {
+            "read": HistogramTimeline("read-latency", "cycles"),
+            "write": HistogramTimeline("write-latency", "cycles"),
+        }
+
+        # YCSB per-op-type latencies (ns): interval snapshots printed with each
+        # progress line, plus the end-of-phase ccdf and summary quantiles,
+        # keyed by (workload, op type).
+        self.op_latency = {}
+        self.op_latency_final = {}
+        self.op_latency_summary = {}
+
+        self.metadata = {}
+
+        # Sync intervals from the "[step] ... sync" lines, and the counter
+        # samples (ioaccounting, proc-io, cache, writebackStalls) in log order.
+        # Ops don't advance during a sync, so op-addressed Traces can't tell
+        # what happened inside one; stalls.py uses the sample order instead.
+        self.syncs = []
+        self.counter_log = []
 
         self.slow_thresh = Trace("slow_thresh", "cycles")
         self.slow_reads = Trace("slow_reads", "count")
@@ -185,10 +224,20 @@ class Experiment:
         self.writeback_stalls = Trace("writeback_stalls", "count")
         
         self.parse()
+        self.syncs = [s for s in self.syncs if s.end_t is not None]
+        self.op_latency_final = dict(
+            (key, from_ccdf(rows, "ns")) for key, rows in self.op_latency_final.items())
         self.sortedOpns = list(self.operation.data.keys())
         self.sortedOpns.sort()
         self.op_max = max(self.sortedOpns)
 
+    def tsc_hz(self):
+        """TSC frequency for converting cycle latencies to time."""
+        try:
+            return float(self.metadata["tsc_hz"])
+        except KeyError:
+            return DEFAULT_TSC_HZ
+
     def parse(self):
         print("Parsing %s" % self.filename)
         cur_op = 0
@@ -200,16 +249,13 @@ class Experiment:
         phase_t_base = 0
         self.phase_starts = {}
 
-        for line in open(self.filename, "r").readlines():
+        for line in open_log(self.filename):
             line_num += 1
             line = line.strip()
             fields = line.split()
 
-            # op count is the independent variable for all traces.
-            def process_elapsed(phase, ms_text, opnum_text):
+            def enter_phase(phase):
                 nonlocal cur_phase
-                nonlocal cur_op
-                nonlocal cur_t
                 nonlocal phase_t_base
                 nonlocal phase_op_base
                 if cur_phase != phase:
@@ -217,6 +263,12 @@ class Experiment:
                     phase_op_base = cur_op
                     phase_t_base = cur_t
                     self.phase_starts[phase] = phase_op_base
+
+            # op count is the independent variable for all traces.
+            def process_elapsed(phase, ms_text, opnum_text):
+                nonlocal cur_op
+                nonlocal cur_t
+                enter_phase(phase)
                 t_in_phase = int(ms_text)/1000.0
                 cur_t = t_in_phase + phase_t_base
                 self.elapsed[cur_op] = cur_t
@@ -231,9 +283,34 @@ class Experiment:
 
             # The format in branch osdi2020-artifact-*
             if line.startswith("[step]"):
+                # Any "[step] w load|run ..." line starts its phase, not just
+                # progress lines: a run can sync before its first progress
+                # report, and that sync's times are relative to the run.
+                if len(fields) >= 4 and fields[2] in ("load", "run"):
+                    enter_phase(fields[2])
                 if fields[3]=="progress":
                     process_elapsed(fields[2], fields[4], fields[6])
 
+                # "[step] w run sync start|end <ms> ms <i> ops",
+                # "[step] w sync start|end <ms> ms <n> ops" (sync at end of run),
+                # "[step] w load sync <ms> ms" ... "[step] w load end <ms> ms"
+                edge = None
+                sync_op = cur_op
+                if len(fields) >= 8 and fields[2:4] == ["run", "sync"]:
+                    edge, ms_text = fields[4], fields[5]
+                    sync_op = phase_op_base + int(fields[7])
+                elif len(fields) >= 7 and fields[2] == "sync":
+                    edge, ms_text = fields[3], fields[4]
+                    sync_op = phase_op_base + int(fields[6])
+                elif len(fields) >= 5 and fields[2] == "load" and fields[3] in ("sync", "end"):
+                    edge, ms_text = ("start" if fields[3] == "sync" else "end"), fields[4]
+                if edge == "start":
+                    self.syncs.append(SyncInterval(cur_phase, phase_t_base + int(ms_text)/1000.0,
+                        sync_op, len(self.counter_log)))
+                elif edge == "end" and len(self.syncs) > 0 and self.syncs[-1].end_t is None:
+                    self.syncs[-1].end_t = phase_t_base + int(ms_text)/1000.0
+                    self.syncs[-1].end_sample = len(self.counter_log)
+
 #            if line.startswith("veribetrkv [op] sync") or line.startswith("rocksdb [op] sync"):
 #                cur_op = int(fields[4])
 #                self.operation[cur_op] = cur_op
@@ -257,6 +334,8 @@ class Experiment:
                 self.read_bytes[cur_op] = int(fields[4])
                 self.write_count[cur_op] = int(fields[6])
                 self.write_bytes[cur_op] = int(fields[8])
+                self.counter_log.append(("read_bytes", int(fields[4])))
+                self.counter_log.append(("write_bytes", int(fields[8])))
 
             if line.startswith("stat-accounting "):
                 self.utime[cur_op] = int(fields[2])
@@ -267,6 +346,8 @@ class Experiment:
             if line.startswith("proc-io"):
                 self.procio_read_bytes[cur_op] = int(fields[2])
                 self.procio_write_bytes[cur_op] = int(fields[4])
+                self.counter_log.append(("procio_read_bytes", int(fields[2])))
+                self.counter_log.append(("procio_write_bytes", int(fields[4])))
 
             if line.startswith("cgroups-memory.usage_in_bytes"):
                 self.cgroups_memory_usage_bytes[cur_op] = int(fields[1])
@@ -304,6 +385,7 @@ class Experiment:
                 if accum_key not in self.accum:
                     self.accum[accum_key] = Trace(accum_key, "unk")
                 self.accum[accum_key][cur_op] = int(value)
+                self.counter_log.append(("cache:" + accum_key, int(value)))
 
             if line.startswith("rocks_io_model"):
                 self.rocks_io_reads[cur_op] = int(fields[6])
@@ -319,7 +401,33 @@ class Experiment:
 
             if line.startswith("io-latency"):
                 ptr = {"read":self.iolatency_read, "write":self.iolatency_write}[fields[1]]
-                ptr[cur_op] = CDF(fields[2:])
+                cdf = CDF(fields[2:])
+                ptr[cur_op] = cdf
+                self.iolatency_hist[fields[1]][cur_op] = LatencyHistogram.from_cdf(cdf, "cycles")
+
+            if line.startswith("latency_interval "):
+                op_type = fields[1]
+                if op_type not in self.op_latency:
+                    self.op_latency[op_type] = HistogramTimeline(op_type + "-latency", "ns")
+                hist = from_sparse(fields[2:], "ns")
+                if cur_op in self.op_latency[op_type].rows:
+                    hist = hist + self.op_latency[op_type][cur_op]
+                self.op_latency[op_type][cur_op] = hist
+
+            if len(fields) == 6 and fields[1] == "latency_ccdf" and fields[0] != "--":
+                # rows gathered here; converted to histograms after parsing
+                key = (fields[0], fields[2])
+                self.op_latency_final.setdefault(key, []).append(
+                    (float(fields[3]), float(fields[4]), int(fields[5])))
+
+            if len(fields) == 5 and fields[1] == "latency_summary":
+                key = (fields[0], fields[2])
+                self.op_latency_summary.setdefault(key, []).append(
+                    (float(fields[3]), float(fields[4])))
+
+            if line.startswith("metadata ") and len(fields) >= 3:
+                # multi-valued keys (e.g. "metadata workload ...") keep the first
+                self.metadata.setdefault(fields[1], " ".join(fields[2:]))
 
             if line.startswith("ioaccounting-slow"):
                 self.slow_thresh[cur_op] = int(fields[2])
@@ -328,3 +436,4 @@ class Experiment:
 
             if line.startswith("writebackStalls"):
                 self.writeback_stalls[cur_op] = int(fields[1])
+                self.counter_log.append(("writeback_stalls", int(fields[1])))
@@ -12,11 +12,20 @@ import bisect
 from parser import Experiment
 from PlotHelper import *
 from TimeSeries import *
+from blktrace import load_blkio
+from stalls import StallAnalysis, format_stall_table
 
 output_filename = "compare.png"
 
 def plot_perf_compare(experiments):
-    plotHelper = PlotHelper(4, scale=2)
+    have_blkio = any([load_blkio(exp) is not None for exp in experiments])
+    have_iolatency = any([not exp.iolatency_read.empty() for exp in experiments])
+    op_latency_types = opLatencyTypes(experiments)
+    for exp in experiments:
+        exp.stalls = StallAnalysis(exp)
+    have_stalls = any([len(exp.stalls.stalls) > 0 for exp in experiments])
+    numPlots = 4 + 2*have_blkio + 2*have_iolatency + 2*len(op_latency_types) + 2*have_stalls
+    plotHelper = PlotHelper(numPlots, scale=2, columns=1)
 
     try: plotThroughput(plotHelper.nextAxis(depth=2), experiments)
     except: raise
@@ -24,6 +33,23 @@ def plot_perf_compare(experiments):
     try: plotGrandUnifiedMemory(plotHelper.nextAxis(depth=2), experiments)
     except: raise
 
+    if have_blkio:
+        try: plotBlkIo(plotHelper.nextAxis(depth=2), experiments)
+        except: raise
+
+    if have_iolatency:
+        try: plotIoLatencyTails(plotHelper.nextAxis(depth=2), experiments)
+        except: raise
+
+    for op_type in op_latency_types:
+        try: plotOpLatencyTails(plotHelper.nextAxis(depth=2), experiments, op_type)
+        except: raise
+
+    if have_stalls:
+        try: plotStalls(plotHelper.nextAxis(depth=2), experiments)
+        except: raise
+        print(format_stall_table([exp.stalls for exp in experiments]))
+
 #    try: plotSlowIos(plotHelper.nextAxis(depth=2), experiments)
 #    except: pass
 #
@@ -7,6 +7,7 @@
 import glob
 import numpy as np
 import matplotlib.pyplot as plt
+from logreader import open_log, LOG_SUFFIXES
 
 class Case:
     def __init__(self):
@@ -46,7 +47,7 @@ class Exp:
 
 def parse(datafile):
     exp = Exp()
-    for line in open(datafile).readlines():
+    for line in open_log(datafile):
         fields = line.split()
         if line.startswith("METADATA"):
             exp.metadata[fields[1]] = " ".join(fields[2:])
@@ -96,5 +97,8 @@ def plot(data):
 
     fig.savefig("data/btree-perf.pdf")
 
-data = parseSeveral(glob.glob("expresults/btree-tp/*.data"))
+datafiles = []
+for suffix in [""] + LOG_SUFFIXES:
+    datafiles += glob.glob("expresults/btree-tp/*.data" + suffix)
+data = parseSeveral(datafiles)
 plot(data)
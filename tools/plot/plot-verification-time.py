@@ -10,8 +10,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import glob
 import collections
+import functools
 import tarfile
 import sys
+import os
+from logreader import open_log
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import dafny_index
 
 #EXPERIMENT="expresults/veri_time_13-*"
 #EXPERIMENT="expresults/veri_time_september_*"
@@ -84,7 +89,7 @@ def parse_one(opener, pile):
 
     worker_name = None
     fn,fp = opener()
-    for line in fp.readlines():
+    for line in fp:
         if not type(line) == type(""):
             line = line.decode("utf-8")
         if line.startswith("Parsing"):
@@ -113,7 +118,7 @@ def parse_all():
         # Load a glob out of the filesystem for interactive experimenting
         resultsfiles = glob.glob(EXPERIMENT)
         def opener(fn):
-            return lambda: (fn,open(fn))
+            return lambda: (fn,open_log(fn))
         openers = [(fn,opener(fn)) for fn in resultsfiles]
     else:
         # Load from a tarball for git recorded raw data.
@@ -179,20 +184,12 @@ class Declaration:
     def is_repr(self):
         return len(self.repr)>0
 
+@functools.lru_cache(maxsize=None)
 def parse_dfy_for_reprness(source_filename):
     table = {}
-    current_symbol = None
-    for line in open(source_filename).readlines():
-        mo = re.compile("(method|lemma|function|predicate)[^\(]*\s(\S*)\(").search(line)
-        if mo!=None:
-            decl_type = mo.groups()[0]
-            current_symbol = mo.groups()[1]
-            table[current_symbol] = Declaration(line, decl_type)
-
-        mo = re.compile("^\s*(modifies|reads)").search(line)
-        if mo!=None:
-            repr_verb = mo.groups()[0]
-            table[current_symbol].repr.add(repr_verb)
+    for decl in dafny_index.load(source_filename).find(kinds=dafny_index.CALLABLE_KINDS):
+        table[decl.name] = Declaration(decl.line, decl.kind.split()[0])
+        table[decl.name].repr.update(decl.clauses)
     return table
 
 def get_declaration(source_filename, symbol):
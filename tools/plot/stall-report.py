@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Usage: stall-report.py nick=path.data [nick=path.data...] [output=stalls.png]
+# Prints every sync/writeback stall with the IO and cache activity during it,
+# plus per-experiment totals, and plots the stall timeline.
+
+import sys
+from parser import Experiment
+from PlotHelper import *
+from stalls import StallAnalysis, format_stall_table
+
+output_filename = "stalls.png"
+experiments = []
+for arg in sys.argv[1:]:
+    nick,fn = arg.split("=")
+    if nick=="output":
+        output_filename = fn
+    else:
+        try:
+            experiments.append(Experiment(fn, nick))
+        except (ValueError,FileNotFoundError):
+            print("Can't parse %s; skipping" % nick)
+
+for exp in experiments:
+    exp.stalls = StallAnalysis(exp)
+print(format_stall_table([exp.stalls for exp in experiments]))
+
+plotHelper = PlotHelper(2, scale=2, columns=1)
+plotThroughput(plotHelper.nextAxis(), experiments)
+plotStalls(plotHelper.nextAxis(), experiments)
+plotHelper.save(output_filename)
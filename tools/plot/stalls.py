@@ -0,0 +1,200 @@
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Stall attribution: where did the run stop making progress, for how long,
+# what did it cost, and what were the disk and cache doing meanwhile?
+#
+# Two kinds of stall are extracted from a parsed Experiment:
+#   sync       the "[step] ... sync start/end" intervals; no ops complete
+#              during one, since YcsbMain syncs inline.
+#   writeback  report intervals in which the writebackStalls counter grew,
+#              coalesced into episodes. Their resolution is the reporting
+#              interval, so durations are upper bounds.
+
+import bisect
+import numpy as np
+
+# Seconds of history used to estimate the throughput a stall interrupted.
+BASELINE_WINDOW_SEC = 10.0
+
+class Stall:
+    def __init__(self, kind, start_t, end_t, op_start, op_end):
+        self.kind = kind
+        self.start_t = start_t
+        self.end_t = end_t
+        self.op_start = op_start
+        self.op_end = op_end
+        self.ops_lost = 0
+        self.deltas = {}    # counter name -> change across the stall
+
+    def duration(self):
+        return self.end_t - self.start_t
+
+class OpClock:
+    """Converts between elapsed time and op number for one experiment."""
+    def __init__(self, exp):
+        pairs = [(exp.elapsed[op], op) for op in exp.sortedOpns]
+        pairs = [(t, op) for t, op in pairs if t is not None]
+        pairs.sort()
+        self.ts = np.array([t for t, op in pairs], dtype=np.float64)
+        self.ops = np.array([op for t, op in pairs], dtype=np.float64)
+
+    def op_at(self, t):
+        return float(np.interp(t, self.ts, self.ops))
+
+    def t_at(self, op):
+        return float(np.interp(op, self.ops, self.ts))
+
+    def rate_before(self, t, window=BASELINE_WINDOW_SEC):
+        """ops/sec over the window ending at t."""
+        if len(self.ts) < 2:
+            return 0.0
+        t0 = max(t - window, self.ts[0])
+        if t <= t0:
+            return 0.0
+        return (self.op_at(t) - self.op_at(t0)) / (t - t0)
+
+class CounterSamples:
+    """Experiment.counter_log indexed by counter name."""
+    def __init__(self, counter_log):
+        self.index = {}
+        for pos, (name, value) in enumerate(counter_log):
+            positions, values = self.index.setdefault(name, ([], []))
+            positions.append(pos)
+            values.append(value)
+
+    def names(self):
+        return self.index.keys()
+
+    def last_before(self, name, pos):
+        positions, values = self.index[name]
+        i = bisect.bisect_left(positions, pos)
+        return values[i - 1] if i > 0 else None
+
+    def first_at_or_after(self, name, pos):
+        positions, values = self.index[name]
+        i = bisect.bisect_left(positions, pos)
+        return values[i] if i < len(values) else None
+
+class StallAnalysis:
+    def __init__(self, exp):
+        self.exp = exp
+        self.clock = OpClock(exp)
+        self.samples = CounterSamples(exp.counter_log)
+        self.stalls = self.sync_stalls() + self.writeback_stalls()
+        self.stalls.sort(key=lambda s: s.start_t)
+
+    def sync_stalls(self):
+        stalls = []
+        for sync in self.exp.syncs:
+            stall = Stall("sync", sync.start_t, sync.end_t, sync.op, sync.op)
+            stall.ops_lost = self.clock.rate_before(sync.start_t) * stall.duration()
+            for name in self.samples.names():
+                before = self.samples.last_before(name, sync.start_sample)
+                after = self.samples.first_at_or_after(name, sync.end_sample)
+                if after is None:
+                    after = self.samples.last_before(name, sync.end_sample)
+                if before is not None and after is not None:
+                    stall.deltas[name] = after - before
+            stalls.append(stall)
+        return stalls
+
+    def op_traces(self):
+        exp = self.exp
+        traces = {
+            "read_bytes": exp.read_bytes,
+            "write_bytes": exp.write_bytes,
+            "procio_read_bytes": exp.procio_read_bytes,
+            "procio_write_bytes": exp.procio_write_bytes,
+            "writeback_stalls": exp.writeback_stalls,
+        }
+        for key, trace in exp.accum.items():
+            traces["cache:" + key] = trace
+        return traces
+
+    def writeback_stalls(self):
+        trace = self.exp.writeback_stalls
+        ops = trace.sortedKeys()
+        episodes = []
+        start = None
+        for prev_op, op in zip(ops, ops[1:]):
+            if trace.data[op] > trace.data[prev_op]:
+                if start is None:
+                    start = prev_op
+                end = op
+            elif start is not None:
+                episodes.append((start, end))
+                start = None
+        if start is not None:
+            episodes.append((start, end))
+
+        traces = self.op_traces()
+        stalls = []
+        for op_start, op_end in episodes:
+            t_start = self.clock.t_at(op_start)
+            t_end = self.clock.t_at(op_end)
+            stall = Stall("writeback", t_start, t_end, op_start, op_end)
+            expected = self.clock.rate_before(t_start) * stall.duration()
+            stall.ops_lost = max(0.0, expected - (op_end - op_start))
+            for name, tr in traces.items():
+                before, after = tr[op_start], tr[op_end]
+                if before is not None and after is not None:
+                    stall.deltas[name] = after - before
+            stalls.append(stall)
+        return stalls
+
+    def of_kind(self, kind):
+        return [s for s in self.stalls if s.kind == kind]
+
+    def summary(self):
+        """kind -> dict of aggregate figures"""
+        result = {}
+        for kind in ("sync", "writeback"):
+            stalls = self.of_kind(kind)
+            durations = np.array([s.duration() for s in stalls])
+            result[kind] = {
+                "count": len(stalls),
+                "total_sec": durations.sum() if len(stalls) else 0.0,
+                "max_sec": durations.max() if len(stalls) else 0.0,
+                "p50_sec": np.median(durations) if len(stalls) else 0.0,
+                "ops_lost": sum(s.ops_lost for s in stalls),
+                "write_bytes": sum(s.deltas.get("write_bytes", 0) for s in stalls),
+            }
+        return result
+
+def cache_counter_names(analyses):
+    names = set()
+    for analysis in analyses:
+        for stall in analysis.stalls:
+            names |= set(n for n in stall.deltas if n.startswith("cache:"))
+    return sorted(names)
+
+def format_stall_table(analyses):
+    """Text table: one row per stall across all experiments, then a summary
+    row per experiment and kind."""
+    cache_names = cache_counter_names(analyses)
+    MiB = float(1<<20)
+    header = ["exp", "kind", "start_s", "dur_s", "op", "ops_lost", "rd_MiB", "wr_MiB", "pio_wr_MiB"] + [
+        "d_" + n[len("cache:"):] for n in cache_names]
+    rows = [header]
+    for analysis in analyses:
+        nick = analysis.exp.nickname
+        for s in analysis.stalls:
+            def mib(name):
+                return "%.1f" % (s.deltas[name]/MiB) if name in s.deltas else "-"
+            rows.append([nick, s.kind, "%.1f" % s.start_t, "%.2f" % s.duration(),
+                "%d" % s.op_start, "%d" % s.ops_lost,
+                mib("read_bytes"), mib("write_bytes"), mib("procio_write_bytes")] + [
+                ("%d" % s.deltas[n]) if n in s.deltas else "-" for n in cache_names])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(cell.rjust(w) for cell, w in zip(row, widths)) for row in rows]
+
+    lines.append("")
+    lines.append("%-20s %-10s %6s %9s %8s %8s %12s %10s" % (
+        "exp", "kind", "count", "total_s", "max_s", "p50_s", "ops_lost", "wr_MiB"))
+    for analysis in analyses:
+        for kind, agg in analysis.summary().items():
+            lines.append("%-20s %-10s %6d %9.1f %8.2f %8.2f %12d %10.1f" % (
+                analysis.exp.nickname, kind, agg["count"], agg["total_sec"], agg["max_sec"],
+                agg["p50_sec"], agg["ops_lost"], agg["write_bytes"]/MiB))
+    return "\n".join(lines)
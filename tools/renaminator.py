@@ -6,18 +6,20 @@
 # Automation for moving dfy files among directories, cleaning up include references.
 
 import os
+import re
 import subprocess
 
 EXCLUDED_DIRS = set([".dafny", "build"])
 
+INCLUDE_RE = re.compile(r'^\s*include\s+"([^"]+)"')
+
 class Renaminator:
     def __init__(self):
         self.catalog()
-        # Apply the include path fixes first, since they're expressed relative
-        # to the source path locations.
-        self.mkdirCmds = []
-        self.fixCmds = []
-        self.gitAddCmds = []    # some of these will be pre-move referrers, so do them first
+        # Include path fixes are computed against the pre-move locations,
+        # and applied before anything moves.
+        self.mkdirs = []
+        self.edits = {}         # referrer -> [(old include, new include)]
         self.gitCmds = []
 
     def catalog(self):
@@ -37,9 +39,27 @@ class Renaminator:
                 fullpath = os.path.join(root, file)
                 paths.append(fullpath)
         self.paths = paths
+        self.byBasename = {}
+        for path in paths:
+            self.byBasename.setdefault(os.path.basename(path), []).append(path)
+        self.indexIncludes()
+
+    def indexIncludes(self):
+        """Read every file once; referrers maps each included file (as a
+        normalized path) to the (referrer, include string) pairs naming it."""
+        self.referrers = {}
+        for path in self.paths:
+            referrerDir = os.path.dirname(path)
+            for line in open(path).readlines():
+                mo = INCLUDE_RE.match(line)
+                if mo is None:
+                    continue
+                target = os.path.normpath(os.path.join(referrerDir, mo.group(1)))
+                self.referrers.setdefault(target, []).append((path, mo.group(1)))
 
     def findSourceDir(self, filename):
-        matchingSourcePaths = [path for path in self.paths if path.endswith("/"+filename)]
+        matchingSourcePaths = self.byBasename.get(os.path.basename(filename), [])
+        matchingSourcePaths = [path for path in matchingSourcePaths if path.endswith("/"+filename)]
         if len(matchingSourcePaths) == 0:
             raise Exception("No path matches %s" % filename)
         if len(matchingSourcePaths) > 1:
@@ -47,29 +67,22 @@ class Renaminator:
         path = matchingSourcePaths[0]
         return path[:-(len(filename)+1)]
 
-    def containsLine(self, filepath, testString):
-        contents = open(filepath).read()
-        return testString in contents
-
-    def fixReferrer(self, referrer, sourceDir, sourceFilename, destDir, destFilename):
-        referrerPath = os.path.split(referrer)[0]
-        sourceRelative = os.path.relpath(os.path.join(sourceDir, sourceFilename), referrerPath)
-        destRelative = os.path.relpath(os.path.join(destDir, destFilename), referrerPath)
-        expectInclude = 'include "%s"' % sourceRelative
-        newInclude = 'include "%s"' % destRelative
-        if self.containsLine(referrer, expectInclude):
-            self.fixCmds.append(["sed", "-i", "/include/s#%s#%s#" % (expectInclude, newInclude), referrer])
-            self.gitAddCmds.append(["git", "add", referrer])
+    def fixReferrers(self, sourceDir, sourceFilename, destDir, destFilename):
+        target = os.path.normpath(os.path.join(sourceDir, sourceFilename))
+        for referrer, included in self.referrers.get(target, []):
+            referrerPath = os.path.split(referrer)[0]
+            destRelative = os.path.relpath(os.path.join(destDir, destFilename), referrerPath)
+            self.edits.setdefault(referrer, []).append(
+                ('include "%s"' % included, 'include "%s"' % destRelative))
 
     def relocate(self, filename, destDir):
-        self.mkdirCmds.append(["mkdir", destDir])
+        self.mkdirs.append(destDir)
         sourceDir = self.findSourceDir(filename)
         sourceName = os.path.join(sourceDir, filename)
         destName = os.path.join(destDir, filename)
         self.gitCmds.append(["git", "mv", sourceName, destName])
 
-        for referrer in self.paths:
-            self.fixReferrer(referrer, sourceDir, filename, destDir, filename)
+        self.fixReferrers(sourceDir, filename, destDir, filename)
 
     def renameInPlace(self, sourceName, destName):
         sourceDir = self.findSourceDir(sourceName)
@@ -77,13 +90,35 @@ class Renaminator:
         destPath = os.path.join(sourceDir, destName)
         self.gitCmds.append(["git", "mv", sourcePath, destPath])
 
-        for referrer in self.paths:
-            self.fixReferrer(referrer, sourceDir, sourceName, sourceDir, destName)
+        self.fixReferrers(sourceDir, sourceName, sourceDir, destName)
         # print a suggested module renaming command
         print("sed -i 's/\<%s\>/%s/g' *.dfy" % (sourceName.replace(".i.dfy", ""), destName.replace(".i.dfy", "")))
 
+    def rewrite(self, referrer, edits):
+        # newline="": leave CRLF files CRLF
+        lines = open(referrer, newline="").readlines()
+        for i, line in enumerate(lines):
+            if INCLUDE_RE.match(line) is None:
+                continue
+            for old, new in edits:
+                if old in line:
+                    lines[i] = line.replace(old, new, 1)
+                    break
+        with open(referrer, "w", newline="") as fp:
+            fp.writelines(lines)
+
     def enact(self):
-        for cmd in self.fixCmds + self.mkdirCmds + self.gitAddCmds + self.gitCmds:
+        for referrer, edits in sorted(self.edits.items()):
+            print("fix includes in %s" % referrer)
+            self.rewrite(referrer, edits)
+        for destDir in self.mkdirs:
+            os.makedirs(destDir, exist_ok=True)
+        # some referrers are pre-move paths, so stage them before moving
+        if self.edits:
+            cmd = ["git", "add"] + sorted(self.edits)
+            print(cmd)
+            subprocess.call(cmd)
+        for cmd in self.gitCmds:
             print(cmd)
             subprocess.call(cmd)
 
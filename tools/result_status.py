@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Copyright 2018-2021 VMware, Inc., Microsoft Inc., Carnegie Mellon University, ETH Zurich, and University of Washington
+# SPDX-License-Identifier: BSD-2-Clause
+
+# Decides whether an experiment output file holds a finished run, so a
+# crashed or interrupted suite can be resumed by rerunning only the variants
+# that don't. Used by tools/aws/automation.py on the launching machine, by
+# run-veri-config-experiment.py on the worker, and as a command:
+#
+#   tools/result_status.py [--kind ycsb|dafny] <output>...
+#
+# prints "<status> <output>" per file, status being complete, incomplete
+# or missing.
+
+import os
+import sys
+import re
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot"))
+from logreader import open_log, resolve_log_path
+
+COMPLETE = "complete"
+INCOMPLETE = "incomplete"
+MISSING = "missing"
+
+def ycsb_complete(lines):
+    """A YcsbMain log is finished when its last [step] line is the run
+    throughput of the final workload; a run killed by the time budget or a
+    crash stops somewhere before that."""
+    last_step = None
+    for line in lines:
+        if line.startswith("[step]"):
+            last_step = line
+    return last_step is not None and re.search(r" run throughput \S+ ops/sec", last_step) is not None
+
+def dafny_complete(lines):
+    """A verification log is finished once dafny prints its summary."""
+    return any(line.startswith("Dafny program verifier finished") for line in lines)
+
+CHECKS = {
+    "ycsb": ycsb_complete,
+    "dafny": dafny_complete,
+}
+
+def result_status(path, kind="ycsb"):
+    try:
+        resolve_log_path(path)
+    except FileNotFoundError:
+        return MISSING
+    try:
+        with open_log(path) as fp:
+            return COMPLETE if CHECKS[kind](fp) else INCOMPLETE
+    except (OSError, EOFError):
+        # e.g. a compressed log whose writer died mid-stream
+        return INCOMPLETE
+
+def main():
+    parser = argparse.ArgumentParser(description="Report which experiment outputs are complete.")
+    parser.add_argument("--kind", choices=sorted(CHECKS), default="ycsb")
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args()
+    for path in args.paths:
+        print("%s %s" % (result_status(path, args.kind), path))
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,11 @@ import subprocess
 import time
 import datetime
 import signal
+import hashlib
+import shutil
+from result_status import result_status, COMPLETE, MISSING
+from logreader import resolve_log_path
+from db_snapshots import SnapshotStore, fingerprint
 
 def actuallyprint(msg):
     print(msg)
@@ -26,12 +31,22 @@ def autoconfig(bucket_weight_bytes, cache_size_bytes):
     ("MaxCacheSizeUint64", str(cache_size_nodes)),
   ]
 
-def cgroup_defaults():
+# Packed runs (several experiments per worker) each get their own cgroup,
+# named after their slot.
+CGROUP_NAME = "VeribetrfsExp"
+
+def cgroup_for_slot(slot):
+  return CGROUP_NAME if slot == 0 else "%s-s%d" % (CGROUP_NAME, slot)
+
+def cgroup_defaults(cgroup=CGROUP_NAME):
   print("starting with default config...")
-  ret = os.system("./tools/configure-cgroups.sh")
+  if not os.path.exists("/sys/fs/cgroup/memory/" + cgroup):
+    ret = os.system("./tools/create-cgroups.sh " + cgroup)
+    assert ret == 0
+  ret = os.system("./tools/configure-cgroups.sh " + cgroup)
   assert ret == 0
 
-def set_mem_limit(limit):
+def set_mem_limit(limit, cgroup=CGROUP_NAME):
   if limit.endswith("gb"):
     val = int(float(limit[:-2]) * 1024*1024*1024)
     print("setting mem limit to " + str(val) + " bytes (" + limit + ")")
@@ -40,8 +55,9 @@ def set_mem_limit(limit):
     print("setting mem limit to " + str(val) + " bytes")
 
   val = int(val)
-  ret = os.system("echo " + str(val) + " > /sys/fs/cgroup/memory/VeribetrfsExp/memory.limit_in_bytes")
+  ret = os.system("echo " + str(val) + " > /sys/fs/cgroup/memory/" + cgroup + "/memory.limit_in_bytes")
   assert ret == 0
+  return val
 
 def clear_page_cache():
   os.system("sudo tools/setup-clear-os-page-cache-binary.sh")
@@ -55,7 +71,9 @@ def clear_page_cache():
   ret = os.system("tools/clear-os-page-cache")
   assert ret == 0
 
-def splice_value_into_bundle(name, value):
+def splice_into_bundle(name, make_body):
+  """Replace the one-line body of uint64 __default::<name>() in
+  build/Bundle.cpp with make_body(original body line)."""
   splice_successful = False
   with open("build/Bundle.cpp") as f:
     lineNum = 0
@@ -69,7 +87,7 @@ def splice_value_into_bundle(name, value):
         if c == 1:
           c = 2
         elif c == 2:
-          line = "    return (uint64)" + value + "; /*hi mom*/\n"
+          line = make_body(line)
           splice_successful = True
           #print("Splicing %s = %s at line %d" % (name, value, lineNum))
           c = 0
@@ -80,6 +98,92 @@ def splice_value_into_bundle(name, value):
   with open("build/Bundle.cpp","w") as f:
     f.write(cpp)
 
+def splice_value_into_bundle(name, value):
+  splice_into_bundle(name, lambda line: "    return (uint64)" + value + "; /*hi mom*/\n")
+
+# Constants read at startup (framework/Tunables.h) rather than spliced in:
+# their bodies are rewritten once to ask tunable_uint64, keeping the compiled
+# value as the default, and each run supplies its values as VERIBETRFS_<name>
+# environment variables. Sweeping them then reuses one (cached) binary.
+TUNABLE_CONSTANTS = [
+  "MaxCacheSizeUint64",
+  "MaxTotalBucketWeightUint64",
+  "DiskNumJournalBlocksUint64",
+]
+
+def splice_tunable_into_bundle(name):
+  def make_body(line):
+    expr = line.strip()
+    assert expr.startswith("return ") and expr.endswith(";"), line
+    expr = expr[len("return ") : -1]
+    return ("    static const uint64 value = tunable_uint64(\"%s\", (uint64)(%s));\n" % (name, expr)
+        + "    return value;\n")
+  splice_into_bundle(name, make_body)
+
+def tunable_env(tunable_updates):
+  return "".join("VERIBETRFS_%s=%s " % (name, value) for (name, value) in tunable_updates)
+
+# compress= option: streaming compressor command and the suffix it appends.
+# tools/plot/logreader.py reads any of these back transparently.
+LOG_COMPRESSORS = {
+  "gz":   (["gzip", "-c"], ".gz"),
+  "bz2":  (["bzip2", "-c"], ".bz2"),
+  "xz":   (["xz", "-T1", "-c"], ".xz"),
+  "zstd": (["zstd", "-q", "-c"], ".zst"),
+}
+
+# Built executables, keyed by everything that goes into them, so replicas and
+# variants differing only in runtime parameters skip the rebuild. Shared by
+# every checkout on the host (packed slots included).
+BUILD_CACHE_DIR = os.environ.get("VERIBETRFS_BUILD_CACHE", os.path.expanduser("~/veribetrfs-build-cache"))
+BUILD_CACHE_ENTRIES = 32
+
+def command_output(cmd):
+  return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+      stderr=subprocess.DEVNULL).stdout.decode("utf-8", errors="replace")
+
+class BuildCache:
+  def __init__(self, exe, make_options, value_updates):
+    self.key = None
+    if command_output("git status --porcelain --untracked-files=no").strip():
+      actuallyprint("BuildCache: uncommitted changes; not caching")
+      return
+    ident = "\n".join([
+      command_output("git rev-parse HEAD"),
+      command_output("git submodule status"),
+      command_output("git -C .dafny/dafny rev-parse HEAD"),
+      exe,
+      " ".join(make_options.split()),
+      # order matters: a later splice of the same name wins
+      repr(value_updates),
+    ])
+    self.key = hashlib.sha256(ident.encode("utf-8")).hexdigest()[:20]
+    self.entry = os.path.join(BUILD_CACHE_DIR, self.key)
+    self.path = os.path.join(self.entry, os.path.basename(exe))
+
+  def fetch(self, exe):
+    if self.key is None or not os.path.exists(self.path):
+      return False
+    os.makedirs(os.path.dirname(exe), exist_ok=True)
+    shutil.copy2(self.path, exe)
+    os.utime(self.entry)   # mark recently used
+    return True
+
+  def store(self, exe):
+    if self.key is None:
+      return
+    os.makedirs(self.entry, exist_ok=True)
+    tmp = "%s.tmp%d" % (self.path, os.getpid())
+    shutil.copy2(exe, tmp)
+    os.replace(tmp, self.path)  # atomic, in case a packed slot is reading
+    self.evict()
+
+  def evict(self):
+    entries = [os.path.join(BUILD_CACHE_DIR, e) for e in os.listdir(BUILD_CACHE_DIR)]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for stale in entries[BUILD_CACHE_ENTRIES:]:
+      shutil.rmtree(stale, ignore_errors=True)
+
 class Blktrace:
   def __init__(self):
     self.cleanall()
@@ -139,7 +243,14 @@ def main():
   kyoto = None
   time_budget_sec = 3600*24*365 # You get a year if you don't ask for a budget
 
-  fp = None
+  outpath = None
+  compress = None
+  resume = False
+  slot = 0        # which of a worker's packed experiment slots this is
+  cpus = "2"      # taskset cpu list
+  packed = False  # other experiments share this host
+  use_build_cache = True
+  snapshot = None # auto: restore the post-load db, creating it if need be
 
   for arg in sys.argv[1:]:
     if arg.startswith("ram="):
@@ -195,13 +306,47 @@ def main():
       cgroup_enabled = enabled=="True"
     elif arg.startswith("output="):
       outpath = arg.split("=")[1]
-      actuallyprint("outpath: %s" % outpath)
-      assert not os.path.exists(outpath)
-      fp = open(outpath, "w")
+    elif arg.startswith("slot="):
+      slot = int(arg[len("slot=") : ])
+    elif arg.startswith("cpus="):
+      cpus = arg[len("cpus=") : ]
+    elif arg == "packed":
+      packed = True
+    elif arg.startswith("snapshot="):
+      snapshot = arg[len("snapshot=") : ]
+      assert snapshot in ("auto", "refresh"), "snapshot must be auto or refresh"
+    elif arg == "nobuildcache":
+      use_build_cache = False
+    elif arg == "resume":
+      # Skip the run if outpath already holds a complete one; set aside a
+      # partial one and start over.
+      resume = True
+    elif arg.startswith("compress="):
+      compress = arg.split("=")[1]
+      assert compress in LOG_COMPRESSORS, "compress must be one of " + ",".join(LOG_COMPRESSORS)
     else:
       assert False, "unrecognized argument: " + arg
 
-  assert fp is not None
+  assert outpath is not None
+  log_path = outpath
+  if compress:
+    compressor_cmd, suffix = LOG_COMPRESSORS[compress]
+    log_path = outpath + suffix
+  actuallyprint("outpath: %s" % log_path)
+  if resume:
+    status = result_status(outpath)
+    if status == COMPLETE:
+      actuallyprint("resume: %s is already complete" % resolve_log_path(outpath))
+      return
+    if status != MISSING:
+      stale = resolve_log_path(outpath)
+      actuallyprint("resume: moving incomplete %s aside" % stale)
+      os.rename(stale, stale + ".incomplete")
+      if os.path.exists(outpath + ".trace..bz2"):
+        os.remove(outpath + ".trace..bz2")
+  assert not os.path.exists(outpath)
+  assert not os.path.exists(log_path)
+  fp = open(log_path, "w")
   assert git_branch is not None
   
   assert veri_cache_size_in_bytes is None or veri_cache_size_in_nodes is None
@@ -222,6 +367,8 @@ def main():
   if use_filters:
       assert rocks
 
+  assert snapshot is None or from_archive is None, "snapshot= and fromArchive= conflict"
+
   actuallyprint("Experiment time budget %s" % (datetime.timedelta(seconds=time_budget_sec)))
   actuallyprint("metadata time_budget %s seconds" % time_budget_sec)
 
@@ -252,6 +399,8 @@ def main():
     datadir = "/mnt/xvde/scratch"
   else:
     assert False
+  if slot > 0:
+    datadir = datadir + "-s%d" % slot
 
   print("Device type: " + device)
   print("Using " + datadir)
@@ -285,63 +434,132 @@ def main():
   if veri_o_direct == True:
       make_options = make_options + " WANT_O_DIRECT=true "
   
-  cgroup_defaults()
+  cgroup = cgroup_for_slot(slot)
+  cgroup_defaults(cgroup)
+  mem_limit_bytes = None
   if ram != None:
-    set_mem_limit(ram)
+    mem_limit_bytes = set_mem_limit(ram, cgroup)
 
   ret = os.system("rm -rf build/")
   assert ret == 0
 
   ret = os.system("./tools/clean-for-build.sh " + git_branch)
   assert ret == 0
-  
-  if veri:
-    print("Building Bundle.cpp...")
-    ret = os.system("make " + make_options + " build/Bundle.cpp > /dev/null 2> /dev/null")
-    assert ret == 0
 
-  for (name, value) in value_updates:
-    assert veri
-    print("setting " + name + " to " + value)
-    splice_value_into_bundle(name, value)
+  tunable_updates = [(name, value) for (name, value) in value_updates if name in TUNABLE_CONSTANTS]
+  spliced_updates = [(name, value) for (name, value) in value_updates if name not in TUNABLE_CONSTANTS]
+  # the tunable hooks are part of what gets built
+  build_ident = spliced_updates + [("tunable", name) for name in TUNABLE_CONSTANTS] if veri else spliced_updates
+  build_cache = BuildCache(exe, make_options, build_ident) if use_build_cache else None
+  if build_cache and build_cache.fetch(exe):
+    actuallyprint("Reusing cached %s (build %s)" % (exe, build_cache.key))
+  else:
+    if veri:
+      print("Building Bundle.cpp...")
+      ret = os.system("make " + make_options + " build/Bundle.cpp > /dev/null 2> /dev/null")
+      assert ret == 0
 
-  actuallyprint("Building executable...")
-  sys.stdout.flush()
-  #cmd = make_options + "make " + exe + " -j4 > /dev/null 2> /dev/null"
-  cmd = make_options + "make " + make_options + " " + exe
-  actuallyprint(cmd)
-  ret = os.system(cmd)
-  assert ret == 0
+    if veri:
+      for name in TUNABLE_CONSTANTS:
+        splice_tunable_into_bundle(name)
+
+    for (name, value) in spliced_updates:
+      assert veri
+      print("setting " + name + " to " + value)
+      splice_value_into_bundle(name, value)
+
+    actuallyprint("Building executable...")
+    sys.stdout.flush()
+    #cmd = make_options + "make " + exe + " -j4 > /dev/null 2> /dev/null"
+    cmd = make_options + "make " + make_options + " " + exe
+    actuallyprint(cmd)
+    ret = os.system(cmd)
+    assert ret == 0
+    if build_cache:
+      build_cache.store(exe)
+
+  if snapshot:
+    system = "veri" if veri else "rocks" if rocks else "berkeley" if berkeley else "kyoto"
+    load_spec = workload.split(",")[0]
+    snap_id, ident = fingerprint(system, subprocess.check_output(["git", "rev-parse", "HEAD"]).decode().strip(),
+        {"exe": exe, "make_options": " ".join(make_options.split()), "driver_options": driver_options.split(),
+         "value_updates": value_updates}, load_spec)
+    store = SnapshotStore()
+    restore_snapshot = snapshot == "auto" and store.exists(snap_id)
+  else:
+    restore_snapshot = False
 
   ret = os.system("rm -rf " + datadir)
   assert ret == 0
   ret = os.system("mkdir -p " + datadir)
   assert ret == 0
 
-  if from_archive:
+  if restore_snapshot:
+    actuallyprint("restoring snapshot %s" % snap_id)
+    store.restore(snap_id, loc)
+  elif from_archive:
     if rocks:
       os.system("cp -a " + from_archive + "/* " + datadir + "/")
     else:
       os.system("cp -a " + from_archive + " " + loc)
   elif veri:
       os.system("head -c 17179869184 /dev/zero > " + loc)
-      
-  clear_page_cache()
+
+  # CPUs we can use; the default is the one the old "taskset 4" mask chose.
+  # See https://linux.die.net/man/1/taskset
+  taskset_cmd = "taskset -c " + cpus + " "
+  cgroup_prefix = "cgexec -g memory:" + cgroup + " " if cgroup_enabled else ""
+  for (name, value) in tunable_updates:
+    assert veri
+    print("setting " + name + " to " + value + " at startup")
+  exe_prefix = tunable_env(tunable_updates) + taskset_cmd + cgroup_prefix + "time ./" + exe + " " + loc + " "
+
+  if snapshot:
+    if not restore_snapshot:
+      # Load only, into the fresh db at loc, then keep the result.
+      load_log = outpath + ".snapshot-load"
+      load_command = exe_prefix + driver_options + " " + load_spec + " > " + load_log
+      actuallyprint("creating snapshot %s: %s" % (snap_id, load_command))
+      ret = os.system(load_command)
+      assert ret == 0
+      with open(load_log) as f:
+        assert any(" load throughput " in line for line in f), "load phase didn't finish"
+      store.save(snap_id, ident, loc)
+    actuallyprint("snapshot %s" % snap_id)
+    driver_options += "--preloaded "
+
+  # Dropping the page cache or tracing the whole device would disturb (and
+  # be polluted by) the other experiments on a packed host.
+  if not packed:
+    clear_page_cache()
 
   os.system("iostat")
 
-  blktrace = Blktrace()
-  blktrace.start("/dev/xvde")   # alert jonh hack hardcoded blktrace device
+  if not packed:
+    blktrace = Blktrace()
+    blktrace.start("/dev/xvde")   # alert jonh hack hardcoded blktrace device
   
-  # bitmask indicating which CPUs we can use
-  # See https://linux.die.net/man/1/taskset
-  taskset_cmd = "taskset 4 "
-  cgroup_prefix = "cgexec -g memory:VeribetrfsExp " if cgroup_enabled else ""
-  command = taskset_cmd + cgroup_prefix + "time ./" + exe + " " + loc + " " + driver_options + " " + workload_cmd
+  command = exe_prefix + driver_options + " " + workload_cmd
   actuallyprint(command)
   sys.stdout.flush()
 
-  proc = subprocess.Popen(command, shell=True, preexec_fn=os.setsid, stdout=fp)
+  # Configuration the experiment itself can't report, at the head of its
+  # log (read by tools/plot/memory.py).
+  metadata = "".join("metadata %s %s\n" % (name, value) for (name, value) in value_updates)
+  if cgroup_enabled and mem_limit_bytes is not None:
+    metadata += "metadata cgroups-memory.limit_in_bytes %d\n" % mem_limit_bytes
+
+  if compress:
+    # Compress on the fly so the uncompressed log never touches the disk.
+    compressor = subprocess.Popen(compressor_cmd, stdin=subprocess.PIPE, stdout=fp)
+    exp_stdout = compressor.stdin
+    exp_stdout.write(metadata.encode("utf-8"))
+  else:
+    compressor = None
+    exp_stdout = fp
+    exp_stdout.write(metadata)
+  exp_stdout.flush()
+  proc = subprocess.Popen(command, shell=True, preexec_fn=os.setsid, stdout=exp_stdout)
   proc_grp_id = os.getpgid(proc.pid)
   actuallyprint("experiment pid %d pgid %d" % (proc.pid, proc_grp_id))
   try:
@@ -351,14 +569,22 @@ def main():
     proc.kill()
     ret = proc.wait(timeout = 10)
 
-  actuallyprint("main blktrace stop");
-  blktrace.stop()
-  actuallyprint("main blktrace stopped");
+  if compressor:
+    compressor.stdin.close()
+    assert compressor.wait() == 0
+  fp.close()
+
+  if not packed:
+    actuallyprint("main blktrace stop");
+    blktrace.stop()
+    actuallyprint("main blktrace stopped");
 
   assert ret == 0
   os.system("iostat")
-  actuallyprint("zip up trace")
-  os.system('blkparse -q -a issue -f"%S %n\n" -i xvde.blktrace.0 | bzip2 > '+outpath+'.trace..bz2')
+  if not packed:
+    actuallyprint("zip up trace")
+    # one issued request per line: time, rwbs, sector, nblocks (read by tools/plot/blktrace.py)
+    os.system('blkparse -q -a issue -f"%T.%09t %d %S %n\n" -i xvde.blktrace.0 | bzip2 > '+outpath+'.trace..bz2')
   actuallyprint("done")
 
 if __name__ == "__main__":
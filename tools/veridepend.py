@@ -60,7 +60,6 @@ class Veridepend:
                     # Corresponding recursive tree for synchk.
                     (".syntax", ".syntax"),
                     (".okay", ".okay"),
-                    (".lcreport", ".lcreport"),
 
                     # When we build X.o, we first want to build Y.cpp and Y.o.
                     # These aren't true dependencies, but they make the ordering
@@ -73,7 +72,6 @@ class Veridepend:
             # dependencies from this file to type parents
             output.append("%s: %s" % (targetName(iref, ".verified"), targetName(dep, ".verchk")))
             output.append("%s: %s" % (targetName(iref, ".syntax"), targetName(dep, ".synchk")))
-            output.append("%s: %s" % (targetName(iref, ".lcreport"), targetName(dep, ".lc")))
         # The dirDeps file depends on each target it describes.
         output.append("%s: %s" % (self.depFilename(), iref.normPath))
         return output
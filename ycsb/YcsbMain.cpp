@@ -2,6 +2,8 @@
 // SPDX-License-Identifier: BSD-2-Clause
 
 #include <cstdlib>
+#include <cstring>
+#include <cinttypes>
 
 #ifdef _YCSB_VERIBETRFS
 #include "Application.h"
@@ -31,19 +33,75 @@
 
 #include <chrono>
 #include <iostream>
+#include <thread>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
 
 using namespace std;
 using namespace chrono;
 
+// Latency histogram for one progress interval. Bucketed exactly like
+// tools/plot/latency.py (8 sub-buckets per power of two, values below 8 get
+// their own bucket) so the plot tools can add snapshots together directly.
+// The full-run HDRHist can't be reset, so intervals are tracked alongside it.
+class IntervalHist {
+  static const int SUB_BUCKET_BITS = 3;
+  static const int SUB_BUCKETS = 1 << SUB_BUCKET_BITS;
+  static const int NUM_BUCKETS = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS;
+  uint64_t counts[NUM_BUCKETS];
+  bool empty;
+
+  static int bucket(uint64_t value) {
+    if (value < SUB_BUCKETS) {
+      return (int) value;
+    }
+    int exp = 63 - __builtin_clzll(value);
+    uint64_t sub = value >> (exp - SUB_BUCKET_BITS);
+    return (exp - SUB_BUCKET_BITS + 1) * SUB_BUCKETS + (int) (sub - SUB_BUCKETS);
+  }
+
+public:
+  IntervalHist() { reset(); }
+
+  void reset() {
+    memset(counts, 0, sizeof(counts));
+    empty = true;
+  }
+
+  void add_value(uint64_t value) {
+    counts[bucket(value)]++;
+    empty = false;
+  }
+
+  // One sparse line per op type: "latency_interval <op> <bucket>:<count>..."
+  void print_and_reset(const string op) {
+    if (empty) {
+      return;
+    }
+    cout << "latency_interval " << op;
+    for (int i = 0; i < NUM_BUCKETS; i++) {
+      if (counts[i] != 0) {
+        cout << " " << i << ":" << counts[i];
+      }
+    }
+    cout << endl;
+    reset();
+  }
+};
+
 template< class C, class D1, class D2 >
 void record_duration(HDRHist &hist,
+                     IntervalHist &interval_hist,
                      const time_point<C,D1> &begin,
                      const time_point<C,D2> &end)
 {
   auto duration = duration_cast<nanoseconds>(end - begin);
   hist.add_value(duration.count());
+  interval_hist.add_value(duration.count());
 }
-  
+
 void print_summary(HDRHistQuantiles& summary, const string workload_name, const string op) {
   if (summary.samples() != 0) {
     cout << "--" << "\tlatency_ccdf\top\t" << "quantile" << "\t" << "upper_bound(ns)" << endl;
@@ -93,6 +151,9 @@ class YcsbExecution {
   map<ycsbc::Operation, unique_ptr<HDRHist>> latency_hist;
   HDRHist load_insert_latency_hist; // for inserts during load phase
   HDRHist sync_latency_hist; // does not include sync at end of load phase
+  map<ycsbc::Operation, IntervalHist> interval_hist; // since last progress line
+  IntervalHist load_insert_interval_hist;
+  IntervalHist sync_interval_hist;
   milliseconds load_duration_ms; // includes time to sync at end
   milliseconds run_duration_ms; // includes time to sync at end
 
@@ -217,12 +278,13 @@ public:
       clock_op_started = steady_clock::now();
         performInsert(true /* load */);
       clock_op_completed = steady_clock::now();
-      record_duration(load_insert_latency_hist, clock_op_started, clock_op_completed);
+      record_duration(load_insert_latency_hist, load_insert_interval_hist, clock_op_started, clock_op_completed);
 
       if (clock_next_report < clock_op_completed) {
         auto duration_ms = duration_cast<milliseconds>(
                         clock_op_completed - clock_start).count();
         cout << "[step] " << name << " load progress " << duration_ms << " ms " << i << " ops" << endl;
+        load_insert_interval_hist.print_and_reset("load");
         malloc_accounting_status();
         clock_next_report = clock_op_completed + progress_report_interval;
       }
@@ -235,6 +297,8 @@ public:
     auto clock_end = steady_clock::now();
     load_duration_ms = duration_cast<milliseconds>(clock_end - clock_start);
     cout << "[step] " << name << " load end " << load_duration_ms.count() << " ms" << endl;
+    // ops since the last progress line
+    load_insert_interval_hist.print_and_reset("load");
 
     auto load_duration_ns = duration_cast<nanoseconds>(clock_end - clock_start);
     assert(load_duration_ns.count() != 0);
@@ -306,12 +370,16 @@ public:
         exit(-1);
       }
       auto clock_op_completed = steady_clock::now();
-      record_duration(*latency_hist[next_operation], clock_op_started, clock_op_completed);
+      record_duration(*latency_hist[next_operation], interval_hist[next_operation], clock_op_started, clock_op_completed);
 
       if (next_display <= clock_op_completed) {
         malloc_accounting_display("periodic");
         auto elapsed_ms = duration_cast<milliseconds>(clock_op_completed - clock_start);
         cout << "[step] " << name << " run progress " << elapsed_ms.count() << " ms " <<  i << " ops" << endl;
+        for (auto op : YcsbOperations) {
+          interval_hist[op.first].print_and_reset(op.second);
+        }
+        sync_interval_hist.print_and_reset("sync");
         next_display += progress_report_interval;
       }
 
@@ -325,7 +393,7 @@ public:
         auto sync_completed = steady_clock::now();
         elapsed_ms = duration_cast<milliseconds>(sync_completed - clock_start);
         cout << "[step] " << name << " run sync end " << elapsed_ms.count() << " ms " << i << " ops" << endl;
-        record_duration(sync_latency_hist, sync_started, sync_completed);
+        record_duration(sync_latency_hist, sync_interval_hist, sync_started, sync_completed);
         have_done_insert_since_last_sync = false;
         next_sync = sync_completed + max_sync_interval;
         next_sync_ops = i + max_sync_interval_ops;
@@ -351,7 +419,7 @@ public:
       auto sync_completed = steady_clock::now();
       elapsed_ms = duration_cast<milliseconds>(sync_completed - clock_start);
       cout << "[step] " << name << " sync end " << elapsed_ms.count() << " ms " << num_ops << " ops" << endl;
-      record_duration(sync_latency_hist, sync_started, sync_completed);
+      record_duration(sync_latency_hist, sync_interval_hist, sync_started, sync_completed);
       have_done_insert_since_last_sync = false;
       next_sync = sync_completed + max_sync_interval;
       next_sync_ops = num_ops + max_sync_interval_ops;
@@ -360,6 +428,12 @@ public:
     auto clock_end = steady_clock::now();
     run_duration_ms = duration_cast<milliseconds>(clock_end - clock_start);
 
+    // ops and syncs since the last progress line, including the final sync
+    for (auto op : YcsbOperations) {
+      interval_hist[op.first].print_and_reset(op.second);
+    }
+    sync_interval_hist.print_and_reset("sync");
+
     double run_duration_s = duration_cast<nanoseconds>(clock_end - clock_start).count() / 1000000000.0;
     double throughput = num_ops / run_duration_s;
     cout << "[step] " << name << " run throughput " << throughput << " ops/sec" << endl;
@@ -670,6 +744,22 @@ public:
 
 const string NopFacade::name = string("nop");
 
+// Measure the TSC rate against steady_clock so tools/plot can convert
+// cycle-denominated latencies without assuming a clock. 0 if unavailable.
+uint64_t measure_tsc_hz() {
+#if defined(__x86_64__) || defined(__i386__)
+  auto clock_start = steady_clock::now();
+  uint64_t tsc_start = __rdtsc();
+  this_thread::sleep_for(milliseconds(50));
+  uint64_t tsc_end = __rdtsc();
+  auto clock_end = steady_clock::now();
+  double elapsed_s = duration_cast<nanoseconds>(clock_end - clock_start).count() / 1000000000.0;
+  return (uint64_t) ((tsc_end - tsc_start) / elapsed_s);
+#else
+  return 0;
+#endif
+}
+
 void dump_metadata(const char* workload_filename, const char* database_filename) {
   FILE* fp;
   char space[1000];
@@ -685,6 +775,11 @@ void dump_metadata(const char* workload_filename, const char* database_filename)
   //   printf("metadata cgroups-memory.limit_in_bytes %s", line);
   // }
 
+  uint64_t tsc_hz = measure_tsc_hz();
+  if (tsc_hz != 0) {
+    printf("metadata tsc_hz %" PRIu64 "\n", tsc_hz);
+  }
+
   printf("metadata workload_filename %s", workload_filename);
   fp = fopen(workload_filename, "r");
   while (true) {